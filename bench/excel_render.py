@@ -0,0 +1,117 @@
+"""Compare the openpyxl estimate workbook with the direct XML renderer.
+
+Usage: python -m bench.excel_render [--items 9] [--seconds 3]
+
+Checks that both files hold the same sheets, cells, fonts, alignment and column widths, then reports
+workbooks per second, mean file size and peak Python heap per workbook for each renderer.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+from unittest import mock
+
+from openpyxl import load_workbook
+
+from bot.calc import SECTION_ORDER
+from bot.db import DEFAULT_CONFIG
+from bot.excel import build_estimate_xlsx, render_estimate_xlsx
+
+_NOW = dt.datetime(2024, 5, 1, 12, 30)
+
+
+def sample_items(count: int, area: float = 137.5) -> list[dict[str, Any]]:
+    items: list[dict[str, Any]] = []
+    pool = [(s, it) for s in (*SECTION_ORDER, "extras") for it in DEFAULT_CONFIG[s]]
+    for n in range(count):
+        section, it = pool[n % len(pool)]
+        title = f"{it['title']} <{n}> & Co"
+        items.append({"section": section, "id": it["id"], "title": title, "area": area, "price": it["price"]})
+    return items
+
+
+def sample_materials(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    from bot.calc import LineItem
+    from bot.materials import MaterialBook
+
+    line_items = [LineItem(it["section"], it["title"], it["area"], it["price"], str(it["id"])) for it in items]
+    return [m.as_dict() for m in MaterialBook(DEFAULT_CONFIG).bill(line_items)]
+
+
+def snapshot(path: Path) -> dict[str, Any]:
+    cells = {}
+    widths = {}
+    wb = load_workbook(path)
+    for ws in wb.worksheets:
+        for row in ws.iter_rows():
+            for cell in row:
+                if cell.value is not None:
+                    cells[f"{ws.title}!{cell.coordinate}"] = (cell.value, bool(cell.font.b), cell.alignment.horizontal)
+        for key, dim in ws.column_dimensions.items():
+            if dim.customWidth:
+                widths[f"{ws.title}!{key}"] = dim.width
+    return {"title": wb.sheetnames, "cells": cells, "widths": widths}
+
+
+def measure(name: str, render: Callable[[Path], Any], seconds: float, tmp: Path) -> None:
+    path = tmp / f"{name}.xlsx"
+    render(path)
+    tracemalloc.start()
+    render(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        render(path)
+        count += 1
+    elapsed = time.perf_counter() - started
+    print(f"{name:<10} {count / elapsed:>10.1f} {os.path.getsize(path) / 1024:>9.1f} {peak / 1024:>9.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=9)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    items = sample_items(args.items)
+    kwargs = dict(area=137.5, items=items, total=1_234_567.5, price_per_m2=8978.67, materials=sample_materials(items))
+
+    def openpyxl_render(path: Path) -> Any:
+        return build_estimate_xlsx(path=path, **kwargs)
+
+    def direct_render(path: Path) -> Any:
+        return render_estimate_xlsx(path=path, now=_NOW, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        with mock.patch("bot.excel.dt.datetime") as fake:
+            fake.now.return_value = _NOW
+            openpyxl_render(tmp / "a.xlsx")
+        direct_render(tmp / "b.xlsx")
+        a, b = snapshot(tmp / "a.xlsx"), snapshot(tmp / "b.xlsx")
+        if a != b:
+            for key in ("title", "widths"):
+                if a[key] != b[key]:
+                    print(f"{key}: {a[key]} != {b[key]}")
+            for ref in sorted(set(a["cells"]) | set(b["cells"])):
+                if a["cells"].get(ref) != b["cells"].get(ref):
+                    print(f"{ref}: {a['cells'].get(ref)} != {b['cells'].get(ref)}")
+            raise SystemExit("renderers disagree")
+        print(f"content identical: {len(a['cells'])} cells, {len(a['widths'])} column widths")
+
+        print(f"{'renderer':<10} {'wb/s':>10} {'size KB':>9} {'peak KB':>9}")
+        measure("openpyxl", openpyxl_render, args.seconds, tmp)
+        measure("direct", direct_render, args.seconds, tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Event-loop cost of logging per update: synchronous JSON handler vs the queue handler, with and without sampling.
+
+Usage: python -m bench.logging_overhead [--users 200] [--rounds 3] [--write-delay 0.2] [--errors 0.05]
+
+Every mode feeds the same calculation flows through the full dispatcher against a stand-in Bot API.
+"loop CPU" is the CPU time of the event-loop thread per update, which excludes the listener thread
+and the SQLite worker threads; "wall" is elapsed time per update. Both are the best of --rounds runs
+and are also shown as overhead over logging switched off. --write-delay adds a sleep of that many
+milliseconds to every write, to model a slow disk or a blocked stderr pipe. --errors makes that share
+of updates raise inside a handler, to include traceback formatting.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Any, Callable
+
+from aiogram import Bot, F
+from aiogram.types import CallbackQuery, Update
+
+from bench.stub_api import StubSession
+from bench.tenants import user_flow
+from bot import logs
+from bot.db import init_db
+from bot.settings import Settings
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+        self.records = 0
+
+    def write(self, s: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        self.records += 1
+        return len(s)
+
+
+def _reset_root() -> None:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+
+def mode_off(stream: SlowStream) -> Callable[[], None]:
+    _reset_root()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger().addHandler(logging.NullHandler())
+    return lambda: None
+
+
+def mode_sync(stream: SlowStream) -> Callable[[], None]:
+    # What a plain StreamHandler does: filters, JSON encoding and the write all run on the event loop.
+    _reset_root()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logs.JsonFormatter())
+    handler.addFilter(logs.SamplingFilter(1.0))
+    handler.addFilter(logs.ContextFilter())
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    return lambda: None
+
+
+def mode_queue(sample_rate: float) -> Callable[[SlowStream], Callable[[], None]]:
+    def setup(stream: SlowStream) -> Callable[[], None]:
+        return logs.setup(level="INFO", sample_rate=sample_rate, stream=stream).stop
+
+    return setup
+
+
+async def run(args: argparse.Namespace) -> None:
+    from main import build_dispatcher
+
+    settings = Settings(
+        db_path=args.db,
+        throttle_user_rate=1e9,
+        throttle_user_burst=1e9,
+        throttle_chat_rate=1e9,
+        throttle_chat_burst=1e9,
+        throttle_debounce=0.0,
+        trace_sample_rate=0.0,
+    )
+    os.environ["DB_PATH"] = args.db
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    await init_db(args.db)
+
+    bot = Bot(token="1:bench", session=StubSession())
+    dp = build_dispatcher(settings)
+
+    @dp.callback_query(F.data == "bench:fail")
+    async def bench_fail(callback: CallbackQuery) -> None:
+        raise RuntimeError("simulated handler failure")
+
+    rng = random.Random(1)
+    next_id = [0]
+    flows = [user_flow(100_000 + u, rng, next_id) for u in range(args.users)]
+    for flow in flows:
+        for i, raw in enumerate(flow):
+            if "callback_query" in raw and rng.random() < args.errors:
+                flow[i] = {**raw, "callback_query": {**raw["callback_query"], "data": "bench:fail"}}
+
+    async def play(flow: list[dict[str, Any]]) -> None:
+        for raw in flow:
+            try:
+                await dp.feed_update(bot, Update.model_validate(raw, context={"bot": bot}))
+            except Exception:
+                pass
+
+    modes: list[tuple[str, Callable[[SlowStream], Callable[[], None]]]] = [
+        ("off", mode_off),
+        ("sync json", mode_sync),
+        ("queue json", mode_queue(1.0)),
+        ("queue json, 10% sampled", mode_queue(0.1)),
+    ]
+    total = sum(len(f) for f in flows)
+    mode_off(SlowStream(0.0))
+    await asyncio.gather(*(play(f) for f in flows))  # warm-up: caches, FSM sessions, imports
+
+    print(f"updates per round: {total}  write delay: {args.write_delay} ms  failing updates: {args.errors:.0%}")
+    print(f"{'mode':<26} {'loop CPU µs':>12} {'overhead':>9} {'wall µs':>9} {'overhead':>9} {'records':>8}")
+    base_cpu = base_wall = 0.0
+    for name, setup in modes:
+        best_cpu = best_wall = float("inf")
+        records = 0
+        for _ in range(args.rounds):
+            stream = SlowStream(args.write_delay / 1000)
+            stop = setup(stream)
+            cpu_started, started = time.thread_time(), time.perf_counter()
+            await asyncio.gather(*(play(f) for f in flows))
+            cpu, wall = time.thread_time() - cpu_started, time.perf_counter() - started
+            stop()
+            best_cpu, best_wall = min(best_cpu, cpu / total * 1e6), min(best_wall, wall / total * 1e6)
+            records = stream.records
+        if name == "off":
+            base_cpu, base_wall = best_cpu, best_wall
+        print(
+            f"{name:<26} {best_cpu:>12.1f} {best_cpu - base_cpu:>+9.1f} "
+            f"{best_wall:>9.1f} {best_wall - base_wall:>+9.1f} {records:>8}"
+        )
+    _reset_root()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--write-delay", type=float, default=0.0, help="sleep per written record, ms")
+    parser.add_argument("--errors", type=float, default=0.0, help="share of updates that fail in a handler")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_logging.db"))
+    args = parser.parse_args()
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
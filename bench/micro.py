@@ -0,0 +1,209 @@
+"""Microbenchmarks for hot pure functions, with stored baselines and a regression gate.
+
+Usage:
+  python -m bench.micro                   run every case and compare with bench/baselines.json
+  python -m bench.micro -k kb_            only cases whose name contains "kb_"
+  python -m bench.micro --save            overwrite the stored baselines with this run
+  python -m bench.micro --check [--threshold 0.3]
+                                          exit with status 1 if any case is slower than its baseline
+                                          by more than the threshold (0.3 = 30%)
+
+Timings are divided by a fixed pure-Python calibration loop measured alongside each case, so
+baselines recorded on one Linux box stay comparable on another. Needs no network or bot token.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+BASELINES = Path(__file__).with_name("baselines.json")
+
+Case = tuple[str, Callable[[], Any]]
+
+
+def calibration_loop() -> int:
+    total = 0
+    table: dict[int, int] = {}
+    for i in range(2000):
+        table[i & 63] = table.get(i & 63, 0) + i
+        total += len(str(i))
+    return total + len(table)
+
+
+def synthetic_catalog(per_section: int, seed: int = 7) -> dict[str, Any]:
+    from bot.db import DEFAULT_CONFIG
+
+    rnd = random.Random(seed)
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    for section in ("foundation", "walls", "floors", "roof", "extras"):
+        items = []
+        for n in range(per_section):
+            item: dict[str, Any] = {
+                "id": f"{section[:2]}{n}",
+                "title": f"Позиция {section} №{n}",
+                "price": rnd.randint(300, 9000),
+                "enabled": rnd.random() > 0.1,
+                "order": rnd.randint(0, 1000),
+            }
+            if n % 5 == 0:
+                price = item["price"]
+                item["tiers"] = [{"from": 150.0, "price": price * 0.95}, {"from": 300.0, "price": price * 0.9}]
+            items.append(item)
+        config[section] = items
+    return config
+
+
+def build_cases(tmp: Path) -> list[Case]:
+    from bot.admin_keyboards import kb_admin_items
+    from bot.db import DEFAULT_CONFIG, get_config, init_db, set_config
+    from bot.excel import build_estimate_xlsx, render_estimate_xlsx
+    from bot.handlers.client import _drop_dependent
+    from bot.keyboards import kb_extras, kb_options
+    from bot.pricing import PriceBook
+    from bot.utils import fmt_lines, rub, safe_float
+
+    catalogs = {"default": DEFAULT_CONFIG, "2k": synthetic_catalog(2000)}
+    cases: list[Case] = []
+    for label, config in catalogs.items():
+        book = PriceBook(config)
+        walls = config["walls"]
+        extras = config["extras"]
+        selected = {str(x["id"]) for x in extras[::3]}
+        cases += [
+            (f"kb_options[{label}]", lambda w=walls, b=book: kb_options("walls", w, area=137.0, book=b)),
+            (f"kb_extras[{label}]", lambda e=extras, s=selected, b=book: kb_extras(e, s, area=137.0, book=b)),
+            (f"kb_admin_items[{label}]", lambda w=walls: kb_admin_items("walls", w)),
+        ]
+
+    lines = ["Площадь: 120 м²", "", "Итого: 1 226 400 ₽", "Цена за м²: 10 220 ₽", "", "Расчёт предварительный."]
+    picks = ("pile", "brick", "wood", "soft")
+    cases += [
+        ("rub", lambda: rub(1226400.4)),
+        ("safe_float[ok]", lambda: safe_float(" 1 234,5")),
+        ("safe_float[bad]", lambda: safe_float("сто двадцать")),
+        ("fmt_lines", lambda: fmt_lines(lines)),
+        ("_drop_dependent", lambda: _drop_dependent(picks, "walls")),
+    ]
+
+    loop = asyncio.new_event_loop()
+    for label, config in catalogs.items():
+        db_path = str(tmp / f"micro_{label}.db")
+        loop.run_until_complete(init_db(db_path))
+        loop.run_until_complete(set_config(db_path, config))
+        cases.append((f"get_config[{label}]", lambda p=db_path: loop.run_until_complete(get_config(p))))
+    default_db = str(tmp / "micro_default.db")
+    cases.append(("set_config[default]", lambda: loop.run_until_complete(set_config(default_db, DEFAULT_CONFIG))))
+
+    items = [
+        {"section": s, "id": str(it["id"]), "title": str(it["title"]), "area": 137.0, "price": float(it["price"])}
+        for s in ("foundation", "walls", "floors", "roof", "extras")
+        for it in DEFAULT_CONFIG[s][:2]
+    ]
+    xlsx = tmp / "micro.xlsx"
+    excel_kwargs = dict(path=xlsx, area=137.0, items=items, total=1_500_000.0, price_per_m2=10_948.9)
+    cases += [
+        ("build_estimate_xlsx", lambda: build_estimate_xlsx(**excel_kwargs)),
+        ("render_estimate_xlsx", lambda: render_estimate_xlsx(**excel_kwargs)),
+    ]
+    return cases
+
+
+def _batch_size(fn: Callable[[], Any], min_batch: float) -> int:
+    fn()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_batch:
+            return number
+        number = max(number * 2, int(number * min_batch * 1.2 / max(elapsed, 1e-9)))
+
+
+def _best(fn: Callable[[], Any], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - started) / number
+
+
+def measure(fn: Callable[[], Any], *, min_batch: float = 0.02, repeat: int = 7) -> tuple[float, float]:
+    # Case and calibration batches are interleaved, so a noisy neighbour or a clock change hits both alike.
+    # Returns the best ns per call for the case and for the calibration loop.
+    case_n = _batch_size(fn, min_batch)
+    cal_n = _batch_size(calibration_loop, min_batch)
+    case_best = cal_best = float("inf")
+    for _ in range(repeat):
+        cal_best = min(cal_best, _best(calibration_loop, cal_n))
+        case_best = min(case_best, _best(fn, case_n))
+    return case_best * 1e9, cal_best * 1e9
+
+
+def fmt_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} µs"
+    return f"{ns:.0f} ns"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", default="", help="substring filter for case names")
+    parser.add_argument("--save", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--baselines", type=Path, default=BASELINES)
+    args = parser.parse_args()
+    os.environ.setdefault("BOT_TOKEN", "1:micro")
+
+    stored: dict[str, Any] = {}
+    if args.baselines.exists():
+        stored = json.loads(args.baselines.read_text(encoding="utf-8")).get("cases", {})
+
+    print(f"{'case':<28} {'time':>11} {'ratio':>10} {'baseline':>10} {'change':>8}")
+    calibrations: list[float] = []
+
+    results: dict[str, dict[str, float]] = {}
+    regressions: list[str] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in build_cases(Path(tmp)):
+            if args.k and args.k not in name:
+                continue
+            ns, calibration = measure(fn)
+            calibrations.append(calibration)
+            ratio = ns / calibration
+            results[name] = {"ns": round(ns, 1), "ratio": round(ratio, 6)}
+            base = stored.get(name, {}).get("ratio")
+            change = ""
+            if base:
+                delta = ratio / base - 1
+                change = f"{delta:+.0%}"
+                if delta > args.threshold:
+                    regressions.append(name)
+                    change += " !"
+            print(f"{name:<28} {fmt_ns(ns):>11} {ratio:>10.4f} {base or 0:>10.4f} {change:>8}")
+
+    if args.save:
+        merged = {**stored, **results} if args.k else results
+        payload = {"calibration_ns": round(min(calibrations), 1), "python": sys.version.split()[0], "cases": merged}
+        args.baselines.write_text(json.dumps(payload, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"baselines written to {args.baselines}")
+
+    if args.check and regressions:
+        print(f"regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
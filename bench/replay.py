@@ -0,0 +1,159 @@
+"""Replay a recorded webhook stream through the dispatcher against a stand-in Bot API.
+
+Usage: python -m bench.replay updates.jsonl.gz [more files...] [--speed 1|N|0] [--profile out.prof]
+
+--speed 1 replays in real time, N replays N times faster, 0 feeds as fast as possible.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import cProfile
+import gzip
+import json
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from bench.stub_api import StubSession
+from bot.db import init_db
+from bot.polling import chat_key
+from bot.settings import Settings
+
+
+class HandlerTimer(BaseMiddleware):
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_obj = data.get("handler")
+            name = getattr(getattr(handler_obj, "callback", None), "__qualname__", "unknown")
+            self.samples[name].append(time.perf_counter() - started)
+
+
+def read_records(paths: list[str]) -> Iterator[tuple[float, dict[str, Any]]]:
+    for path in paths:
+        with open(path, "rb") as probe:
+            compressed = probe.read(2) == b"\x1f\x8b"
+        opener = gzip.open if compressed else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    yield float(rec["ts"]), rec["update"]
+
+
+def install_timer(dp: Dispatcher) -> HandlerTimer:
+    # Inner middlewares on the dispatcher are inherited by every included router.
+    timer = HandlerTimer()
+    for name, observer in dp.observers.items():
+        if name not in {"update", "error"}:
+            observer.middleware(timer)
+    return timer
+
+
+async def replay(args: argparse.Namespace) -> None:
+    from main import build_dispatcher
+
+    overrides: dict[str, Any] = {"db_path": args.db}
+    if args.no_throttle:
+        overrides.update(
+            throttle_user_rate=1e9,
+            throttle_user_burst=1e9,
+            throttle_chat_rate=1e9,
+            throttle_chat_burst=1e9,
+            throttle_debounce=0.0,
+        )
+    settings = Settings(**overrides)
+    os.environ["DB_PATH"] = args.db
+    await init_db(settings.db_path)
+
+    session = StubSession(latency=args.api_latency / 1000)
+    bot = Bot(token=settings.bot_token, session=session)
+    dp = build_dispatcher(settings)
+    timer = install_timer(dp)
+
+    records = list(read_records(args.files))
+    if not records:
+        print("no records")
+        return
+
+    # Updates of one chat are chained like in production so sped-up replays keep FSM order.
+    tails: dict[int, asyncio.Task] = {}
+
+    async def feed(update: Update, prev: asyncio.Task | None) -> None:
+        if prev is not None:
+            await asyncio.wait([prev])
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            print(f"update {update.update_id} failed: {type(e).__name__}: {e}")
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first_ts = records[0][0]
+    tasks = []
+    for ts, raw in records:
+        if args.speed > 0:
+            delay = started + (ts - first_ts) / args.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.model_validate(raw, context={"bot": bot})
+        key = chat_key(update)
+        tails[key] = asyncio.create_task(feed(update, tails.get(key)))
+        tasks.append(tails[key])
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    print(f"updates: {len(records)}  elapsed: {elapsed:.2f}s  rate: {len(records) / elapsed:.0f} upd/s")
+    print(f"{'handler':<40} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'total s':>8}")
+    for name, samples in sorted(timer.samples.items(), key=lambda x: -sum(x[1])):
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(
+            f"{name:<40} {len(samples):>7} {statistics.median(samples) * 1000:>8.2f} "
+            f"{p95 * 1000:>8.2f} {samples[-1] * 1000:>8.2f} {sum(samples):>8.2f}"
+        )
+    print("Bot API calls:", dict(session.calls))
+    if args.profile:
+        print(f"cProfile stats written to {args.profile} (open with snakeviz or flameprof)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency, ms")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "replay.db"))
+    parser.add_argument("--no-throttle", action="store_true")
+    parser.add_argument("--profile", default="")
+    args = parser.parse_args()
+    os.environ.setdefault("BOT_TOKEN", "1:replay")
+    asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Bytes per FSM session: legacy dict-based data vs the compact Session record.
+
+Usage: python -m bench.session_memory [--sessions 100000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tracemalloc
+from typing import Any, Callable
+
+from bot.calc import SECTION_ORDER, build_line_items, estimate_totals
+from bot.db import DEFAULT_CONFIG
+from bot.pricing import PriceBook
+from bot.session import Session, intern_id
+from bot.utils import fmt_lines, rub
+
+
+def _random_choice(rnd: random.Random, config: dict[str, Any]) -> tuple[float, list[str], list[str]]:
+    area = float(rnd.randint(40, 400))
+    picks = [str(rnd.choice(config[sec])["id"]) for sec in SECTION_ORDER]
+    extras = [str(x["id"]) for x in config["extras"] if rnd.random() < 0.5]
+    return area, picks, extras
+
+
+def legacy_session(config_json: str, area: float, picks: list[str], extras: list[str]) -> dict[str, Any]:
+    # Mirrors the old handlers: every request parsed the config afresh and copied full dicts into FSM data.
+    config = json.loads(config_json)
+    line_items = build_line_items(config, area, tuple(picks), tuple(extras), PriceBook(config))
+    items = [it.as_dict() for it in line_items]
+    total, price_per_m2 = estimate_totals(line_items, area)
+    result_text = fmt_lines(
+        [
+            f"Площадь: {int(area)} м²",
+            f"Итого: {rub(total)}",
+            f"Цена за м²: {rub(price_per_m2)}",
+            "",
+            "Расчёт является предварительным и не является публичной офертой.",
+        ]
+    )
+    return {
+        "ui_message_id": 1000,
+        "area": area,
+        "items": items,
+        "extras": set(extras),
+        "total": total,
+        "price_per_m2": price_per_m2,
+        "result_text": result_text,
+    }
+
+
+def compact_session(config_json: str, area: float, picks: list[str], extras: list[str]) -> dict[str, Any]:
+    json.loads(config_json)
+    return {
+        "ui_message_id": 1000,
+        "s": Session(
+            7,
+            area,
+            tuple(intern_id(x) for x in picks),
+            tuple(sorted(intern_id(x) for x in extras)),
+        ),
+    }
+
+
+def measure(factory: Callable[..., dict[str, Any]], choices: list[tuple[float, list[str], list[str]]]) -> float:
+    config_json = json.dumps(DEFAULT_CONFIG, ensure_ascii=False)
+    sessions: list[dict[str, Any]] = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for area, picks, extras in choices:
+        sessions.append(factory(config_json, area, picks, extras))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(sessions)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    choices = [_random_choice(rnd, DEFAULT_CONFIG) for _ in range(args.sessions)]
+
+    legacy = measure(legacy_session, choices)
+    compact = measure(compact_session, choices)
+    print(f"sessions:         {args.sessions}")
+    print(f"legacy  bytes/session: {legacy:8.0f}")
+    print(f"compact bytes/session: {compact:8.0f}")
+    print(f"ratio:            {legacy / compact:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
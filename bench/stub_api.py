@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import typing
+from collections import Counter
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetFile, GetMe, TelegramMethod
+from aiogram.types import Message
+
+
+class StubSession(BaseSession):
+    """Local stand-in for the Bot API: answers every method with a minimal valid result."""
+
+    def __init__(self, *, latency: float = 0.0, bot_id: int = 1, username: str = "stub_bot") -> None:
+        super().__init__()
+        self.latency = latency
+        self.bot_id = bot_id
+        self.username = username
+        self.calls: Counter[str] = Counter()
+        self._message_id = 0
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(
+        self, url: str, headers: dict[str, Any] | None = None, timeout: int = 30, chunk_size: int = 65536, raise_for_status: bool = True
+    ) -> AsyncGenerator[bytes, None]:
+        yield b"{}"
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = json.dumps({"ok": True, "result": self._result(method)})
+        return self.check_response(bot, method, 200, content).result
+
+    def _result(self, method: TelegramMethod[Any]) -> Any:
+        if isinstance(method, GetMe):
+            return {"id": self.bot_id, "is_bot": True, "first_name": "stub", "username": self.username}
+        if isinstance(method, GetFile):
+            return {"file_id": method.file_id, "file_unique_id": "stub", "file_path": "stub"}
+        returning = method.__returning__
+        if returning is Message or Message in typing.get_args(returning):
+            if returning is not Message:
+                return True
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", 0)
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id if isinstance(chat_id, int) else 0, "type": "private"},
+            }
+        if typing.get_origin(returning) is list:
+            return []
+        return True
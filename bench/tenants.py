@@ -0,0 +1,136 @@
+"""Throughput and per-tenant latency with N tenant bots served by one dispatcher.
+
+Usage: python -m bench.tenants [--tenants 8] [--users 50] [--noisy 1] [--api-latency 5]
+
+Every tenant gets its own Bot (stand-in API) and catalog namespace; each user runs the full
+calculation flow. --noisy N makes tenant #0 send N times more traffic than the others, to see
+whether its load leaks into the other tenants' latency.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any
+
+from aiogram import Bot
+from aiogram.types import Update
+
+from bench.stub_api import StubSession
+from bot.calc import SECTION_ORDER
+from bot.db import DEFAULT_CONFIG, init_db
+from bot.settings import Settings
+from bot.tenants import Tenant
+
+_DATE = 1700000000
+
+
+def user_flow(user_id: int, rng: random.Random, next_id: list[int]) -> list[dict[str, Any]]:
+    def update(body: dict[str, Any]) -> dict[str, Any]:
+        next_id[0] += 1
+        return {"update_id": next_id[0], **body}
+
+    chat = {"id": user_id, "type": "private"}
+    sender = {"id": user_id, "is_bot": False, "first_name": "u"}
+
+    def message(text: str) -> dict[str, Any]:
+        body = {"message_id": next_id[0], "date": _DATE, "chat": chat, "from": sender, "text": text}
+        return update({"message": body})
+
+    def callback(data: str) -> dict[str, Any]:
+        msg = {"message_id": 1, "date": _DATE, "chat": chat, "text": "x"}
+        query = {"id": str(next_id[0]), "chat_instance": "c", "from": sender, "data": data, "message": msg}
+        return update({"callback_query": query})
+
+    flow = [message("/start"), callback("calc:start"), message(str(rng.randint(60, 300)))]
+    for section in SECTION_ORDER:
+        flow.append(callback(f"pick:{section}:{rng.choice(DEFAULT_CONFIG[section])['id']}"))
+    flow.append(callback("extras:done"))
+    return flow
+
+
+async def run(args: argparse.Namespace) -> None:
+    from main import build_dispatcher
+
+    settings = Settings(
+        db_path=args.db,
+        throttle_user_rate=1e9,
+        throttle_user_burst=1e9,
+        throttle_chat_rate=1e9,
+        throttle_chat_burst=1e9,
+        throttle_debounce=0.0,
+        trace_sample_rate=0.0,
+    )
+    # Handlers build their own Settings(), so the database path has to reach them through the environment.
+    os.environ["DB_PATH"] = args.db
+    tenants = [Tenant(f"t{i}", f"{1000 + i}:bench", frozenset()) for i in range(args.tenants)]
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    await init_db(args.db, [t.name for t in tenants])
+
+    latency = args.api_latency / 1000
+    bots = {t: Bot(token=t.bot_token, session=StubSession(latency=latency, bot_id=t.bot_id)) for t in tenants}
+    dp = build_dispatcher(settings, tenants)
+
+    rng = random.Random(1)
+    next_id = [0]
+    flows: list[tuple[Tenant, list[dict[str, Any]]]] = []
+    for n, tenant in enumerate(tenants):
+        users = args.users * (args.noisy if n == 0 else 1)
+        flows.extend((tenant, user_flow(100_000 + u, rng, next_id)) for u in range(users))
+    rng.shuffle(flows)
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+
+    async def play(tenant: Tenant, flow: list[dict[str, Any]]) -> None:
+        bot = bots[tenant]
+        for raw in flow:
+            update = Update.model_validate(raw, context={"bot": bot})
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies[tenant.label].append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(play(tenant, flow) for tenant, flow in flows))
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(len(x) for x in latencies.values())
+    print(f"tenants: {args.tenants}  updates: {total}  elapsed: {elapsed:.2f}s  rate: {total / elapsed:.0f} upd/s")
+    print(f"python heap: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB")
+    fsm: dict[str, float] = {}
+    for name, labels, value in dp.storage.collect_metrics():  # type: ignore[attr-defined]
+        if name == "fsm_bytes":
+            fsm[labels.get("tenant", "default")] = value
+    print(f"{'tenant':<10} {'updates':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'fsm KB':>8}")
+    for label in sorted(latencies, key=lambda x: int(x[1:])):
+        samples = sorted(latencies[label])
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(
+            f"{label:<10} {len(samples):>8} {statistics.median(samples) * 1000:>8.2f} "
+            f"{p95 * 1000:>8.2f} {samples[-1] * 1000:>8.2f} {fsm.get(label, 0) / 1024:>8.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=8)
+    parser.add_argument("--users", type=int, default=50, help="users per tenant")
+    parser.add_argument("--noisy", type=int, default=1, help="traffic multiplier for tenant t0")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency, ms")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_tenants.db"))
+    args = parser.parse_args()
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
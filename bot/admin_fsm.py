@@ -7,3 +7,7 @@ class AdminStates(StatesGroup):
     editing_field = State()
     waiting_value = State()
     importing_config = State()
+    bulk_waiting_op = State()
+    bulk_confirm = State()
+    searching = State()
+    preview_confirm = State()
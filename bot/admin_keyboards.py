@@ -21,8 +21,47 @@ def kb_admin_main() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="➕ Добавить пункт", callback_data="admin:add")],
             [InlineKeyboardButton(text="✏️ Изменить пункт", callback_data="admin:edit")],
             [InlineKeyboardButton(text="❌ Удалить пункт", callback_data="admin:delete")],
+            [InlineKeyboardButton(text="🔎 Поиск пункта", callback_data="admin:search")],
             [InlineKeyboardButton(text="📤 Экспорт конфигурации", callback_data="admin:export")],
             [InlineKeyboardButton(text="📥 Импорт конфигурации", callback_data="admin:import")],
+            [InlineKeyboardButton(text="📑 Выгрузка смет", callback_data="admin:estimates")],
+            [InlineKeyboardButton(text="📈 Массовое изменение цен", callback_data="admin:bulk")],
+        ]
+    )
+
+
+def kb_admin_bulk_scope() -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text=title, callback_data=f"admin:bulk:scope:{sec}")] for sec, title in SECTIONS]
+    rows.append([InlineKeyboardButton(text="Весь каталог", callback_data="admin:bulk:scope:all")])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:home")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def kb_admin_bulk_confirm() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Применить", callback_data="admin:bulk:apply")],
+            [InlineKeyboardButton(text="Отмена", callback_data="admin:home")],
+        ]
+    )
+
+
+def kb_admin_preview_confirm() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Сохранить", callback_data="admin:preview:apply")],
+            [InlineKeyboardButton(text="Отмена", callback_data="admin:home")],
+        ]
+    )
+
+
+def kb_admin_estimates_period() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="За 7 дней", callback_data="admin:estimates:7")],
+            [InlineKeyboardButton(text="За 30 дней", callback_data="admin:estimates:30")],
+            [InlineKeyboardButton(text="За всё время", callback_data="admin:estimates:0")],
+            [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:home")],
         ]
     )
 
@@ -45,6 +84,36 @@ def kb_admin_items(section: str, items: list[dict[str, Any]]) -> InlineKeyboardM
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def kb_admin_search_results(
+    rows: list[tuple[str, str, bool, str]],
+    *,
+    page: int,
+    pages: int,
+) -> InlineKeyboardMarkup:
+    titles = dict(SECTIONS)
+    keyboard: list[list[InlineKeyboardButton]] = []
+    for section, item_id, enabled, title in rows:
+        mark = "🟢" if enabled else "⚫️"
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    text=f"{mark} {title} · {titles.get(section, section)}",
+                    callback_data=f"admin:item:{section}:{item_id}",
+                )
+            ]
+        )
+    if pages > 1:
+        nav: list[InlineKeyboardButton] = []
+        if page > 0:
+            nav.append(InlineKeyboardButton(text="◀️", callback_data=f"admin:search:{page - 1}"))
+        nav.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="admin:search:-"))
+        if page < pages - 1:
+            nav.append(InlineKeyboardButton(text="▶️", callback_data=f"admin:search:{page + 1}"))
+        keyboard.append(nav)
+    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:home")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 def kb_admin_item_actions(section: str, item_id: str, enabled: bool) -> InlineKeyboardMarkup:
     toggle_text = "Выключить" if enabled else "Включить"
     return InlineKeyboardMarkup(
@@ -52,6 +121,7 @@ def kb_admin_item_actions(section: str, item_id: str, enabled: bool) -> InlineKe
             [InlineKeyboardButton(text=f"{toggle_text}", callback_data=f"admin:toggle:{section}:{item_id}")],
             [InlineKeyboardButton(text="Изменить название", callback_data=f"admin:field:{section}:{item_id}:title")],
             [InlineKeyboardButton(text="Изменить цену (₽/м²)", callback_data=f"admin:field:{section}:{item_id}:price")],
+            [InlineKeyboardButton(text="Ступени цены по площади", callback_data=f"admin:field:{section}:{item_id}:tiers")],
             [InlineKeyboardButton(text="Изменить порядок", callback_data=f"admin:field:{section}:{item_id}:order")],
             [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin:section:{section}")],
         ]
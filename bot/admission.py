@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Iterator
+
+from bot import metrics
+
+CHEAP = "cheap"
+TEXT = "text"
+DOCUMENT = "document"
+ADMIN = "admin"
+
+BUSY_TEXT = "Сейчас много запросов, попробуйте ещё раз через минуту"
+
+_ADMIN_COMMANDS = ("/admin", "/perf", "/mem", "/find")
+
+
+def classify(update: dict[str, Any]) -> str:
+    # Works on the raw webhook JSON, so overload is decided before any model validation happens.
+    callback = update.get("callback_query")
+    if callback is not None:
+        data = str(callback.get("data") or "")
+        if data.startswith("admin:"):
+            return ADMIN
+        if data == "result:xlsx" or data.startswith("xlsx:"):
+            return DOCUMENT
+        return CHEAP
+    message = update.get("message")
+    if message is not None:
+        if message.get("document") is not None:
+            return ADMIN
+        text = str(message.get("text") or "")
+        if text.startswith(_ADMIN_COMMANDS):
+            return ADMIN
+        return TEXT
+    return CHEAP
+
+
+def busy_response(update: dict[str, Any]) -> dict[str, Any] | None:
+    # Answered inline in the webhook response body, so shedding costs no extra Bot API request.
+    callback = update.get("callback_query")
+    if callback is not None:
+        return {"method": "answerCallbackQuery", "callback_query_id": callback["id"], "text": BUSY_TEXT}
+    inline = update.get("inline_query")
+    if inline is not None:
+        return {"method": "answerInlineQuery", "inline_query_id": inline["id"], "results": [], "cache_time": 5}
+    message = update.get("message")
+    if message is not None and "chat" in message:
+        return {"method": "sendMessage", "chat_id": message["chat"]["id"], "text": BUSY_TEXT}
+    return None
+
+
+class _Lane:
+    __slots__ = ("concurrency", "max_queue", "active", "queued", "semaphore")
+
+    def __init__(self, concurrency: int, max_queue: int) -> None:
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+
+class AdmissionControl:
+    def __init__(self, limits: dict[str, tuple[int, int]], *, max_wait: float = 5.0) -> None:
+        self.max_wait = max_wait
+        self._lanes = {name: _Lane(concurrency, queue) for name, (concurrency, queue) in limits.items()}
+
+    async def acquire(self, cls: str) -> bool:
+        lane = self._lanes.get(cls)
+        if lane is None:
+            return True
+        if lane.semaphore.locked():
+            if lane.queued >= lane.max_queue:
+                metrics.inc("admission_shed_total", update_class=cls, reason="queue_full")
+                return False
+            lane.queued += 1
+            try:
+                await asyncio.wait_for(lane.semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                metrics.inc("admission_shed_total", update_class=cls, reason="timeout")
+                return False
+            finally:
+                lane.queued -= 1
+        else:
+            # A free slot is taken without suspending, so concurrent arrivals see it as used right away.
+            await lane.semaphore.acquire()
+        lane.active += 1
+        metrics.inc("admission_admitted_total", update_class=cls)
+        return True
+
+    def release(self, cls: str) -> None:
+        lane = self._lanes.get(cls)
+        if lane is None:
+            return
+        lane.active -= 1
+        lane.semaphore.release()
+
+    def collect_metrics(self) -> Iterator[metrics.Sample]:
+        for name, lane in self._lanes.items():
+            yield "admission_active", {"update_class": name}, float(lane.active)
+            yield "admission_queued", {"update_class": name}, float(lane.queued)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import hmac
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+from aiohttp import web
+
+from bot import metrics
+from bot.calc import SECTION_ORDER, build_line_items, estimate_totals, find_item
+from bot.db import get_config_version, get_versioned_config
+from bot.materials import material_book
+from bot.pricing import price_book
+from bot.tenants import Tenant, cache_key, use_tenant
+
+
+class ApiError(ValueError):
+    pass
+
+
+Request = tuple[float, tuple[str, ...], tuple[str, ...]]
+
+
+def parse_request(raw: Any) -> Request:
+    if not isinstance(raw, dict):
+        raise ApiError("request must be an object")
+    try:
+        area = float(raw["area"])
+    except (KeyError, TypeError, ValueError):
+        raise ApiError("area must be a number") from None
+    # NaN passes every range check and never matches its own cache key.
+    if not math.isfinite(area):
+        raise ApiError("area must be a finite number")
+    picks_raw = raw.get("picks")
+    if not isinstance(picks_raw, dict):
+        raise ApiError(f"picks must be an object with {', '.join(SECTION_ORDER)}")
+    picks = tuple(str(picks_raw.get(section) or "") for section in SECTION_ORDER)
+    extras_raw = raw.get("extras", [])
+    if not isinstance(extras_raw, list):
+        raise ApiError("extras must be a list")
+    # Rounded area and sorted extras make equivalent requests share one cache entry.
+    return round(area, 2), picks, tuple(sorted({str(x) for x in extras_raw}))
+
+
+def compute(config: dict[str, Any], version: int, request: Request) -> dict[str, Any]:
+    area, picks, extras = request
+    limits = config.get("area_limits", {})
+    min_a = float(limits.get("min", 20))
+    max_a = float(limits.get("max", 1000))
+    if area < min_a or area > max_a:
+        raise ApiError(f"area must be between {min_a:g} and {max_a:g}")
+    for section, item_id in zip(SECTION_ORDER, picks):
+        if find_item(config.get(section, []), item_id) is None:
+            raise ApiError(f"unknown or disabled {section}: {item_id!r}")
+    for extra_id in extras:
+        if find_item(config.get("extras", []), extra_id) is None:
+            raise ApiError(f"unknown or disabled extra: {extra_id!r}")
+
+    # Same building blocks as the bot's result screen, so both quote the same numbers.
+    line_items = build_line_items(config, area, picks, extras, price_book(version, config))
+    total, price_per_m2 = estimate_totals(line_items, area)
+    materials = material_book(version, config).bill(line_items)
+    return {
+        "version": version,
+        "area": area,
+        "items": [{**it.as_dict(), "cost": round(it.cost, 2)} for it in line_items],
+        "total": round(total, 2),
+        "price_per_m2": round(price_per_m2, 2),
+        "materials": [{**m.as_dict(), "cost": round(m.cost, 2)} for m in materials],
+    }
+
+
+class EstimateApi:
+    def __init__(
+        self,
+        tenants: Iterable[Tenant],
+        *,
+        db_path: str,
+        batch_max: int = 100,
+        cache_size: int = 4096,
+        version_ttl: float = 1.0,
+    ) -> None:
+        self._tenants = {token: t for t in tenants for token in t.api_tokens}
+        self._db_path = db_path
+        self._batch_max = batch_max
+        self._cache_size = cache_size
+        self._version_ttl = version_ttl
+        self._cache: OrderedDict[tuple[tuple[str, Hashable], Request], dict[str, Any]] = OrderedDict()
+        self._versions: dict[str, tuple[float, int]] = {}
+        self._configs: dict[str, tuple[int, dict[str, Any]]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._tenants)
+
+    def routes(self, app: web.Application) -> None:
+        app.router.add_post("/api/estimate", self.estimate)
+        app.router.add_post("/api/estimate/batch", self.estimate_batch)
+
+    def _authenticate(self, request: web.Request) -> Tenant | None:
+        scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+        given = given.strip()
+        if scheme != "Bearer" or not given:
+            return None
+        for token, tenant in self._tenants.items():
+            if hmac.compare_digest(given.encode(), token.encode()):
+                return tenant
+        return None
+
+    async def _version(self, tenant: Tenant) -> int:
+        # A price edit becomes visible to the API within version_ttl; until then every request
+        # is answered without touching SQLite.
+        now = time.monotonic()
+        checked = self._versions.get(tenant.name)
+        if checked is not None and now - checked[0] < self._version_ttl:
+            return checked[1]
+        version = await get_config_version(self._db_path)
+        self._versions[tenant.name] = (now, version)
+        return version
+
+    async def _config(self, tenant: Tenant) -> tuple[int, dict[str, Any]]:
+        version = await self._version(tenant)
+        loaded = self._configs.get(tenant.name)
+        # The parsed config is reused until a newer version shows up; the version read with it
+        # is the one results are cached under, even if it is already newer than the checked one.
+        if loaded is None or loaded[0] < version:
+            loaded = await get_versioned_config(self._db_path)
+            self._configs[tenant.name] = loaded
+        return loaded
+
+    def _answer(self, version: int, config: dict[str, Any], request: Request) -> dict[str, Any]:
+        key = (cache_key(version), request)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            metrics.inc("api_cache_total", result="hit")
+            return cached
+        metrics.inc("api_cache_total", result="miss")
+        result = compute(config, version, request)
+        self._cache[key] = result
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def _read(self, request: web.Request, endpoint: str) -> tuple[Tenant, Any] | web.Response:
+        tenant = self._authenticate(request)
+        if tenant is None:
+            return self._error(endpoint, 401, "missing or invalid token")
+        try:
+            body = await request.json()
+        except ValueError:
+            return self._error(endpoint, 400, "body must be JSON")
+        return tenant, body
+
+    def _error(self, endpoint: str, status: int, message: str) -> web.Response:
+        metrics.inc("api_requests_total", endpoint=endpoint, status=str(status))
+        return web.json_response({"error": message}, status=status)
+
+    async def estimate(self, request: web.Request) -> web.Response:
+        read = await self._read(request, "estimate")
+        if isinstance(read, web.Response):
+            return read
+        tenant, body = read
+        with use_tenant(tenant):
+            version, config = await self._config(tenant)
+            try:
+                result = self._answer(version, config, parse_request(body))
+            except ApiError as e:
+                return self._error("estimate", 400, str(e))
+        metrics.inc("api_requests_total", endpoint="estimate", status="200")
+        return web.json_response(result)
+
+    async def estimate_batch(self, request: web.Request) -> web.Response:
+        read = await self._read(request, "batch")
+        if isinstance(read, web.Response):
+            return read
+        tenant, body = read
+        requests = body.get("requests") if isinstance(body, dict) else None
+        if not isinstance(requests, list):
+            return self._error("batch", 400, "requests must be a list")
+        if len(requests) > self._batch_max:
+            return self._error("batch", 413, f"at most {self._batch_max} requests per batch")
+        results: list[dict[str, Any]] = []
+        with use_tenant(tenant):
+            # One config for the whole batch, so every result is priced from the same version.
+            version, config = await self._config(tenant)
+            for raw in requests:
+                try:
+                    results.append(self._answer(version, config, parse_request(raw)))
+                except ApiError as e:
+                    results.append({"error": str(e)})
+        metrics.inc("api_requests_total", endpoint="batch", status="200")
+        return web.json_response({"results": results})
+
+    def collect_metrics(self) -> Iterable[metrics.Sample]:
+        yield "api_cache_entries", {}, float(len(self._cache))
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+
+class RateLimitedSender:
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        global_rate: float = 25.0,
+        per_chat_interval: float = 1.0,
+        concurrency: int = 20,
+        retries: int = 3,
+    ) -> None:
+        self.bot = bot
+        self.global_interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self.retries = retries
+        self._sem = asyncio.Semaphore(concurrency)
+        self._next_slot = 0.0
+        self._chat_next: dict[int, float] = {}
+        self._paused_until = 0.0
+        self.sent = 0
+
+    async def _wait_slot(self, chat_id: int) -> None:
+        # Slots are handed out back to back, so the sender runs exactly at the global rate when busy.
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._paused_until, self._chat_next.get(chat_id, 0.0))
+        self._next_slot = max(self._next_slot, slot) + self.global_interval
+        self._chat_next[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def send(self, chat_id: int, text: str) -> str:
+        async with self._sem:
+            for _ in range(self.retries):
+                await self._wait_slot(chat_id)
+                try:
+                    await self.bot.send_message(chat_id, text)
+                except TelegramRetryAfter as e:
+                    # Flood control is global for the bot: pause every pending send, not just this one.
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                    metrics.inc("broadcast_retry_after_total")
+                    continue
+                except TelegramForbiddenError:
+                    metrics.inc("broadcast_messages_total", result=BLOCKED)
+                    return BLOCKED
+                except TelegramBadRequest as e:
+                    logger.warning("Broadcast to %s rejected: %s", chat_id, e)
+                    metrics.inc("broadcast_messages_total", result=FAILED)
+                    return FAILED
+                except TelegramAPIError as e:
+                    logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                    continue
+                self.sent += 1
+                metrics.inc("broadcast_messages_total", result=SENT)
+                return SENT
+            metrics.inc("broadcast_messages_total", result=FAILED)
+            return FAILED
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import copy
+import re
+from typing import Any, NamedTuple
+
+from bot.pricing import PRICED_SECTIONS, format_tiers
+
+_PERCENT = re.compile(r"^([+-]\s*\d+(?:[.,]\d+)?)\s*%$")
+_ADD = re.compile(r"^([+-]\s*\d+(?:[.,]\d+)?)$")
+_ROUND = re.compile(r"^(?:округлить|round)\s+(\d+(?:[.,]\d+)?)$", re.IGNORECASE)
+_TOGGLE = re.compile(r"^(вкл|выкл|enable|disable)(?:\s+(.*))?$", re.IGNORECASE)
+
+
+class BulkOp(NamedTuple):
+    kind: str
+    value: float = 0.0
+    pattern: str = ""
+
+
+class Change(NamedTuple):
+    section: str
+    item_id: str
+    title: str
+    before: str
+    after: str
+
+
+def _num(text: str) -> float:
+    return float(text.replace(" ", "").replace(",", "."))
+
+
+def parse_bulk_op(text: str) -> BulkOp:
+    text = text.strip()
+    if m := _PERCENT.match(text):
+        return BulkOp("percent", _num(m.group(1)))
+    if m := _ADD.match(text):
+        return BulkOp("add", _num(m.group(1)))
+    if m := _ROUND.match(text):
+        step = _num(m.group(1))
+        if step <= 0:
+            raise ValueError(text)
+        return BulkOp("round", step)
+    if m := _TOGGLE.match(text):
+        kind = "enable" if m.group(1).lower() in {"вкл", "enable"} else "disable"
+        return BulkOp(kind, pattern=(m.group(2) or "").strip().lower())
+    raise ValueError(text)
+
+
+def _new_price(op: BulkOp, price: float) -> float:
+    if op.kind == "percent":
+        price = price * (1 + op.value / 100)
+    elif op.kind == "add":
+        price = price + op.value
+    elif op.kind == "round":
+        price = round(price / op.value) * op.value
+    return max(0.0, round(price, 2))
+
+
+def apply_bulk_op(config: dict[str, Any], scope: str, op: BulkOp) -> tuple[dict[str, Any], list[Change]]:
+    sections = PRICED_SECTIONS if scope == "all" else (scope,)
+    new_config = dict(config)
+    changes: list[Change] = []
+    for section in sections:
+        items = copy.deepcopy(list(config.get(section, [])))
+        for item in items:
+            item_id = str(item.get("id"))
+            title = str(item.get("title", item_id))
+            if op.kind in {"enable", "disable"}:
+                if op.pattern and op.pattern not in title.lower() and op.pattern not in item_id.lower():
+                    continue
+                enabled = op.kind == "enable"
+                if bool(item.get("enabled", True)) != enabled:
+                    before, after = ("выкл", "вкл") if enabled else ("вкл", "выкл")
+                    changes.append(Change(section, item_id, title, before, after))
+                    item["enabled"] = enabled
+                continue
+
+            old = float(item.get("price", 0) or 0)
+            new = _new_price(op, old)
+            if new != old:
+                changes.append(Change(section, item_id, title, f"{old:g}", f"{new:g}"))
+                item["price"] = new
+            tiers = item.get("tiers") or []
+            new_tiers = [{**t, "price": _new_price(op, float(t.get("price", 0) or 0))} for t in tiers]
+            # A tier-only change is still a change: it must show up in the preview and trigger the save.
+            if any(float(t.get("price", 0) or 0) != n["price"] for t, n in zip(tiers, new_tiers)):
+                changes.append(Change(section, item_id, f"{title} (tiers)", format_tiers(tiers), format_tiers(new_tiers)))
+                item["tiers"] = new_tiers
+        new_config[section] = items
+    return new_config, changes
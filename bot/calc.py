@@ -1,6 +1,11 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from typing import Any, Iterable
+
+from bot.pricing import PriceBook
+
+SECTION_ORDER: list[str] = ["foundation", "walls", "floors", "roof"]
 
 
 @dataclass(frozen=True)
@@ -9,11 +14,85 @@ class LineItem:
     title: str
     area: float
     price_per_m2: float
+    item_id: str = ""
 
     @property
     def cost(self) -> float:
         return self.area * self.price_per_m2
 
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "section": self.section,
+            "id": self.item_id,
+            "title": self.title,
+            "area": self.area,
+            "price": self.price_per_m2,
+        }
+
 
 def roof_area(area: float, roof_coef: float) -> float:
     return area * roof_coef
+
+
+def find_item(items: list[dict[str, Any]], item_id: str) -> dict[str, Any] | None:
+    for it in items:
+        if str(it.get("id")) == item_id and it.get("enabled", True):
+            return it
+    return None
+
+
+def build_line_items(
+    config: dict[str, Any],
+    area: float,
+    picks: tuple[str, ...],
+    extras: tuple[str, ...],
+    book: PriceBook,
+) -> list[LineItem]:
+    roof_coef = float(config.get("roof_coef", 1.0))
+    result: list[LineItem] = []
+    for section, item_id in zip(SECTION_ORDER, picks):
+        if not item_id:
+            continue
+        item = find_item(config.get(section, []), item_id)
+        if item is None:
+            continue
+        result.append(
+            LineItem(
+                section=section,
+                title=str(item.get("title", item_id)),
+                area=roof_area(area, roof_coef) if section == "roof" else area,
+                price_per_m2=book.price(section, item_id, area),
+                item_id=item_id,
+            )
+        )
+
+    selected = set(extras)
+    for extra in config.get("extras", []):
+        extra_id = str(extra.get("id"))
+        if extra_id not in selected or not extra.get("enabled", True):
+            continue
+        result.append(
+            LineItem(
+                section="extras",
+                title=str(extra.get("title", extra_id)),
+                area=area,
+                price_per_m2=book.price("extras", extra_id, area),
+                item_id=extra_id,
+            )
+        )
+    return result
+
+
+def split_selection(items: Iterable[dict[str, Any]]) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    # Inverse of build_line_items for stored estimates: picks in SECTION_ORDER plus extras ids.
+    by_section = {str(it.get("section")): str(it.get("id", "")) for it in items if it.get("section") != "extras"}
+    extras = tuple(str(it.get("id", "")) for it in items if it.get("section") == "extras")
+    return tuple(by_section.get(s, "") for s in SECTION_ORDER), extras
+
+
+def estimate_totals(items: list[LineItem], area: float) -> tuple[float, float]:
+    total = 0.0
+    for it in items:
+        total += it.cost
+    price_per_m2 = total / area if area > 0 else 0.0
+    return total, price_per_m2
@@ -1,31 +1,47 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+import re
+import sqlite3
+from typing import Any, Iterable, Iterator
 
 import aiosqlite
 
+from bot.pricing import PRICED_SECTIONS
+from bot.tenants import DEFAULT as DEFAULT_TENANT, config_key, current_name
+from bot.tracing import traced
+
 
 DEFAULT_CONFIG: dict[str, Any] = {
     "area_limits": {"min": 20, "max": 1000},
     "roof_coef": 1.2,
     "foundation": [
-        {"id": "pile", "title": "Свайный", "price": 1000, "enabled": True, "order": 10},
-        {"id": "strip", "title": "Ленточный", "price": 1800, "enabled": True, "order": 20},
-        {"id": "slab", "title": "Плита", "price": 2500, "enabled": True, "order": 30},
+        {"id": "pile", "title": "Свайный", "price": 1000, "enabled": True, "order": 10,
+         "materials": {"concrete": 0.05, "rebar": 0.004}},
+        {"id": "strip", "title": "Ленточный", "price": 1800, "enabled": True, "order": 20,
+         "materials": {"concrete": 0.25, "rebar": 0.015}},
+        {"id": "slab", "title": "Плита", "price": 2500, "enabled": True, "order": 30,
+         "materials": {"concrete": 0.3, "rebar": 0.02}},
     ],
     "walls": [
-        {"id": "aerated", "title": "Газобетон", "price": 3500, "enabled": True, "order": 10},
-        {"id": "brick", "title": "Кирпич", "price": 5200, "enabled": True, "order": 20},
-        {"id": "frame", "title": "Каркас", "price": 3000, "enabled": True, "order": 30},
+        {"id": "aerated", "title": "Газобетон", "price": 3500, "enabled": True, "order": 10,
+         "materials": {"aerated_block": 0.35}},
+        {"id": "brick", "title": "Кирпич", "price": 5200, "enabled": True, "order": 20,
+         "materials": {"brick": 0.2}},
+        {"id": "frame", "title": "Каркас", "price": 3000, "enabled": True, "order": 30,
+         "materials": {"timber": 0.08}},
     ],
     "floors": [
-        {"id": "wood", "title": "Деревянные", "price": 1500, "enabled": True, "order": 10},
-        {"id": "rc", "title": "Ж/б плиты", "price": 2400, "enabled": True, "order": 20},
+        {"id": "wood", "title": "Деревянные", "price": 1500, "enabled": True, "order": 10,
+         "materials": {"timber": 0.06}},
+        {"id": "rc", "title": "Ж/б плиты", "price": 2400, "enabled": True, "order": 20,
+         "materials": {"concrete": 0.22, "rebar": 0.012}},
     ],
     "roof": [
-        {"id": "metal", "title": "Металлочерепица", "price": 1600, "enabled": True, "order": 10},
-        {"id": "soft", "title": "Мягкая кровля", "price": 2100, "enabled": True, "order": 20},
+        {"id": "metal", "title": "Металлочерепица", "price": 1600, "enabled": True, "order": 10,
+         "materials": {"metal_tile": 1.1}},
+        {"id": "soft", "title": "Мягкая кровля", "price": 2100, "enabled": True, "order": 20,
+         "materials": {"shingles": 1.15}},
     ],
     "extras": [
         {"id": "electric", "title": "Электрика", "price": 900, "enabled": True, "order": 10},
@@ -35,35 +51,194 @@ DEFAULT_CONFIG: dict[str, Any] = {
         {"id": "windows", "title": "Окна и двери", "price": 1300, "enabled": True, "order": 50},
         {"id": "rough", "title": "Черновая отделка", "price": 2000, "enabled": True, "order": 60},
     ],
+    # Per-m² coefficients in catalog items refer to these ids; quantities are in "unit".
+    "materials": [
+        {"id": "concrete", "title": "Бетон", "unit": "м³", "price": 6500},
+        {"id": "rebar", "title": "Арматура", "unit": "т", "price": 75000},
+        {"id": "aerated_block", "title": "Газобетонный блок", "unit": "м³", "price": 6000},
+        {"id": "brick", "title": "Кирпич", "unit": "тыс. шт", "price": 18000},
+        {"id": "timber", "title": "Пиломатериал", "unit": "м³", "price": 22000},
+        {"id": "metal_tile", "title": "Металлочерепица", "unit": "м²", "price": 650},
+        {"id": "shingles", "title": "Гибкая черепица", "unit": "м²", "price": 900},
+    ],
 }
 
 
-async def init_db(db_path: str) -> None:
+async def _ensure_column(db: aiosqlite.Connection, table: str, column: str, ddl: str) -> None:
+    cur = await db.execute(f"PRAGMA table_info({table})")
+    columns = {str(r[1]) for r in await cur.fetchall()}
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+async def init_db(db_path: str, tenants: Iterable[str] = (DEFAULT_TENANT,)) -> None:
     async with aiosqlite.connect(db_path) as db:
         await db.execute(
             """
             CREATE TABLE IF NOT EXISTS config (
                 key TEXT PRIMARY KEY,
                 value_json TEXT NOT NULL,
-                updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+                updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+                version INTEGER NOT NULL DEFAULT 1
+            );
+            """
+        )
+        await _ensure_column(db, "config", "version", "INTEGER NOT NULL DEFAULT 1")
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS updates_inbox (
+                update_id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL
+            );
+            """
+        )
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS estimates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                chat_id INTEGER,
+                area REAL NOT NULL,
+                total REAL NOT NULL,
+                price_per_m2 REAL NOT NULL,
+                items_json TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                notify INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        await _ensure_column(db, "estimates", "notify", "INTEGER NOT NULL DEFAULT 0")
+        await _ensure_column(db, "estimates", "tenant", "TEXT NOT NULL DEFAULT ''")
+        # Total of the last price notification; total itself stays the one matching items_json.
+        await _ensure_column(db, "estimates", "notified_total", "REAL")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_estimates_created ON estimates(created_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_estimates_notify ON estimates(notify, id)")
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notify_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                config_version INTEGER NOT NULL,
+                cursor INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                started_at TEXT NOT NULL DEFAULT (datetime('now'))
             );
             """
         )
+        await _ensure_column(db, "notify_jobs", "tenant", "TEXT NOT NULL DEFAULT ''")
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS leads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                chat_id INTEGER,
+                username TEXT,
+                contact TEXT NOT NULL,
+                area REAL,
+                total REAL,
+                items_json TEXT NOT NULL DEFAULT '[]',
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                digested INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        await _ensure_column(db, "leads", "tenant", "TEXT NOT NULL DEFAULT ''")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_leads_digested ON leads(digested, id)")
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS catalog_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant TEXT NOT NULL,
+                section TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                enabled INTEGER NOT NULL,
+                title TEXT NOT NULL
+            );
+            """
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_catalog_items_tenant ON catalog_items(tenant)")
+        # External-content index over catalog_items, kept in step by the triggers below.
+        # Prefix indexes make the "word*" queries of the admin search a lookup instead of a term scan.
+        await db.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(
+                item_id, title, content = 'catalog_items', content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            );
+            """
+        )
+        await db.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS catalog_items_ai AFTER INSERT ON catalog_items BEGIN
+                INSERT INTO catalog_fts(rowid, item_id, title) VALUES (new.id, new.item_id, new.title);
+            END;
+            """
+        )
+        await db.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS catalog_items_ad AFTER DELETE ON catalog_items BEGIN
+                INSERT INTO catalog_fts(catalog_fts, rowid, item_id, title)
+                VALUES ('delete', old.id, old.item_id, old.title);
+            END;
+            """
+        )
         await db.commit()
 
-        cur = await db.execute("SELECT value_json FROM config WHERE key = ?", ("app_config",))
-        row = await cur.fetchone()
-        if row is None:
+        for tenant in tenants:
             await db.execute(
-                "INSERT INTO config(key, value_json) VALUES(?, ?)",
-                ("app_config", json.dumps(DEFAULT_CONFIG, ensure_ascii=False)),
+                "INSERT OR IGNORE INTO config(key, value_json) VALUES(?, ?)",
+                (config_key(tenant), json.dumps(DEFAULT_CONFIG, ensure_ascii=False)),
             )
-            await db.commit()
+            # Builds the index for databases created before it existed; a no-op when it is in sync.
+            cur = await db.execute("SELECT value_json FROM config WHERE key = ?", (config_key(tenant),))
+            row = await cur.fetchone()
+            try:
+                await _sync_catalog(db, tenant, _catalog_rows(json.loads(row[0]) if row is not None else DEFAULT_CONFIG))
+            except json.JSONDecodeError:
+                pass
+        await db.commit()
+
+
+CatalogRows = dict[tuple[str, str], tuple[int, str]]
+
+# (db path, tenant) -> (config version, catalog rows) of the last catalog sync made by this process.
+_synced: dict[tuple[str, str], tuple[int, CatalogRows]] = {}
+
 
+def _catalog_rows(config: dict[str, Any]) -> CatalogRows:
+    rows: CatalogRows = {}
+    for section in PRICED_SECTIONS:
+        for it in config.get(section, []):
+            item_id = str(it.get("id"))
+            rows[(section, item_id)] = (int(bool(it.get("enabled", True))), str(it.get("title", item_id)))
+    return rows
 
+
+async def _sync_catalog(db: aiosqlite.Connection, tenant: str, rows: CatalogRows) -> None:
+    # Applies only the difference, so a single price edit touches no index rows at all.
+    wanted = dict(rows)
+    cur = await db.execute("SELECT id, section, item_id, enabled, title FROM catalog_items WHERE tenant = ?", (tenant,))
+    stale: list[tuple[int]] = []
+    for row_id, section, item_id, enabled, title in await cur.fetchall():
+        if wanted.get((section, item_id)) == (int(enabled), title):
+            del wanted[(section, item_id)]
+        else:
+            stale.append((row_id,))
+    if stale:
+        await db.executemany("DELETE FROM catalog_items WHERE id = ?", stale)
+    if wanted:
+        await db.executemany(
+            "INSERT INTO catalog_items(tenant, section, enabled, item_id, title) VALUES(?, ?, ?, ?, ?)",
+            [(tenant, section, enabled, item_id, title) for (section, item_id), (enabled, title) in wanted.items()],
+        )
+
+
+@traced("db.get_config")
 async def get_config(db_path: str) -> dict[str, Any]:
     async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute("SELECT value_json FROM config WHERE key = ?", ("app_config",))
+        cur = await db.execute("SELECT value_json FROM config WHERE key = ?", (config_key(),))
         row = await cur.fetchone()
         if row is None:
             return DEFAULT_CONFIG
@@ -73,10 +248,326 @@ async def get_config(db_path: str) -> dict[str, Any]:
             return DEFAULT_CONFIG
 
 
-async def set_config(db_path: str, config: dict[str, Any]) -> None:
+@traced("db.get_config")
+async def get_versioned_config(db_path: str) -> tuple[int, dict[str, Any]]:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute("SELECT version, value_json FROM config WHERE key = ?", (config_key(),))
+        row = await cur.fetchone()
+        if row is None:
+            return 0, DEFAULT_CONFIG
+        try:
+            return int(row[0]), json.loads(row[1])
+        except json.JSONDecodeError:
+            return 0, DEFAULT_CONFIG
+
+
+async def get_config_version(db_path: str) -> int:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute("SELECT version FROM config WHERE key = ?", (config_key(),))
+        row = await cur.fetchone()
+        return int(row[0]) if row is not None else 0
+
+
+@traced("db.set_config")
+async def set_config(db_path: str, config: dict[str, Any], *, expected_version: int | None = None) -> bool:
+    async with aiosqlite.connect(db_path) as db:
+        if expected_version is None:
+            returned = await db.execute_fetchall(
+                """
+                UPDATE config SET value_json = ?, updated_at = datetime('now'), version = version + 1
+                WHERE key = ? RETURNING version
+                """,
+                (json.dumps(config, ensure_ascii=False), config_key()),
+            )
+        else:
+            # Compare-and-set: fails if someone saved the config after it was read.
+            returned = await db.execute_fetchall(
+                """
+                UPDATE config SET value_json = ?, updated_at = datetime('now'), version = version + 1
+                WHERE key = ? AND version = ? RETURNING version
+                """,
+                (json.dumps(config, ensure_ascii=False), config_key(), expected_version),
+            )
+        if not returned:
+            return False
+        version, tenant = int(returned[0][0]), current_name()
+        rows = _catalog_rows(config)
+        # Most saves only change prices. If the previous version was also saved here with the same ids,
+        # titles and flags, no other writer can have touched the mirror and reading it back is skipped.
+        if _synced.get((db_path, tenant)) != (version - 1, rows):
+            await _sync_catalog(db, tenant, rows)
+        await db.commit()
+        _synced[(db_path, tenant)] = (version, rows)
+        return True
+
+
+_RANKED_MAX = 2000
+
+
+def _match_query(text: str) -> str:
+    # Every word becomes a quoted prefix term, so user input can never be parsed as FTS5 syntax.
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{w}"*' for w in words)
+
+
+@traced("db.search_catalog")
+async def search_catalog(
+    db_path: str,
+    text: str,
+    *,
+    limit: int = 10,
+    offset: int = 0,
+) -> tuple[int, list[tuple[str, str, bool, str]]]:
+    match = _match_query(text)
+    if not match:
+        return 0, []
+    async with aiosqlite.connect(db_path) as db:
+        tenant = current_name()
+        # CROSS JOIN pins the FTS index as the outer loop; otherwise the tenant index wins and
+        # the MATCH is re-evaluated for every catalog row.
+        cur = await db.execute(
+            """
+            SELECT count(*) FROM catalog_fts CROSS JOIN catalog_items ON catalog_items.id = catalog_fts.rowid
+            WHERE catalog_fts MATCH ? AND catalog_items.tenant = ?
+            """,
+            (match, tenant),
+        )
+        row = await cur.fetchone()
+        total = int(row[0]) if row is not None else 0
+        if total == 0:
+            return 0, []
+        # An id hit outranks a title hit: ids are short and admins type them on purpose. A query that
+        # matches most of the catalog has no useful ranking, so it skips bm25 and pages in catalog order.
+        order = "bm25(catalog_fts, 4.0, 1.0), catalog_items.id" if total <= _RANKED_MAX else "catalog_items.id"
+        cur = await db.execute(
+            f"""
+            SELECT catalog_items.section, catalog_items.item_id, catalog_items.enabled, catalog_items.title
+            FROM catalog_fts CROSS JOIN catalog_items ON catalog_items.id = catalog_fts.rowid
+            WHERE catalog_fts MATCH ? AND catalog_items.tenant = ?
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+            """,
+            (match, tenant, limit, offset),
+        )
+        rows = [(str(r[0]), str(r[1]), bool(r[2]), str(r[3])) for r in await cur.fetchall()]
+        return total, rows
+
+
+async def inbox_load(db_path: str) -> tuple[int | None, list[tuple[int, str]]]:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute("SELECT value_json FROM config WHERE key = ?", ("polling_offset",))
+        row = await cur.fetchone()
+        offset = int(json.loads(row[0])) if row is not None else None
+        cur = await db.execute("SELECT update_id, payload FROM updates_inbox ORDER BY update_id")
+        pending = [(int(r[0]), str(r[1])) for r in await cur.fetchall()]
+        return offset, pending
+
+
+async def inbox_commit(
+    db_path: str,
+    *,
+    received: list[tuple[int, str]],
+    done: list[int],
+    offset: int | None,
+) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        if received:
+            await db.executemany("INSERT OR IGNORE INTO updates_inbox(update_id, payload) VALUES(?, ?)", received)
+        if done:
+            await db.executemany("DELETE FROM updates_inbox WHERE update_id = ?", [(x,) for x in done])
+        if offset is not None:
+            await db.execute(
+                """
+                INSERT INTO config(key, value_json) VALUES(?, ?)
+                ON CONFLICT(key) DO UPDATE SET value_json = excluded.value_json, updated_at = datetime('now')
+                """,
+                ("polling_offset", json.dumps(offset)),
+            )
+        await db.commit()
+
+
+@traced("db.save_estimate")
+async def save_estimate(
+    db_path: str,
+    *,
+    user_id: int | None,
+    chat_id: int | None,
+    area: float,
+    total: float,
+    price_per_m2: float,
+    items: list[dict[str, Any]],
+) -> int:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute(
+            """
+            INSERT INTO estimates(user_id, chat_id, area, total, price_per_m2, items_json, tenant)
+            VALUES(?, ?, ?, ?, ?, ?, ?)
+            """,
+            (user_id, chat_id, area, total, price_per_m2, json.dumps(items, ensure_ascii=False), current_name()),
+        )
+        await db.commit()
+        return int(cur.lastrowid or 0)
+
+
+def iter_estimates(db_path: str, *, since: str | None = None, chunk_size: int = 1000) -> Iterator[tuple[Any, ...]]:
+    # The tenant is captured here, in the caller's context, not when the worker thread starts iterating.
+    return _iter_estimates(db_path, since, chunk_size, current_name())
+
+
+def _iter_estimates(db_path: str, since: str | None, chunk_size: int, tenant: str) -> Iterator[tuple[Any, ...]]:
+    # Blocking generator for worker threads: rows are pulled in chunks so memory stays bounded.
+    db = sqlite3.connect(db_path)
+    try:
+        cur = db.execute(
+            """
+            SELECT id, created_at, user_id, area, total, price_per_m2, items_json
+            FROM estimates
+            WHERE tenant = ? AND created_at >= COALESCE(?, '')
+            ORDER BY id
+            """,
+            (tenant, since),
+        )
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        db.close()
+
+
+async def fetch_estimate_selections(db_path: str, *, after_id: int, limit: int = 5000) -> list[tuple[Any, ...]]:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute(
+            "SELECT id, area, items_json FROM estimates WHERE id > ? AND tenant = ? ORDER BY id LIMIT ?",
+            (after_id, current_name(), limit),
+        )
+        return list(await cur.fetchall())
+
+
+@traced("db.insert_leads")
+async def insert_leads(db_path: str, rows: list[tuple[Any, ...]]) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        await db.executemany(
+            """
+            INSERT INTO leads(user_id, chat_id, username, contact, area, total, items_json, created_at, tenant)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        await db.commit()
+
+
+async def fetch_undigested_leads(db_path: str, *, limit: int = 200) -> list[tuple[Any, ...]]:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute(
+            """
+            SELECT id, user_id, username, contact, area, total, created_at
+            FROM leads WHERE digested = 0 AND tenant = ? ORDER BY id LIMIT ?
+            """,
+            (current_name(), limit),
+        )
+        return list(await cur.fetchall())
+
+
+async def mark_leads_digested(db_path: str, ids: list[int]) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        await db.executemany("UPDATE leads SET digested = 1 WHERE id = ?", [(x,) for x in ids])
+        await db.commit()
+
+
+async def set_estimate_notify(db_path: str, *, estimate_id: int, user_id: int) -> bool:
+    # One subscription per user: the latest estimate they asked to follow.
+    async with aiosqlite.connect(db_path) as db:
+        tenant = current_name()
+        await db.execute(
+            "UPDATE estimates SET notify = 0 WHERE user_id = ? AND notify = 1 AND tenant = ?",
+            (user_id, tenant),
+        )
+        cur = await db.execute(
+            "UPDATE estimates SET notify = 1 WHERE id = ? AND user_id = ? AND tenant = ?",
+            (estimate_id, user_id, tenant),
+        )
+        await db.commit()
+        return cur.rowcount == 1
+
+
+async def fetch_subscribed_estimates(
+    db_path: str,
+    *,
+    after_id: int,
+    since: str,
+    limit: int = 500,
+) -> list[tuple[Any, ...]]:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute(
+            """
+            SELECT id, chat_id, area, COALESCE(notified_total, total), items_json FROM estimates
+            WHERE notify = 1 AND id > ? AND created_at >= ? AND tenant = ?
+            ORDER BY id LIMIT ?
+            """,
+            (after_id, since, current_name(), limit),
+        )
+        return list(await cur.fetchall())
+
+
+async def update_notified_totals(db_path: str, rows: list[tuple[float, int]]) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        await db.executemany("UPDATE estimates SET notified_total = ? WHERE id = ?", rows)
+        await db.commit()
+
+
+async def unsubscribe_chats(db_path: str, chat_ids: list[int]) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        tenant = current_name()
+        await db.executemany(
+            "UPDATE estimates SET notify = 0 WHERE chat_id = ? AND tenant = ?",
+            [(x, tenant) for x in chat_ids],
+        )
+        await db.commit()
+
+
+async def has_unfinished_notify_job(db_path: str) -> bool:
+    async with aiosqlite.connect(db_path) as db:
+        cur = await db.execute("SELECT 1 FROM notify_jobs WHERE done = 0 AND tenant = ? LIMIT 1", (current_name(),))
+        return await cur.fetchone() is not None
+
+
+async def open_notify_job(db_path: str, config_version: int) -> tuple[int, int, int, int, int, int]:
+    # Resumes the unfinished job if there is one, otherwise starts a new job for this config version.
+    async with aiosqlite.connect(db_path) as db:
+        tenant = current_name()
+        cur = await db.execute(
+            """
+            SELECT id, config_version, cursor, sent, blocked, failed FROM notify_jobs
+            WHERE done = 0 AND tenant = ? ORDER BY id LIMIT 1
+            """,
+            (tenant,),
+        )
+        row = await cur.fetchone()
+        if row is not None:
+            return tuple(int(x) for x in row)  # type: ignore[return-value]
+        cur = await db.execute(
+            "INSERT INTO notify_jobs(config_version, tenant) VALUES(?, ?)",
+            (config_version, tenant),
+        )
+        await db.commit()
+        return int(cur.lastrowid or 0), config_version, 0, 0, 0, 0
+
+
+async def save_notify_job(
+    db_path: str,
+    job_id: int,
+    *,
+    cursor: int,
+    sent: int,
+    blocked: int,
+    failed: int,
+    done: bool = False,
+) -> None:
     async with aiosqlite.connect(db_path) as db:
         await db.execute(
-            "UPDATE config SET value_json = ?, updated_at = datetime('now') WHERE key = ?",
-            (json.dumps(config, ensure_ascii=False), "app_config"),
+            "UPDATE notify_jobs SET cursor = ?, sent = ?, blocked = ?, failed = ?, done = ? WHERE id = ?",
+            (cursor, sent, blocked, failed, int(done), job_id),
         )
         await db.commit()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import hmac
+from typing import Any, Hashable
+
+from bot.calc import SECTION_ORDER
+from bot.session import Session, intern_id
+from bot.tenants import cache_key
+
+# Layout: varint version, varint area*100, 2-byte id hash per section, varint extras count, 2-byte hash per extra,
+# then a truncated HMAC. Fits Telegram's 64-char start parameter and, with the "xlsx:" prefix, callback data.
+MAX_TOKEN_LEN = 59
+_MAC_BYTES = 6
+_CACHE_SIZE = 64
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(raw: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(raw) or shift > 35:
+            raise ValueError("truncated varint")
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def id_hash(section: str, item_id: str) -> bytes:
+    return hashlib.blake2b(item_id.encode(), digest_size=2, key=section.encode()).digest()
+
+
+def signing_key(secret: str, bot_token: str) -> bytes:
+    # Without an explicit secret the key is derived from the bot token, so every instance agrees on it.
+    return hashlib.sha256(b"share:" + (secret or bot_token).encode()).digest()
+
+
+def _mac(key: bytes, body: bytes) -> bytes:
+    return hmac.new(key, body, hashlib.sha256).digest()[:_MAC_BYTES]
+
+
+def encode_token(session: Session, key: bytes, index: IdIndex) -> str | None:
+    if not all(session.picks):
+        return None
+    # An id sharing its 2-byte hash with another item of the section cannot be decoded reliably, so such
+    # a result gets no share link rather than one that opens with a different item and price.
+    picked = [*zip(SECTION_ORDER, session.picks), *(("extras", x) for x in session.extras)]
+    if any(index.ambiguous(section, item_id) for section, item_id in picked):
+        return None
+    body = bytearray(_varint(session.version) + _varint(int(round(session.area * 100))))
+    for section, item_id in zip(SECTION_ORDER, session.picks):
+        body += id_hash(section, item_id)
+    body += _varint(len(session.extras))
+    for extra_id in session.extras:
+        body += id_hash("extras", extra_id)
+    raw = bytes(body) + _mac(key, bytes(body))
+    token = base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+    return token if len(token) <= MAX_TOKEN_LEN else None
+
+
+class IdIndex:
+    def __init__(self, config: dict[str, Any]) -> None:
+        self._ids: dict[tuple[str, bytes], str] = {}
+        self._collisions: set[tuple[str, bytes]] = set()
+        for section in (*SECTION_ORDER, "extras"):
+            for item in config.get(section, []):
+                item_id = str(item.get("id"))
+                key = (section, id_hash(section, item_id))
+                known = self._ids.setdefault(key, intern_id(item_id))
+                if known != item_id:
+                    self._collisions.add(key)
+        for key in self._collisions:
+            del self._ids[key]
+
+    def resolve(self, section: str, digest: bytes) -> str | None:
+        return self._ids.get((section, digest))
+
+    def ambiguous(self, section: str, item_id: str) -> bool:
+        return (section, id_hash(section, item_id)) in self._collisions
+
+
+_indexes: dict[Hashable, IdIndex] = {}
+
+
+def id_index(version: Hashable, config: dict[str, Any]) -> IdIndex:
+    key = cache_key(version)
+    index = _indexes.get(key)
+    if index is None:
+        index = IdIndex(config)
+        if len(_indexes) >= _CACHE_SIZE:
+            del _indexes[next(iter(_indexes))]
+        _indexes[key] = index
+    return index
+
+
+def decode_token(token: str, key: bytes, index: IdIndex) -> tuple[Session, bool] | None:
+    # The flag tells that some extras no longer resolve and were left out.
+    if not token or len(token) > MAX_TOKEN_LEN:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    body, mac = raw[:-_MAC_BYTES], raw[-_MAC_BYTES:]
+    if len(raw) <= _MAC_BYTES or not hmac.compare_digest(mac, _mac(key, body)):
+        return None
+    try:
+        version, pos = _read_varint(body, 0)
+        area100, pos = _read_varint(body, pos)
+        picks: list[str] = []
+        for section in SECTION_ORDER:
+            item_id = index.resolve(section, body[pos:pos + 2])
+            if item_id is None:
+                return None
+            picks.append(item_id)
+            pos += 2
+        count, pos = _read_varint(body, pos)
+        extras: list[str] = []
+        dropped = False
+        for _ in range(count):
+            extra_id = index.resolve("extras", body[pos:pos + 2])
+            if extra_id is not None:
+                extras.append(extra_id)
+            else:
+                dropped = True
+            pos += 2
+    except ValueError:
+        return None
+    if pos != len(body):
+        return None
+    return Session(version, area100 / 100, tuple(picks), tuple(extras)), dropped
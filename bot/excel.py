@@ -1,13 +1,22 @@
 from __future__ import annotations
 
 import datetime as dt
+import json
+import re
+import zipfile
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable
+from xml.sax.saxutils import escape
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
 
+from bot.tracing import traced
 
+
+@traced("excel")
 def build_estimate_xlsx(
     *,
     path: Path,
@@ -15,6 +24,7 @@ def build_estimate_xlsx(
     items: list[dict[str, Any]],
     total: float,
     price_per_m2: float,
+    materials: list[dict[str, Any]] | None = None,
 ) -> Path:
     wb = Workbook()
     ws = wb.active
@@ -65,6 +75,250 @@ def build_estimate_xlsx(
     for i, w in enumerate(widths, start=1):
         ws.column_dimensions[chr(ord('A') + i - 1)].width = w
 
+    if materials:
+        ms = wb.create_sheet("Материалы")
+        ms.append(list(_MATERIAL_HEADERS))
+        for col in range(1, len(_MATERIAL_HEADERS) + 1):
+            cell = ms.cell(row=1, column=col)
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal="center")
+        materials_total = 0.0
+        for m in materials:
+            quantity = float(m.get("quantity", 0))
+            price = float(m.get("price", 0))
+            materials_total += quantity * price
+            ms.append([str(m.get("title", m.get("id", ""))), str(m.get("unit", "")), quantity, price, quantity * price])
+        row = ms.max_row + 2
+        ms.cell(row=row, column=4, value="Итого:").font = header_font
+        ms.cell(row=row, column=5, value=materials_total).font = header_font
+        for i, w in enumerate(_MATERIAL_WIDTHS, start=1):
+            ms.column_dimensions[chr(ord('A') + i - 1)].width = w
+
     path.parent.mkdir(parents=True, exist_ok=True)
     wb.save(path)
     return path
+
+
+_MATERIAL_HEADERS = ("Материал", "Ед. изм.", "Количество", "Цена за ед.", "Стоимость")
+_MATERIAL_WIDTHS = (28, 10, 12, 14, 14)
+
+
+# Static parts of the estimate workbook, rendered once for each sheet list. Style ids in the sheets:
+# s="1" bold + centered (header row), s="2" bold (summary block).
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_ROOT_RELS = (
+    _XML_HEAD
+    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    "</Relationships>"
+).encode()
+
+
+def _package_parts(sheets: tuple[str, ...]) -> dict[str, bytes]:
+    numbers = range(1, len(sheets) + 1)
+    content_types = (
+        _XML_HEAD
+        + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        + "".join(
+            f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for n in numbers
+        )
+        + '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>"
+    )
+    workbook = (
+        _XML_HEAD
+        + '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+        + "".join(f'<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>' for n, name in zip(numbers, sheets))
+        + "</sheets></workbook>"
+    )
+    workbook_rels = (
+        _XML_HEAD
+        + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(
+            f'<Relationship Id="rId{n}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{n}.xml"/>'
+            for n in numbers
+        )
+        + f'<Relationship Id="rId{len(sheets) + 1}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        "</Relationships>"
+    )
+    return {
+        "[Content_Types].xml": content_types.encode(),
+        "_rels/.rels": _ROOT_RELS,
+        "xl/workbook.xml": workbook.encode(),
+        "xl/_rels/workbook.xml.rels": workbook_rels.encode(),
+    }
+
+
+_ESTIMATE_PARTS = _package_parts(("Смета",))
+_ESTIMATE_WITH_MATERIALS_PARTS = _package_parts(("Смета", "Материалы"))
+_STYLES = (
+    _XML_HEAD
+    + '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2">'
+    '<font><sz val="11"/><name val="Calibri"/><family val="2"/><scheme val="minor"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/><scheme val="minor"/></font>'
+    "</fonts>"
+    '<fills count="2"><fill><patternFill/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+    '<alignment horizontal="center"/></xf>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    "</cellXfs>"
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+).encode()
+_COLUMNS = "ABCDE"
+
+
+def _sheet_head(widths: tuple[int, ...]) -> str:
+    return (
+        _XML_HEAD
+        + '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        "<dimension ref=\"A1:E{last}\"/>"
+        "<cols>"
+        + "".join(f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>' for i, w in enumerate(widths, start=1))
+        + "</cols><sheetData>"
+    )
+
+
+_SHEET_HEAD = _sheet_head((16, 38, 12, 14, 14))
+_MATERIALS_HEAD = _sheet_head(_MATERIAL_WIDTHS)
+_SHEET_TAIL = "</sheetData></worksheet>"
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell(ref: str, value: Any, style: int = 0) -> str:
+    attr = f' s="{style}"' if style else ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"{attr}><v>{value!r}</v></c>'
+    text = escape(_INVALID_XML.sub("", str(value)))
+    return f'<c r="{ref}"{attr} t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+def _row(number: int, cells: list[tuple[str, Any, int]]) -> str:
+    return f'<row r="{number}">' + "".join(_cell(f"{col}{number}", v, s) for col, v, s in cells) + "</row>"
+
+
+_HEADERS = ("Раздел", "Описание", "Площадь", "Цена за м²", "Стоимость")
+_HEADER_ROW = _row(1, [(c, h, 1) for c, h in zip(_COLUMNS, _HEADERS)])
+_MATERIAL_HEADER_ROW = _row(1, [(c, h, 1) for c, h in zip(_COLUMNS, _MATERIAL_HEADERS)])
+
+
+def _materials_sheet(materials: list[dict[str, Any]]) -> str:
+    rows = [_MATERIAL_HEADER_ROW]
+    number = 1
+    materials_total = 0.0
+    for m in materials:
+        number += 1
+        quantity = float(m.get("quantity", 0))
+        price = float(m.get("price", 0))
+        materials_total += quantity * price
+        values = [str(m.get("title", m.get("id", ""))), str(m.get("unit", "")), quantity, price, quantity * price]
+        rows.append(_row(number, [(c, v, 0) for c, v in zip(_COLUMNS, values)]))
+    number += 2
+    rows.append(_row(number, [("D", "Итого:", 2), ("E", materials_total, 2)]))
+    return _MATERIALS_HEAD.format(last=number) + "".join(rows) + _SHEET_TAIL
+
+
+@traced("excel")
+def render_estimate_xlsx(
+    *,
+    path: Path,
+    area: float,
+    items: list[dict[str, Any]],
+    total: float,
+    price_per_m2: float,
+    materials: list[dict[str, Any]] | None = None,
+    now: dt.datetime | None = None,
+) -> Path:
+    # Same cells, fonts and widths as build_estimate_xlsx, but only the sheet XML is rendered per call.
+    rows = [_HEADER_ROW]
+    number = 1
+    for it in items:
+        number += 1
+        it_area = float(it.get("area", 0))
+        price = float(it.get("price", 0))
+        values = [str(it.get("section", "")), str(it.get("title", it.get("id", ""))), it_area, price, it_area * price]
+        rows.append(_row(number, [(c, v, 0) for c, v in zip(_COLUMNS, values)]))
+
+    number += 1
+    stamp = (now or dt.datetime.now()).strftime("%Y-%m-%d %H:%M")
+    for label, value, style in (
+        ("Итого:", total, 2),
+        ("Цена за м²:", price_per_m2, 2),
+        ("Площадь:", area, 2),
+        ("Дата расчёта:", stamp, 0),
+    ):
+        number += 1
+        rows.append(_row(number, [("D", label, 2), ("E", value, style)]))
+
+    sheet = _SHEET_HEAD.format(last=number) + "".join(rows) + _SHEET_TAIL
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, data in (_ESTIMATE_WITH_MATERIALS_PARTS if materials else _ESTIMATE_PARTS).items():
+            zf.writestr(name, data)
+        zf.writestr("xl/styles.xml", _STYLES)
+        zf.writestr("xl/worksheets/sheet1.xml", sheet.encode())
+        if materials:
+            zf.writestr("xl/worksheets/sheet2.xml", _materials_sheet(materials).encode())
+    return path
+
+
+def write_estimates_xlsx(
+    *,
+    path: Path,
+    rows: Iterable[tuple[Any, ...]],
+    sections: list[tuple[str, str]],
+) -> int:
+    # Write-only mode streams rows to disk instead of holding the sheet in memory.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Сметы")
+
+    widths = [8, 18, 14, 12, 14, 14] + [24] * len(sections)
+    for i, w in enumerate(widths):
+        ws.column_dimensions[get_column_letter(i + 1)].width = w
+
+    header_font = Font(bold=True)
+    headers = ["ID", "Дата", "Пользователь", "Площадь", "Итого", "Цена за м²"] + [title for _, title in sections]
+    header_cells = []
+    for text in headers:
+        cell = WriteOnlyCell(ws, value=text)
+        cell.font = header_font
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    count = 0
+    for est_id, created_at, user_id, area, total, price_per_m2, items_json in rows:
+        try:
+            items = json.loads(items_json)
+        except json.JSONDecodeError:
+            items = []
+        by_section: dict[str, list[str]] = {}
+        for it in items:
+            by_section.setdefault(str(it.get("section", "")), []).append(str(it.get("title", it.get("id", ""))))
+        ws.append(
+            [est_id, created_at, user_id, area, total, price_per_m2]
+            + [", ".join(by_section.get(sec, [])) for sec, _ in sections]
+        )
+        count += 1
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(path)
+    return count
@@ -9,3 +9,4 @@ class CalcStates(StatesGroup):
     choosing_roof = State()
     choosing_extras = State()
     showing_result = State()
+    awaiting_contact = State()
@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-from aiogram.types import Message
+from aiogram.types import CallbackQuery, Message
 
-from bot.settings import Settings
+from bot import tenants
 
 
-def is_admin(message: Message) -> bool:
+def is_admin(message: Message | CallbackQuery) -> bool:
     if message.from_user is None:
         return False
-    settings = Settings()
-    return message.from_user.id in settings.admin_id_set()
+    return message.from_user.id in tenants.current().admin_ids
@@ -1,27 +1,42 @@
 from __future__ import annotations
 
+import asyncio
+import copy
+import datetime as dt
 import json
 import tempfile
 from pathlib import Path
 from typing import Any
 
-from aiogram import F, Router
-from aiogram.filters import Command
+from aiogram import Bot, F, Router
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, FSInputFile, Message
+from aiogram.types import CallbackQuery, FSInputFile, InlineKeyboardMarkup, Message
 
 from bot.admin_fsm import AdminStates
 from bot.admin_keyboards import (
     SECTIONS,
+    kb_admin_bulk_confirm,
+    kb_admin_bulk_scope,
     kb_admin_coef,
+    kb_admin_estimates_period,
     kb_admin_item_actions,
     kb_admin_items,
     kb_admin_main,
+    kb_admin_preview_confirm,
+    kb_admin_search_results,
     kb_admin_sections,
 )
-from bot.db import get_config, set_config
+from bot.bulk import BulkOp, apply_bulk_op, parse_bulk_op
+from bot.db import get_config, get_versioned_config, iter_estimates, search_catalog, set_config
+from bot.excel import write_estimates_xlsx
 from bot.handlers._shared import is_admin
+from bot.materials import check_config_materials
+from bot.notify import schedule_price_notify
+from bot import memdebug, tracing
+from bot.pricing import PriceBook, check_config_tiers, format_tiers, parse_tiers, price_book
 from bot.settings import Settings
+from bot.whatif import format_preview, load_history, preview
 
 router = Router(name=__name__)
 
@@ -35,6 +50,29 @@ async def admin_entry(message: Message, state: FSMContext) -> None:
     await message.answer("Админ-панель", reply_markup=kb_admin_main())
 
 
+@router.message(Command("perf"))
+async def admin_perf(message: Message) -> None:
+    if not is_admin(message):
+        return
+    await message.answer(tracing.report())
+
+
+@router.message(Command("mem"))
+async def admin_mem(message: Message, command: CommandObject) -> None:
+    if not is_admin(message):
+        return
+    arg = (command.args or "").strip().lower()
+    if arg == "on":
+        memdebug.start()
+        await message.answer("tracemalloc включён. Повторите /mem позже, чтобы увидеть рост.")
+        return
+    if arg == "off":
+        memdebug.stop()
+        await message.answer("tracemalloc выключен")
+        return
+    await message.answer(memdebug.format_report(await memdebug.report()))
+
+
 @router.callback_query(F.data == "admin:home")
 async def admin_home(callback: CallbackQuery, state: FSMContext) -> None:
     if callback.message is None:
@@ -109,6 +147,7 @@ async def admin_item(callback: CallbackQuery, state: FSMContext) -> None:
                 f"Пункт: {item.get('title', item_id)}",
                 f"id: {item_id}",
                 f"price: {item.get('price', 0)}",
+                f"tiers: {format_tiers(item.get('tiers') or [])}",
                 f"order: {item.get('order', 0)}",
                 f"enabled: {enabled}",
             ]
@@ -118,6 +157,77 @@ async def admin_item(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer()
 
 
+SEARCH_PAGE_SIZE = 8
+
+
+async def _search_page(query: str, page: int) -> tuple[str, InlineKeyboardMarkup]:
+    settings = Settings()
+    total, rows = await search_catalog(
+        settings.db_path, query, limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE
+    )
+    if total == 0:
+        return f"По запросу «{query}» ничего не найдено", kb_admin_search_results([], page=0, pages=0)
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    text = f"Поиск «{query}»: найдено {total}"
+    return text, kb_admin_search_results(rows, page=page, pages=pages)
+
+
+@router.message(Command("find"))
+async def admin_find(message: Message, command: CommandObject, state: FSMContext) -> None:
+    if not is_admin(message):
+        return
+    query = (command.args or "").strip()
+    if not query:
+        await state.set_state(AdminStates.searching)
+        await message.answer("Введите название или id пункта")
+        return
+    await state.update_data(admin_search_query=query)
+    text, markup = await _search_page(query, 0)
+    await message.answer(text, reply_markup=markup)
+
+
+@router.callback_query(F.data == "admin:search")
+async def admin_search(callback: CallbackQuery, state: FSMContext) -> None:
+    if callback.message is None:
+        return
+    await state.set_state(AdminStates.searching)
+    await callback.message.answer("Введите название или id пункта")
+    await callback.answer()
+
+
+@router.message(AdminStates.searching)
+async def admin_search_input(message: Message, state: FSMContext) -> None:
+    if not is_admin(message):
+        return
+    query = (message.text or "").strip()
+    if not query:
+        await message.answer("Введите название или id пункта")
+        return
+    await state.set_state(None)
+    await state.update_data(admin_search_query=query)
+    text, markup = await _search_page(query, 0)
+    await message.answer(text, reply_markup=markup)
+
+
+@router.callback_query(F.data.startswith("admin:search:"))
+async def admin_search_page(callback: CallbackQuery, state: FSMContext) -> None:
+    if callback.message is None:
+        return
+    raw_page = (callback.data or "").split(":")[2]
+    if not raw_page.isdigit():
+        # The page counter button: editing to the same text would fail with "message is not modified".
+        await callback.answer()
+        return
+    page = int(raw_page)
+    query = str((await state.get_data()).get("admin_search_query", ""))
+    if not query:
+        await callback.answer("Поиск устарел, повторите /find")
+        return
+    text, markup = await _search_page(query, page)
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
+
+
 @router.callback_query(F.data.startswith("admin:toggle:"))
 async def admin_toggle(callback: CallbackQuery, state: FSMContext) -> None:
     if callback.message is None:
@@ -148,6 +258,7 @@ async def admin_toggle(callback: CallbackQuery, state: FSMContext) -> None:
                 f"Пункт: {item.get('title', item_id)}",
                 f"id: {item_id}",
                 f"price: {item.get('price', 0)}",
+                f"tiers: {format_tiers(item.get('tiers') or [])}",
                 f"order: {item.get('order', 0)}",
                 f"enabled: {enabled}",
             ]
@@ -173,28 +284,20 @@ async def admin_edit_field(callback: CallbackQuery, state: FSMContext) -> None:
         admin_coef_key=None,
     )
     await state.set_state(AdminStates.waiting_value)
-    await callback.message.answer(f"Введите новое значение для {field}")
+    if field == "tiers":
+        await callback.message.answer(
+            "Введите ступени в формате площадь:цена через запятую, например 150:3300, 300:3100.\n"
+            "Для площади меньше первой ступени действует базовая цена. «-» — убрать ступени."
+        )
+    else:
+        await callback.message.answer(f"Введите новое значение для {field}")
     await callback.answer()
 
 
-@router.message(AdminStates.waiting_value)
-async def admin_value_input(message: Message, state: FSMContext) -> None:
-    if not is_admin(message):
-        return
-    if message.text is None:
-        await message.answer("Введите значение текстом")
-        return
-
-    st = await state.get_data()
+def _apply_value(config: dict[str, Any], st: dict[str, Any], value_raw: str) -> str | None:
+    # Applies the edit described by the FSM data to config in place; returns an error text for a bad value
+    # and raises LookupError when the edited item is gone, which ends the edit instead of asking again.
     coef_key = st.get("admin_coef_key")
-    section = str(st.get("admin_section", ""))
-    item_id = str(st.get("admin_item_id", ""))
-    field = str(st.get("admin_field", ""))
-    value_raw = message.text.strip()
-
-    settings = Settings()
-    config = await get_config(settings.db_path)
-
     if coef_key:
         try:
             if coef_key == "roof_coef":
@@ -207,39 +310,147 @@ async def admin_value_input(message: Message, state: FSMContext) -> None:
                 max_a = int(parts[1])
                 config["area_limits"] = {"min": min_a, "max": max_a}
             else:
-                await message.answer("Неизвестный параметр")
-                return
+                return "Неизвестный параметр"
         except ValueError:
-            await message.answer("Некорректный формат значения")
-            return
-
-        await set_config(settings.db_path, config)
-        await state.clear()
-        await message.answer("Сохранено", reply_markup=kb_admin_main())
-        return
+            return "Некорректный формат значения"
+        return None
 
+    section = str(st.get("admin_section", ""))
+    item_id = str(st.get("admin_item_id", ""))
+    field = str(st.get("admin_field", ""))
     items = list(config.get(section, []))
     item = next((x for x in items if str(x.get("id")) == item_id), None)
     if item is None:
-        await message.answer("Не найдено")
-        await state.clear()
-        return
+        raise LookupError(f"{section}/{item_id}")
 
     try:
         if field in {"price", "order"}:
             item[field] = float(value_raw) if field == "price" else int(value_raw)
+        elif field == "tiers":
+            item[field] = parse_tiers(value_raw)
         else:
             item[field] = value_raw
     except ValueError:
-        await message.answer("Некорректный формат значения")
+        return "Некорректный формат значения"
+    config[section] = items
+    return None
+
+
+def _changes_prices(st: dict[str, Any]) -> bool:
+    return st.get("admin_coef_key") == "roof_coef" or (
+        not st.get("admin_coef_key") and st.get("admin_field") in {"price", "tiers"}
+    )
+
+
+async def _preview_text(
+    version: int,
+    config: dict[str, Any],
+    new_config: dict[str, Any],
+) -> str:
+    settings = Settings()
+    history = await load_history(settings.db_path)
+    result = preview(history, config, price_book(version, config), new_config, PriceBook(new_config))
+    return format_preview(result)
+
+
+@router.message(AdminStates.waiting_value)
+async def admin_value_input(message: Message, state: FSMContext) -> None:
+    if not is_admin(message):
+        return
+    if message.text is None:
+        await message.answer("Введите значение текстом")
         return
 
-    config[section] = items
-    await set_config(settings.db_path, config)
+    st = await state.get_data()
+    value_raw = message.text.strip()
+
+    settings = Settings()
+    version, config = await get_versioned_config(settings.db_path)
+    new_config = copy.deepcopy(config)
+    try:
+        error = _apply_value(new_config, st, value_raw)
+    except LookupError:
+        await message.answer("Не найдено")
+        await state.clear()
+        return
+    if error is not None:
+        await message.answer(error)
+        return
+
+    if _changes_prices(st):
+        # Price edits are shown against the stored estimates first and saved from the confirm button.
+        text = await _preview_text(version, config, new_config)
+        await state.update_data(
+            admin_pending_value=value_raw,
+            admin_pending_version=version,
+            admin_import_file_id=None,
+        )
+        await state.set_state(AdminStates.preview_confirm)
+        await message.answer(f"Предпросмотр изменения\n\n{text}", reply_markup=kb_admin_preview_confirm())
+        return
+
+    await set_config(settings.db_path, new_config)
+    if st.get("admin_coef_key"):
+        await state.clear()
+        await message.answer("Сохранено", reply_markup=kb_admin_main())
+        return
     await state.set_state(AdminStates.choosing_item)
     await message.answer("Сохранено")
 
 
+@router.callback_query(F.data == "admin:preview:apply")
+async def admin_preview_apply(callback: CallbackQuery, state: FSMContext) -> None:
+    if callback.message is None or not is_admin(callback):
+        return
+    st = await state.get_data()
+    if await state.get_state() != AdminStates.preview_confirm.state:
+        await callback.answer("Нет изменения")
+        return
+
+    settings = Settings()
+    version, config = await get_versioned_config(settings.db_path)
+    if version != st.get("admin_pending_version"):
+        await state.clear()
+        await callback.message.edit_text(
+            "Каталог изменился после предпросмотра, повторите изменение",
+            reply_markup=kb_admin_main(),
+        )
+        await callback.answer()
+        return
+
+    if st.get("admin_import_file_id"):
+        new_config = await _download_config(callback.bot, str(st["admin_import_file_id"]))
+        error = None if isinstance(new_config, dict) else new_config
+    else:
+        new_config = copy.deepcopy(config)
+        try:
+            error = _apply_value(new_config, st, str(st.get("admin_pending_value", "")))
+        except LookupError:
+            error = "Не найдено"
+    if error is not None or not isinstance(new_config, dict):
+        await state.clear()
+        await callback.message.edit_text(error or "Не удалось применить", reply_markup=kb_admin_main())
+        await callback.answer()
+        return
+
+    if not await set_config(settings.db_path, new_config, expected_version=version):
+        await callback.answer("Каталог изменился, повторите изменение")
+        return
+    schedule_price_notify(callback.bot, settings)
+
+    if st.get("admin_import_file_id"):
+        await state.clear()
+        await callback.message.edit_text("Импорт выполнен", reply_markup=kb_admin_main())
+    elif st.get("admin_coef_key"):
+        await state.clear()
+        await callback.message.edit_text("Сохранено", reply_markup=kb_admin_main())
+    else:
+        await state.update_data(admin_pending_value=None, admin_pending_version=None)
+        await state.set_state(AdminStates.choosing_item)
+        await callback.message.edit_text("Сохранено")
+    await callback.answer("Сохранено")
+
+
 @router.callback_query(F.data == "admin:export")
 async def admin_export(callback: CallbackQuery) -> None:
     if callback.message is None:
@@ -257,42 +468,196 @@ async def admin_export(callback: CallbackQuery) -> None:
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin:import")
-async def admin_import(callback: CallbackQuery, state: FSMContext) -> None:
+@router.callback_query(F.data == "admin:estimates")
+async def admin_estimates(callback: CallbackQuery) -> None:
+    if callback.message is None or not is_admin(callback):
+        return
+    await callback.message.edit_text("Выгрузка смет: выберите период", reply_markup=kb_admin_estimates_period())
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin:estimates:"))
+async def admin_estimates_export(callback: CallbackQuery) -> None:
+    # The export holds customer contacts, so the callback data alone must not be enough to get it.
+    if callback.message is None or not is_admin(callback):
+        return
+    parts = (callback.data or "").split(":")
+    if len(parts) != 3 or not parts[2].isdigit():
+        await callback.answer()
+        return
+
+    days = int(parts[2])
+    since = None
+    if days > 0:
+        since = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    await callback.answer("Готовлю выгрузку…")
+    settings = Settings()
+    with tempfile.TemporaryDirectory() as tmp:
+        p = Path(tmp) / "estimates.xlsx"
+        count = await asyncio.to_thread(
+            write_estimates_xlsx,
+            path=p,
+            rows=iter_estimates(settings.db_path, since=since),
+            sections=SECTIONS,
+        )
+        if count == 0:
+            await callback.message.answer("Нет смет за выбранный период")
+            return
+        await callback.message.answer_document(
+            document=FSInputFile(str(p), filename="estimates.xlsx"),
+            caption=f"Выгрузка смет: {count}",
+        )
+
+
+@router.callback_query(F.data == "admin:bulk")
+async def admin_bulk(callback: CallbackQuery) -> None:
     if callback.message is None:
         return
-    await state.set_state(AdminStates.importing_config)
-    await callback.message.answer("Пришлите JSON-файл конфигурации (config.json)")
+    await callback.message.edit_text("Массовое изменение: выберите раздел", reply_markup=kb_admin_bulk_scope())
     await callback.answer()
 
 
-@router.message(AdminStates.importing_config)
-async def admin_import_file(message: Message, state: FSMContext) -> None:
+@router.callback_query(F.data.startswith("admin:bulk:scope:"))
+async def admin_bulk_scope(callback: CallbackQuery, state: FSMContext) -> None:
+    if callback.message is None:
+        return
+    scope = (callback.data or "").split(":")[-1]
+    await state.update_data(admin_bulk_scope=scope)
+    await state.set_state(AdminStates.bulk_waiting_op)
+    await callback.message.answer(
+        "\n".join(
+            [
+                f"Раздел: {'весь каталог' if scope == 'all' else _section_title(scope)}",
+                "Введите операцию:",
+                "+10% / -5% — изменить цены на процент",
+                "+500 / -200 — изменить цены на сумму (₽/м²)",
+                "округлить 50 — округлить цены до шага",
+                "вкл <текст> / выкл <текст> — включить/выключить пункты, где есть текст (без текста — все)",
+            ]
+        )
+    )
+    await callback.answer()
+
+
+@router.message(AdminStates.bulk_waiting_op)
+async def admin_bulk_preview(message: Message, state: FSMContext) -> None:
     if not is_admin(message):
         return
-    if message.document is None:
-        await message.answer("Пришлите файл JSON")
+    if message.text is None:
+        await message.answer("Введите операцию текстом")
+        return
+    try:
+        op = parse_bulk_op(message.text)
+    except ValueError:
+        await message.answer("Не понял операцию, попробуйте ещё раз")
         return
 
-    bot = message.bot
-    file = await bot.get_file(message.document.file_id)
+    scope = str((await state.get_data()).get("admin_bulk_scope", "all"))
+    settings = Settings()
+    version, config = await get_versioned_config(settings.db_path)
+    _, changes = apply_bulk_op(config, scope, op)
+    if not changes:
+        await message.answer("Операция ничего не меняет")
+        return
+
+    lines = [f"Будет изменено пунктов: {len(changes)}", ""]
+    for ch in changes[:20]:
+        lines.append(f"{_section_title(ch.section)} / {ch.title}: {ch.before} → {ch.after}")
+    if len(changes) > 20:
+        lines.append(f"… и ещё {len(changes) - 20}")
+    await state.update_data(admin_bulk_op=list(op), admin_bulk_version=version)
+    await state.set_state(AdminStates.bulk_confirm)
+    await message.answer("\n".join(lines), reply_markup=kb_admin_bulk_confirm())
+
+
+@router.callback_query(F.data == "admin:bulk:apply")
+async def admin_bulk_apply(callback: CallbackQuery, state: FSMContext) -> None:
+    if callback.message is None:
+        return
+    st = await state.get_data()
+    raw_op = st.get("admin_bulk_op")
+    if await state.get_state() != AdminStates.bulk_confirm.state or not raw_op:
+        await callback.answer("Нет операции")
+        return
+
+    settings = Settings()
+    version, config = await get_versioned_config(settings.db_path)
+    if version != st.get("admin_bulk_version"):
+        await state.clear()
+        await callback.message.edit_text(
+            "Каталог изменился после предпросмотра, повторите операцию",
+            reply_markup=kb_admin_main(),
+        )
+        await callback.answer()
+        return
+
+    op = BulkOp(*raw_op)
+    new_config, changes = apply_bulk_op(config, str(st.get("admin_bulk_scope", "all")), op)
+    if not await set_config(settings.db_path, new_config, expected_version=version):
+        await callback.answer("Каталог изменился, повторите операцию")
+        return
+    if changes and op.kind not in {"enable", "disable"}:
+        schedule_price_notify(callback.bot, settings)
+
+    await state.clear()
+    await callback.message.edit_text(f"Готово, изменено пунктов: {len(changes)}", reply_markup=kb_admin_main())
+    await callback.answer("Сохранено")
+
+
+@router.callback_query(F.data == "admin:import")
+async def admin_import(callback: CallbackQuery, state: FSMContext) -> None:
+    if callback.message is None:
+        return
+    await state.set_state(AdminStates.importing_config)
+    await callback.message.answer("Пришлите JSON-файл конфигурации (config.json)")
+    await callback.answer()
+
+
+async def _download_config(bot: Bot, file_id: str) -> dict[str, Any] | str:
+    file = await bot.get_file(file_id)
     content = await bot.download(file)
     raw = content.getvalue().decode("utf-8", errors="replace")
 
     try:
         cfg = json.loads(raw)
     except json.JSONDecodeError:
-        await message.answer("Не смог прочитать JSON")
-        return
+        return "Не смог прочитать JSON"
 
     if not isinstance(cfg, dict):
-        await message.answer("Конфигурация должна быть JSON-объектом")
+        return "Конфигурация должна быть JSON-объектом"
+
+    try:
+        check_config_tiers(cfg)
+    except ValueError as e:
+        return f"Некорректные ступени цен: {e}"
+    try:
+        check_config_materials(cfg)
+    except ValueError as e:
+        return f"Некорректные материалы: {e}"
+    return cfg
+
+
+@router.message(AdminStates.importing_config)
+async def admin_import_file(message: Message, state: FSMContext) -> None:
+    if not is_admin(message):
+        return
+    if message.document is None:
+        await message.answer("Пришлите файл JSON")
         return
 
+    cfg = await _download_config(message.bot, message.document.file_id)
+    if isinstance(cfg, str):
+        await message.answer(cfg)
+        return
+
+    # The file itself is fetched again on confirm, so the FSM data only carries its id.
     settings = Settings()
-    await set_config(settings.db_path, cfg)
-    await state.clear()
-    await message.answer("Импорт выполнен", reply_markup=kb_admin_main())
+    version, config = await get_versioned_config(settings.db_path)
+    text = await _preview_text(version, config, cfg)
+    await state.update_data(admin_import_file_id=message.document.file_id, admin_pending_version=version)
+    await state.set_state(AdminStates.preview_confirm)
+    await message.answer(f"Предпросмотр импорта\n\n{text}", reply_markup=kb_admin_preview_confirm())
 
 
 @router.callback_query(F.data == "admin:add")
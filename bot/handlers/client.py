@@ -1,19 +1,24 @@
 from __future__ import annotations
 
 from typing import Any
+from urllib.parse import quote
 
-from aiogram import F, Router
-from aiogram.filters import CommandStart
+from aiogram import Bot, F, Router
+from aiogram.filters import CommandObject, CommandStart
 import tempfile
 from pathlib import Path
 
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, FSInputFile, Message
+from aiogram.types import CallbackQuery, FSInputFile, InlineKeyboardMarkup, Message
 
-from bot.db import get_config
-from bot.excel import build_estimate_xlsx
+from bot.calc import SECTION_ORDER, build_line_items, estimate_totals, find_item
+from bot.db import get_versioned_config, save_estimate, set_estimate_notify
+from bot.deeplink import decode_token, encode_token, id_index, signing_key
+from bot.excel import render_estimate_xlsx
 from bot.fsm import CalcStates
+from bot.leads import LeadQueue
+from bot.materials import MaterialLine, material_book
 from bot.keyboards import (
     kb_back_to_result,
     kb_back_to_start,
@@ -22,15 +27,15 @@ from bot.keyboards import (
     kb_result,
     kb_start,
 )
+from bot.pricing import price_book
+from bot.session import NO_PICKS, Session, intern_id, load_session
 from bot.settings import Settings
-from bot.utils import fmt_lines, rub, safe_float
+from bot import tenants
+from bot.utils import fmt_lines, fmt_qty, rub, safe_float
 
 router = Router(name=__name__)
 
 
-SECTION_ORDER: list[str] = ["foundation", "walls", "floors", "roof"]
-
-
 async def _ui_edit_or_answer(
     message: Message,
     state: FSMContext,
@@ -57,12 +62,154 @@ async def _try_delete_user_message(message: Message) -> None:
         return
 
 
-def _drop_dependent(items: list[dict[str, Any]], from_section: str) -> list[dict[str, Any]]:
+def _drop_dependent(picks: tuple[str, ...], from_section: str) -> tuple[str, ...]:
     if from_section not in SECTION_ORDER:
-        return items
+        return picks
     idx = SECTION_ORDER.index(from_section)
-    drop_sections = set(SECTION_ORDER[idx:]) | {"extras"}
-    return [it for it in items if str(it.get("section")) not in drop_sections]
+    return picks[:idx] + NO_PICKS[idx:]
+
+
+MATERIAL_LINES_SHOWN = 10
+
+
+def _materials_lines(materials: list[MaterialLine]) -> list[str]:
+    if not materials:
+        return []
+    lines = ["Основные материалы (ориентировочно):"]
+    for m in materials[:MATERIAL_LINES_SHOWN]:
+        lines.append(f"• {m.title} — {fmt_qty(m.quantity)} {m.unit} ≈ {rub(m.cost)}")
+    if len(materials) > MATERIAL_LINES_SHOWN:
+        lines.append(f"…и ещё {len(materials) - MATERIAL_LINES_SHOWN}, полный список в Excel")
+    return lines
+
+
+def _result_text(
+    area: float,
+    total: float,
+    price_per_m2: float,
+    materials: list[MaterialLine] | None = None,
+) -> str:
+    return fmt_lines(
+        [
+            f"Площадь: {int(area)} м²",
+            f"Итого: {rub(total)}",
+            f"Цена за м²: {rub(price_per_m2)}",
+            *_materials_lines(materials or []),
+            "",
+            "Расчёт является предварительным и не является публичной офертой.",
+        ]
+    )
+
+
+_PRICES_UPDATED = "Цены обновились с момента расчёта, показана актуальная стоимость."
+
+
+async def _derive_result(
+    session: Session | None,
+) -> tuple[list[dict[str, Any]], float, float, str, list[dict[str, Any]], int] | None:
+    # The last element is the catalog version the result was priced with; when it differs from
+    # session.version the user last saw other prices, and the text says so.
+    if session is None or session.area <= 0 or not all(session.picks):
+        return None
+    settings = Settings()
+    version, config = await get_versioned_config(settings.db_path)
+    # A pick disabled since the session was made would drop its section and show a smaller total;
+    # like the price notifications, such a result counts as gone and has to be recalculated.
+    if any(find_item(config.get(s, []), item_id) is None for s, item_id in zip(SECTION_ORDER, session.picks)):
+        return None
+    book = price_book(version, config)
+    line_items = build_line_items(config, session.area, session.picks, session.extras, book)
+    total, price_per_m2 = estimate_totals(line_items, session.area)
+    materials = material_book(version, config).bill(line_items)
+    items = [it.as_dict() for it in line_items]
+    text = _result_text(session.area, total, price_per_m2, materials)
+    if session.version != version:
+        text = f"{_PRICES_UPDATED}\n\n{text}"
+    return items, total, price_per_m2, text, [m.as_dict() for m in materials], version
+
+
+def _token_key() -> bytes:
+    tenant = tenants.current()
+    return signing_key(tenant.share_secret, tenant.bot_token)
+
+
+async def _result_markup(bot: Bot, session: Session) -> InlineKeyboardMarkup:
+    settings = Settings()
+    # Checked against the current catalog, which is what the token will be decoded with.
+    version, config = await get_versioned_config(settings.db_path)
+    token = encode_token(session, _token_key(), id_index(version, config))
+    # Without a threshold no notify job ever runs, so the subscription button would lead nowhere.
+    notify = settings.price_notify_threshold > 0
+    if token is None:
+        return kb_result(notify=notify)
+    me = await bot.me()
+    link = f"https://t.me/{me.username}?start={token}"
+    share_url = f"https://t.me/share/url?url={quote(link, safe='')}&text={quote('Мой расчёт дома')}"
+    return kb_result(token, share_url, notify=notify)
+
+
+async def _session_from_token(token: str) -> tuple[Session, str | None] | None:
+    # Returns the session and a notice for the user when options of the shared result are gone;
+    # changed prices are reported by _derive_result.
+    settings = Settings()
+    version, config = await get_versioned_config(settings.db_path)
+    decoded = decode_token(token, _token_key(), id_index(version, config))
+    if decoded is None:
+        return None
+    session, dropped = decoded
+    if dropped:
+        return session, "Часть дополнительных опций больше недоступна и убрана из расчёта."
+    return session, None
+
+
+async def _send_xlsx(callback: CallbackQuery, session: Session | None) -> None:
+    result = await _derive_result(session)
+    if callback.message is None or session is None or result is None:
+        await callback.answer("Сначала сделайте расчёт")
+        return
+    items, total, price_per_m2, _, materials, version = result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = Path(tmp) / "estimate.xlsx"
+        render_estimate_xlsx(
+            path=file_path,
+            area=session.area,
+            items=items,
+            total=total,
+            price_per_m2=price_per_m2,
+            materials=materials,
+        )
+
+        await callback.message.answer_document(
+            document=FSInputFile(str(file_path), filename="smeta.xlsx"),
+            caption="Смета в Excel" if session.version == version else f"Смета в Excel\n{_PRICES_UPDATED}",
+        )
+
+    await callback.answer()
+
+
+@router.message(CommandStart(deep_link=True))
+async def start_shared(message: Message, command: CommandObject, state: FSMContext) -> None:
+    decoded = await _session_from_token(command.args or "")
+    if decoded is None:
+        await start(message)
+        return
+    session, notice = decoded
+    result = await _derive_result(session)
+    if result is None:
+        await message.answer("Пункт из этого расчёта больше недоступен, пересчитайте смету")
+        await start(message)
+        return
+
+    text = result[3]
+    if notice:
+        text = f"{notice}\n\n{text}"
+    # The user has now seen the current prices, so later views and the lead use them without a notice.
+    session = session._replace(version=result[5])
+    await state.clear()
+    await state.set_state(CalcStates.showing_result)
+    sent = await message.answer(text, reply_markup=await _result_markup(message.bot, session))
+    await state.update_data(s=session, ui_message_id=sent.message_id)
 
 
 @router.message(CommandStart())
@@ -95,9 +242,11 @@ async def how_it_works(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data == "result:contact")
-async def contact(callback: CallbackQuery) -> None:
+async def contact(callback: CallbackQuery, state: FSMContext) -> None:
     if callback.message is None:
         return
+    await state.set_state(CalcStates.awaiting_contact)
+    await state.update_data(ui_message_id=callback.message.message_id)
     await callback.message.edit_text(
         "Напишите ваш номер телефона и город, и менеджер свяжется с вами в ближайшее время.",
         reply_markup=kb_back_to_result(),
@@ -105,49 +254,42 @@ async def contact(callback: CallbackQuery) -> None:
     await callback.answer()
 
 
+@router.callback_query(F.data == "result:notify")
+async def notify_subscribe(callback: CallbackQuery, state: FSMContext) -> None:
+    estimate_id = (await state.get_data()).get("estimate_id")
+    settings = Settings()
+    if not estimate_id or settings.price_notify_threshold <= 0:
+        await callback.answer("Уведомления сейчас недоступны")
+        return
+    ok = await set_estimate_notify(settings.db_path, estimate_id=int(estimate_id), user_id=callback.from_user.id)
+    await callback.answer("Сообщим, если цены на вашу смету изменятся" if ok else "Сначала сделайте расчёт")
+
+
 @router.callback_query(F.data == "result:back")
 async def result_back(callback: CallbackQuery, state: FSMContext) -> None:
     if callback.message is None:
         return
-    data = await state.get_data()
-    text = data.get("result_text")
-    if not text:
+    session = load_session(await state.get_data())
+    result = await _derive_result(session)
+    if session is None or result is None:
         await callback.answer("Нет результата")
         return
-    await callback.message.edit_text(str(text), reply_markup=kb_result())
+    session = session._replace(version=result[5])
+    await state.set_state(CalcStates.showing_result)
+    await state.update_data(s=session)
+    await callback.message.edit_text(result[3], reply_markup=await _result_markup(callback.bot, session))
     await callback.answer()
 
 
 @router.callback_query(F.data == "result:xlsx")
 async def download_xlsx(callback: CallbackQuery, state: FSMContext) -> None:
-    if callback.message is None:
-        return
-    data = await state.get_data()
-    area = float(data.get("area", 0))
-    items = list(data.get("items", []))
-    total = float(data.get("total", 0))
-    price_per_m2 = float(data.get("price_per_m2", 0))
+    await _send_xlsx(callback, load_session(await state.get_data()))
 
-    if area <= 0 or not items:
-        await callback.answer("Сначала сделайте расчёт")
-        return
 
-    with tempfile.TemporaryDirectory() as tmp:
-        file_path = Path(tmp) / "estimate.xlsx"
-        build_estimate_xlsx(
-            path=file_path,
-            area=area,
-            items=items,
-            total=total,
-            price_per_m2=price_per_m2,
-        )
-
-        await callback.message.answer_document(
-            document=FSInputFile(str(file_path), filename="smeta.xlsx"),
-            caption="Смета в Excel",
-        )
-
-    await callback.answer()
+@router.callback_query(F.data.startswith("xlsx:"))
+async def download_shared_xlsx(callback: CallbackQuery) -> None:
+    decoded = await _session_from_token((callback.data or "")[len("xlsx:"):])
+    await _send_xlsx(callback, decoded[0] if decoded else None)
 
 
 @router.callback_query(F.data.in_({"calc:home", "calc:restart"}))
@@ -187,7 +329,7 @@ async def area_input(message: Message, state: FSMContext) -> None:
         return
 
     settings = Settings()
-    config = await get_config(settings.db_path)
+    version, config = await get_versioned_config(settings.db_path)
     limits = config.get("area_limits", {})
     min_a = float(limits.get("min", 20))
     max_a = float(limits.get("max", 1000))
@@ -196,7 +338,7 @@ async def area_input(message: Message, state: FSMContext) -> None:
         await _ui_edit_or_answer(message, state, f"Площадь должна быть от {int(min_a)} до {int(max_a)} м²")
         return
 
-    await state.update_data(area=float(area), items=[], extras=set())
+    await state.update_data(s=Session(version, float(area)))
     await state.set_state(CalcStates.choosing_foundation)
 
     foundations = config.get("foundation", [])
@@ -204,7 +346,7 @@ async def area_input(message: Message, state: FSMContext) -> None:
         message,
         state,
         "Выберите тип фундамента",
-        reply_markup=kb_options("foundation", foundations, area=float(area)),
+        reply_markup=kb_options("foundation", foundations, area=float(area), book=price_book(version, config)),
     )
 
     await _try_delete_user_message(message)
@@ -226,51 +368,93 @@ async def unexpected_text_during_buttons(message: Message, state: FSMContext) ->
     )
 
 
+@router.message(CalcStates.awaiting_contact)
+async def contact_input(message: Message, state: FSMContext, lead_queue: LeadQueue) -> None:
+    if message.contact is not None:
+        contact_text = fmt_lines([message.contact.phone_number, message.text or ""])
+    else:
+        contact_text = (message.text or "").strip()
+    if not contact_text:
+        await _ui_edit_or_answer(
+            message, state, "Напишите номер телефона и город текстом.", reply_markup=kb_back_to_result()
+        )
+        return
+
+    session = load_session(await state.get_data())
+    result = await _derive_result(session)
+    items, total = (result[0], result[1]) if result is not None else ([], None)
+    # The lead carries current prices; if the user last saw older ones, the reply names the total that was sent.
+    repriced = session is not None and result is not None and session.version != result[5]
+    saved = lead_queue.put(
+        user_id=message.from_user.id if message.from_user else None,
+        chat_id=message.chat.id,
+        username=message.from_user.username if message.from_user else None,
+        contact=contact_text[:500],
+        area=session.area if session is not None else None,
+        total=total,
+        items=items,
+    )
+    await _try_delete_user_message(message)
+    await state.set_state(CalcStates.showing_result)
+    if not saved:
+        await _ui_edit_or_answer(
+            message, state, "Не удалось сохранить заявку, попробуйте позже.", reply_markup=kb_back_to_result()
+        )
+        return
+    thanks = "Спасибо! Менеджер свяжется с вами в ближайшее время."
+    if repriced:
+        thanks += f"\n\nЦены обновились с момента расчёта, в заявке указана актуальная стоимость: {rub(total)}."
+    await _ui_edit_or_answer(message, state, thanks, reply_markup=kb_back_to_result())
+
+
 @router.message(CalcStates.showing_result)
 async def unexpected_text_on_result(message: Message, state: FSMContext) -> None:
     await _try_delete_user_message(message)
-    data = await state.get_data()
-    text = data.get("result_text")
-    if text:
-        await _ui_edit_or_answer(message, state, str(text), reply_markup=kb_result())
+    session = load_session(await state.get_data())
+    result = await _derive_result(session)
+    if session is not None and result is not None:
+        session = session._replace(version=result[5])
+        await state.update_data(s=session)
+        await _ui_edit_or_answer(message, state, result[3], reply_markup=await _result_markup(message.bot, session))
     else:
         await _ui_edit_or_answer(message, state, "Нажмите «Посчитать заново» чтобы начать", reply_markup=kb_result())
 
 
 @router.callback_query(F.data == "calc:back")
 async def go_back(callback: CallbackQuery, state: FSMContext) -> None:
-    data = await state.get_data()
+    session = load_session(await state.get_data())
     current = await state.get_state()
     if callback.message is None:
         return
 
     settings = Settings()
-    config = await get_config(settings.db_path)
-    area = float(data.get("area", 0))
+    version, config = await get_versioned_config(settings.db_path)
+    book = price_book(version, config)
+    area = session.area if session is not None else 0.0
     roof_coef = float(config.get("roof_coef", 1.0))
     if current == CalcStates.choosing_walls.state:
         await state.set_state(CalcStates.choosing_foundation)
         await callback.message.edit_text(
             "Выберите тип фундамента",
-            reply_markup=kb_options("foundation", config.get("foundation", []), area=area),
+            reply_markup=kb_options("foundation", config.get("foundation", []), area=area, book=book),
         )
     elif current == CalcStates.choosing_floors.state:
         await state.set_state(CalcStates.choosing_walls)
         await callback.message.edit_text(
             "Выберите тип стен",
-            reply_markup=kb_options("walls", config.get("walls", []), area=area),
+            reply_markup=kb_options("walls", config.get("walls", []), area=area, book=book),
         )
     elif current == CalcStates.choosing_roof.state:
         await state.set_state(CalcStates.choosing_floors)
         await callback.message.edit_text(
             "Выберите тип перекрытий",
-            reply_markup=kb_options("floors", config.get("floors", []), area=area),
+            reply_markup=kb_options("floors", config.get("floors", []), area=area, book=book),
         )
     elif current == CalcStates.choosing_extras.state:
         await state.set_state(CalcStates.choosing_roof)
         await callback.message.edit_text(
             "Выберите тип кровли",
-            reply_markup=kb_options("roof", config.get("roof", []), area=area, roof_coef=roof_coef),
+            reply_markup=kb_options("roof", config.get("roof", []), area=area, book=book, roof_coef=roof_coef),
         )
     else:
         await state.clear()
@@ -283,13 +467,6 @@ async def go_back(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer()
 
 
-def _find_item(items: list[dict[str, Any]], item_id: str) -> dict[str, Any] | None:
-    for it in items:
-        if str(it.get("id")) == item_id and it.get("enabled", True):
-            return it
-    return None
-
-
 @router.callback_query(F.data.startswith("pick:"))
 async def pick_option(callback: CallbackQuery, state: FSMContext) -> None:
     if callback.message is None:
@@ -300,65 +477,56 @@ async def pick_option(callback: CallbackQuery, state: FSMContext) -> None:
         return
 
     section, item_id = parts[1], parts[2]
+    if section not in SECTION_ORDER:
+        await callback.answer()
+        return
+    session = load_session(await state.get_data())
+    if session is None:
+        await callback.answer("Начните расчёт заново")
+        return
+
     settings = Settings()
-    config = await get_config(settings.db_path)
-    data = await state.get_data()
-    area = float(data.get("area", 0))
+    version, config = await get_versioned_config(settings.db_path)
+    area = session.area
 
-    section_items = config.get(section, [])
-    item = _find_item(section_items, item_id)
+    item = find_item(config.get(section, []), item_id)
     if item is None:
         await callback.answer("Пункт недоступен")
         return
 
-    items = list(data.get("items", []))
+    book = price_book(version, config)
     roof_coef = float(config.get("roof_coef", 1.0))
-
-    items = _drop_dependent(items, section)
-    await state.update_data(items=items, extras=set())
+    picks = list(_drop_dependent(session.picks, section))
+    picks[SECTION_ORDER.index(section)] = intern_id(item_id)
+    await state.update_data(s=session._replace(version=version, picks=tuple(picks), extras=()))
 
     item_area = area * roof_coef if section == "roof" else area
-
-    items.append(
-        {
-            "section": section,
-            "id": item_id,
-            "title": item.get("title", item_id),
-            "area": item_area,
-            "price": float(item.get("price", 0)),
-        }
-    )
-    await state.update_data(items=items)
-
-    cost = item_area * float(item.get("price", 0))
+    cost = item_area * book.price(section, item_id, area)
 
     if section == "foundation":
         await state.set_state(CalcStates.choosing_walls)
         await callback.message.edit_text(
             fmt_lines([f"Фундамент: {item.get('title')} — {rub(cost)}", "", "Выберите тип стен"]),
-            reply_markup=kb_options("walls", config.get("walls", []), area=area),
+            reply_markup=kb_options("walls", config.get("walls", []), area=area, book=book),
         )
     elif section == "walls":
         await state.set_state(CalcStates.choosing_floors)
         await callback.message.edit_text(
             fmt_lines([f"Стены: {item.get('title')} — {rub(cost)}", "", "Выберите тип перекрытий"]),
-            reply_markup=kb_options("floors", config.get("floors", []), area=area),
+            reply_markup=kb_options("floors", config.get("floors", []), area=area, book=book),
         )
     elif section == "floors":
         await state.set_state(CalcStates.choosing_roof)
         await callback.message.edit_text(
             fmt_lines([f"Перекрытия: {item.get('title')} — {rub(cost)}", "", "Выберите тип кровли"]),
-            reply_markup=kb_options("roof", config.get("roof", []), area=area, roof_coef=roof_coef),
+            reply_markup=kb_options("roof", config.get("roof", []), area=area, book=book, roof_coef=roof_coef),
         )
     elif section == "roof":
         await state.set_state(CalcStates.choosing_extras)
-        selected: set[str] = set(data.get("extras", set()))
         await callback.message.edit_text(
             fmt_lines([f"Кровля: {item.get('title')} — {rub(cost)}", "", "Дополнительные работы:"]),
-            reply_markup=kb_extras(config.get("extras", []), selected, area=area),
+            reply_markup=kb_extras(config.get("extras", []), set(), area=area, book=book),
         )
-    else:
-        await callback.message.edit_text("Ок")
 
     await callback.answer()
 
@@ -373,18 +541,24 @@ async def toggle_extra(callback: CallbackQuery, state: FSMContext) -> None:
         return
 
     extra_id = parts[2]
-    data = await state.get_data()
-    selected = set(data.get("extras", set()))
+    session = load_session(await state.get_data())
+    if session is None:
+        await callback.answer("Начните расчёт заново")
+        return
+    selected = set(session.extras)
     if extra_id in selected:
         selected.remove(extra_id)
     else:
-        selected.add(extra_id)
-    await state.update_data(extras=selected)
+        selected.add(intern_id(extra_id))
 
     settings = Settings()
-    config = await get_config(settings.db_path)
-    area = float(data.get("area", 0))
-    await callback.message.edit_reply_markup(reply_markup=kb_extras(config.get("extras", []), selected, area=area))
+    version, config = await get_versioned_config(settings.db_path)
+    await state.update_data(s=session._replace(version=version, extras=tuple(sorted(selected))))
+    await callback.message.edit_reply_markup(
+        reply_markup=kb_extras(
+            config.get("extras", []), selected, area=session.area, book=price_book(version, config)
+        )
+    )
     await callback.answer()
 
 
@@ -392,48 +566,25 @@ async def toggle_extra(callback: CallbackQuery, state: FSMContext) -> None:
 async def extras_done(callback: CallbackQuery, state: FSMContext) -> None:
     if callback.message is None:
         return
-    data = await state.get_data()
-    settings = Settings()
-    config = await get_config(settings.db_path)
-
-    area = float(data.get("area", 0))
-    selected = set(data.get("extras", set()))
-
-    items: list[dict[str, Any]] = list(data.get("items", []))
-
-    for extra in config.get("extras", []):
-        if not extra.get("enabled", True):
-            continue
-        extra_id = str(extra.get("id"))
-        if extra_id not in selected:
-            continue
-        items.append(
-            {
-                "section": "extras",
-                "id": extra_id,
-                "title": extra.get("title", extra_id),
-                "area": area,
-                "price": float(extra.get("price", 0)),
-            }
-        )
-
-    total = 0.0
-    for it in items:
-        it_area = float(it.get("area", 0))
-        total += it_area * float(it.get("price", 0))
+    session = load_session(await state.get_data())
+    result = await _derive_result(session)
+    if session is None or result is None:
+        await callback.answer("Начните расчёт заново")
+        return
+    items, total, price_per_m2, result_text, _, _ = result
 
-    price_per_m2 = total / area if area > 0 else 0.0
     await state.set_state(CalcStates.showing_result)
-    result_text = fmt_lines(
-        [
-            f"Площадь: {int(area)} м²",
-            f"Итого: {rub(total)}",
-            f"Цена за м²: {rub(price_per_m2)}",
-            "",
-            "Расчёт является предварительным и не является публичной офертой.",
-        ]
+    settings = Settings()
+    estimate_id = await save_estimate(
+        settings.db_path,
+        user_id=callback.from_user.id,
+        chat_id=callback.message.chat.id,
+        area=session.area,
+        total=total,
+        price_per_m2=price_per_m2,
+        items=items,
     )
-    await state.update_data(items=items, total=total, price_per_m2=price_per_m2, result_text=result_text)
+    await state.update_data(estimate_id=estimate_id)
 
-    await callback.message.edit_text(result_text, reply_markup=kb_result())
+    await callback.message.edit_text(result_text, reply_markup=await _result_markup(callback.bot, session))
     await callback.answer()
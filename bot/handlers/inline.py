@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from aiogram import Router
+from aiogram.types import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InlineQueryResultsButton,
+    InputTextMessageContent,
+)
+
+from bot.db import get_config_version, get_versioned_config
+from bot.quotes import Build, quotes
+from bot.settings import Settings
+from bot.tenants import current_name
+from bot.utils import fmt_lines, rub, safe_float
+
+router = Router(name=__name__)
+
+_CONFIG_TTL = 1.0
+
+# Per tenant: (checked at, version, config).
+_configs: dict[str, tuple[float, int, dict[str, Any]]] = {}
+
+
+async def _config() -> tuple[int, dict[str, Any]]:
+    # Inline queries arrive once per keystroke; within the TTL they are answered without touching SQLite,
+    # and after it the config is parsed again only if its version moved.
+    name = current_name()
+    now = time.monotonic()
+    cached = _configs.get(name)
+    if cached is not None and now - cached[0] < _CONFIG_TTL:
+        return cached[1], cached[2]
+    db_path = Settings().db_path
+    if cached is not None and await get_config_version(db_path) == cached[1]:
+        _configs[name] = (now, cached[1], cached[2])
+        return cached[1], cached[2]
+    version, config = await get_versioned_config(db_path)
+    _configs[name] = (now, version, config)
+    return version, config
+
+
+def _quote_text(build: Build, area: int) -> str:
+    return fmt_lines(
+        [
+            f"{build.label} — {area} м²",
+            *[f"• {o.title}: {rub(o.cost)}" for o in build.options],
+            f"Итого: {rub(build.total)} ({rub(build.total / area)} за м²)",
+            "Расчёт является предварительным и не является публичной офертой.",
+        ]
+    )
+
+
+@router.inline_query()
+async def inline_quote(inline_query: InlineQuery) -> None:
+    query = inline_query.query.strip()
+    area = safe_float(query) if query else None
+    if area is None:
+        await inline_query.answer(
+            [],
+            cache_time=300,
+            button=InlineQueryResultsButton(text="Введите площадь дома, например 120", start_parameter="inline"),
+        )
+        return
+
+    version, config = await _config()
+    limits = config.get("area_limits", {})
+    min_a = float(limits.get("min", 20))
+    max_a = float(limits.get("max", 1000))
+    if area < min_a or area > max_a:
+        await inline_query.answer(
+            [],
+            cache_time=300,
+            button=InlineQueryResultsButton(
+                text=f"Площадь должна быть от {int(min_a)} до {int(max_a)} м²",
+                start_parameter="inline",
+            ),
+        )
+        return
+
+    me = await inline_query.bot.me()
+    markup = InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="🧮 Подробный расчёт", url=f"https://t.me/{me.username}?start=calc")]]
+    )
+    rounded = int(round(area))
+    results = [
+        InlineQueryResultArticle(
+            id=f"{version}:{rounded}:{n}",
+            title=f"{build.label}: {rub(build.total)}",
+            description=", ".join(o.title for o in build.options),
+            input_message_content=InputTextMessageContent(message_text=_quote_text(build, rounded)),
+            reply_markup=markup,
+        )
+        for n, build in enumerate(quotes(config, version, area))
+    ]
+    await inline_query.answer(results, cache_time=60, is_personal=False)
@@ -4,6 +4,8 @@ from typing import Any
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from bot.pricing import PriceBook
+from bot.tracing import traced
 from bot.utils import rub
 
 
@@ -22,10 +24,18 @@ def kb_back_to_start() -> InlineKeyboardMarkup:
     )
 
 
-def kb_options(section: str, items: list[dict[str, Any]], *, area: float, roof_coef: float = 1.0) -> InlineKeyboardMarkup:
+@traced("keyboard")
+def kb_options(
+    section: str,
+    items: list[dict[str, Any]],
+    *,
+    area: float,
+    book: PriceBook,
+    roof_coef: float = 1.0,
+) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     for item in sorted([x for x in items if x.get("enabled", True)], key=lambda x: x.get("order", 0)):
-        price = float(item.get("price", 0) or 0)
+        price = book.price(section, str(item.get("id")), area)
         eff_area = area * roof_coef if section == "roof" else area
         cost = eff_area * price
         rows.append([
@@ -38,12 +48,13 @@ def kb_options(section: str, items: list[dict[str, Any]], *, area: float, roof_c
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def kb_extras(items: list[dict[str, Any]], selected: set[str], *, area: float) -> InlineKeyboardMarkup:
+@traced("keyboard")
+def kb_extras(items: list[dict[str, Any]], selected: set[str], *, area: float, book: PriceBook) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     for item in sorted([x for x in items if x.get("enabled", True)], key=lambda x: x.get("order", 0)):
         item_id = str(item.get("id"))
         title = str(item.get("title", item_id))
-        price = float(item.get("price", 0) or 0)
+        price = book.price("extras", item_id, area)
         cost = area * price
         mark = "✅" if item_id in selected else "⬜️"
         rows.append([
@@ -54,14 +65,19 @@ def kb_extras(items: list[dict[str, Any]], selected: set[str], *, area: float) -
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def kb_result() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📊 Скачать смету в Excel", callback_data="result:xlsx")],
-            [InlineKeyboardButton(text="🔁 Посчитать заново", callback_data="calc:restart")],
-            [InlineKeyboardButton(text="📞 Связаться с менеджером", callback_data="result:contact")],
-        ]
-    )
+def kb_result(token: str | None = None, share_url: str | None = None, *, notify: bool = False) -> InlineKeyboardMarkup:
+    # With a token the Excel button is self-contained and keeps working after the FSM session is gone.
+    xlsx_data = f"xlsx:{token}" if token else "result:xlsx"
+    rows = [
+        [InlineKeyboardButton(text="📊 Скачать смету в Excel", callback_data=xlsx_data)],
+        [InlineKeyboardButton(text="🔁 Посчитать заново", callback_data="calc:restart")],
+        [InlineKeyboardButton(text="📞 Связаться с менеджером", callback_data="result:contact")],
+    ]
+    if notify:
+        rows.append([InlineKeyboardButton(text="🔔 Следить за ценами", callback_data="result:notify")])
+    if share_url:
+        rows.append([InlineKeyboardButton(text="📤 Поделиться расчётом", url=share_url)])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
 def kb_back_to_result() -> InlineKeyboardMarkup:
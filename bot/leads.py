@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import json
+import logging
+from typing import Any, Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from bot import metrics
+from bot.db import fetch_undigested_leads, insert_leads, mark_leads_digested
+from bot.tenants import current_name
+from bot.utils import rub
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_LIMIT = 3800
+
+
+class LeadQueue:
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        max_size: int = 10_000,
+    ) -> None:
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue[tuple[Any, ...]] = asyncio.Queue(maxsize=max_size)
+
+    def put(
+        self,
+        *,
+        user_id: int | None,
+        chat_id: int | None,
+        username: str | None,
+        contact: str,
+        area: float | None,
+        total: float | None,
+        items: list[dict[str, Any]],
+    ) -> bool:
+        row = (
+            user_id,
+            chat_id,
+            username,
+            contact,
+            area,
+            total,
+            json.dumps(items, ensure_ascii=False),
+            dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            current_name(),
+        )
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            metrics.inc("leads_dropped_total")
+            logger.error("Lead queue is full, dropping lead from user %s", user_id)
+            return False
+        metrics.set_gauge("leads_queue_depth", self._queue.qsize())
+        return True
+
+    async def run(self) -> None:
+        batch: list[tuple[Any, ...]] = []
+        write: asyncio.Future[None] | None = None
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = asyncio.get_running_loop().time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - asyncio.get_running_loop().time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                # Shielded, so a cancelled task neither loses nor writes twice a batch that is being inserted.
+                write = asyncio.ensure_future(self._write(batch))
+                await asyncio.shield(write)
+                batch, write = [], None
+        except asyncio.CancelledError:
+            # Rows already taken off the queue are invisible to flush(), so they are written here.
+            if write is not None:
+                await write
+            elif batch:
+                await self._write(batch)
+            raise
+
+    async def flush(self) -> None:
+        batch: list[tuple[Any, ...]] = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._write(batch)
+
+    async def _write(self, batch: list[tuple[Any, ...]]) -> None:
+        try:
+            await insert_leads(self.db_path, batch)
+        except Exception:
+            logger.exception("Failed to persist %d leads, requeueing", len(batch))
+            for row in batch:
+                try:
+                    self._queue.put_nowait(row)
+                except asyncio.QueueFull:
+                    metrics.inc("leads_dropped_total")
+                    logger.error("Lead queue is full, dropping lead from user %s", row[0])
+            await asyncio.sleep(self.flush_interval)
+            return
+        metrics.inc("leads_saved_total", len(batch))
+        metrics.set_gauge("leads_queue_depth", self._queue.qsize())
+
+
+def format_digest(rows: Iterable[tuple[Any, ...]]) -> list[str]:
+    messages: list[str] = []
+    lines: list[str] = []
+    size = 0
+    for _, user_id, username, contact, area, total, created_at in rows:
+        who = f"@{username}" if username else f"id {user_id}"
+        estimate = f"{int(area)} м², {rub(total)}" if area and total else "без расчёта"
+        line = f"• {created_at} {who}: {contact} ({estimate})"
+        if lines and size + len(line) > _MESSAGE_LIMIT:
+            messages.append("\n".join(lines))
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        messages.append("\n".join(lines))
+    return messages
+
+
+async def digest_loop(bot: Bot, db_path: str, admin_ids: Iterable[int], *, interval: float = 300.0) -> None:
+    admins = list(admin_ids)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await send_digest(bot, db_path, admins)
+        except Exception:
+            logger.exception("Failed to send lead digest")
+
+
+async def send_digest(bot: Bot, db_path: str, admins: list[int]) -> int:
+    rows = await fetch_undigested_leads(db_path)
+    if not rows or not admins:
+        return 0
+    messages = format_digest(rows)
+    messages[0] = f"Новые заявки: {len(rows)}\n\n" + messages[0]
+    delivered = False
+    for admin_id in admins:
+        for text in messages:
+            try:
+                await bot.send_message(admin_id, text)
+            except TelegramAPIError as e:
+                logger.warning("Lead digest to %s failed: %s", admin_id, e)
+                break
+        else:
+            delivered = True
+    if not delivered:
+        # Left undigested, so the next round retries instead of losing the leads.
+        return 0
+    await mark_leads_digested(db_path, [int(r[0]) for r in rows])
+    metrics.inc("lead_digests_total")
+    return len(rows)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from typing import IO, Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware
+from aiogram.types import Chat, TelegramObject, Update
+
+from bot import metrics
+from bot.tenants import current_name
+
+logger = logging.getLogger(__name__)
+
+# Passed as extra= on high-volume info records; only those are subject to sampling.
+SAMPLED = {"sampled": True}
+
+_FIELDS = ("tenant", "update_id", "chat_id", "handler", "duration_ms")
+
+
+class UpdateContext:
+    __slots__ = ("update_id", "chat_id", "handler", "started")
+
+    def __init__(self, update_id: int, chat_id: int | None) -> None:
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.handler: str | None = None
+        self.started = time.perf_counter()
+
+
+_context: ContextVar[UpdateContext | None] = ContextVar("log_context", default=None)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        if random.random() < self.rate:
+            return True
+        metrics.inc("log_sampled_out_total")
+        return False
+
+
+class ContextFilter(logging.Filter):
+    # Runs in the thread that logs, where the update's context variables are still visible.
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.tenant = current_name() or None
+        ctx = _context.get()
+        if ctx is not None:
+            record.update_id = ctx.update_id
+            record.chat_id = ctx.chat_id
+            record.handler = ctx.handler
+            record.duration_ms = round((time.perf_counter() - ctx.started) * 1000, 2)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in _FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q: queue.Queue[logging.LogRecord], *, limit: int) -> None:
+        super().__init__(q)
+        self.limit = limit
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is rendered here, since its arguments may change after the call returns.
+        # JSON encoding, the traceback text and the write happen on the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # The queue itself is unbounded and the limit only applies to info and below: whatever lies above it
+        # is reserved for warnings and errors, which are never dropped and never make the event loop wait.
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.limit:
+            metrics.inc("log_dropped_total")
+            return
+        self.queue.put_nowait(record)
+
+
+_queue: queue.Queue[logging.LogRecord] | None = None
+
+
+def setup(
+    *,
+    level: str = "INFO",
+    sample_rate: float = 1.0,
+    queue_size: int = 10_000,
+    stream: IO[str] | None = None,
+) -> logging.handlers.QueueListener:
+    global _queue
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+    _queue = queue.Queue()
+    handler = AsyncQueueHandler(_queue, limit=queue_size)
+    handler.addFilter(SamplingFilter(sample_rate))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    # aiogram's own per-update line is replaced by the sampled "Update handled" record, which has more context.
+    logging.getLogger("aiogram.event").setLevel(max(root.level, logging.WARNING))
+    listener = logging.handlers.QueueListener(_queue, output)
+    listener.start()
+    return listener
+
+
+def collect_metrics() -> Iterator[metrics.Sample]:
+    if _queue is not None:
+        yield "log_queue_size", {}, float(_queue.qsize())
+
+
+class UpdateLogMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        chat: Chat | None = data.get("event_chat")
+        token = _context.set(UpdateContext(event.update_id, chat.id if chat is not None else None))
+        try:
+            result = await handler(event, data)
+        except Exception:
+            # Logged here, while the handler and duration are known; transports only swallow it.
+            logger.exception("Update failed")
+            raise
+        else:
+            logger.info("Update handled", extra=SAMPLED)
+            return result
+        finally:
+            _context.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        ctx = _context.get()
+        if ctx is not None:
+            callback = getattr(data.get("handler"), "callback", None)
+            ctx.handler = getattr(callback, "__name__", "unknown")
+        return await handler(event, data)
+
+
+def install(dp: Any) -> None:
+    dp.update.outer_middleware(UpdateLogMiddleware())
+    naming = HandlerNameMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in {"update", "error"}:
+            observer.middleware(naming)
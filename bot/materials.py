@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterable
+
+from bot.calc import LineItem
+from bot.pricing import PRICED_SECTIONS
+from bot.tenants import cache_key
+
+# Sparse coefficient row of one catalog item: (material index, quantity per m² of the item's area).
+Row = tuple[tuple[int, float], ...]
+
+_CACHE_SIZE = 64
+
+
+@dataclass(frozen=True)
+class MaterialLine:
+    material_id: str
+    title: str
+    unit: str
+    quantity: float
+    price: float
+
+    @property
+    def cost(self) -> float:
+        return self.quantity * self.price
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.material_id,
+            "title": self.title,
+            "unit": self.unit,
+            "quantity": self.quantity,
+            "price": self.price,
+        }
+
+
+def _coefficients(raw: Any) -> dict[str, float]:
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("materials must be an object")
+    coefs: dict[str, float] = {}
+    for material_id, value in raw.items():
+        coef = float(value)
+        if coef < 0:
+            raise ValueError("negative coefficient")
+        coefs[str(material_id)] = coef
+    return coefs
+
+
+class MaterialBook:
+    def __init__(self, config: dict[str, Any]) -> None:
+        catalog = [m for m in config.get("materials", []) if isinstance(m, dict)]
+        self.ids = [str(m.get("id")) for m in catalog]
+        self.titles = [str(m.get("title", m.get("id"))) for m in catalog]
+        self.units = [str(m.get("unit", "")) for m in catalog]
+        self.prices = [float(m.get("price", 0) or 0) for m in catalog]
+        index = {material_id: i for i, material_id in enumerate(self.ids)}
+        self._rows: dict[tuple[str, str], Row] = {}
+        for section in PRICED_SECTIONS:
+            for item in config.get(section, []):
+                try:
+                    coefs = _coefficients(item.get("materials"))
+                except (TypeError, ValueError):
+                    continue
+                row = tuple((index[m], c) for m, c in coefs.items() if m in index and c > 0)
+                if row:
+                    self._rows[(section, str(item.get("id")))] = row
+
+    def bill(self, items: Iterable[LineItem]) -> list[MaterialLine]:
+        # Quantities are the coefficient matrix times the per-item area vector; rows are sparse,
+        # so only the handful of non-zero coefficients of the picked items are touched.
+        quantities = [0.0] * len(self.ids)
+        for it in items:
+            for i, coef in self._rows.get((it.section, it.item_id), ()):
+                quantities[i] += coef * it.area
+        return [
+            MaterialLine(self.ids[i], self.titles[i], self.units[i], qty, self.prices[i])
+            for i, qty in enumerate(quantities)
+            if qty > 0
+        ]
+
+
+_books: dict[Hashable, MaterialBook] = {}
+
+
+def material_book(version: Hashable, config: dict[str, Any]) -> MaterialBook:
+    key = cache_key(version)
+    book = _books.get(key)
+    if book is None:
+        book = MaterialBook(config)
+        if len(_books) >= _CACHE_SIZE:
+            del _books[next(iter(_books))]
+        _books[key] = book
+    return book
+
+
+def check_config_materials(config: dict[str, Any]) -> None:
+    catalog = config.get("materials", [])
+    if not isinstance(catalog, list):
+        raise ValueError("materials")
+    known: set[str] = set()
+    for material in catalog:
+        if not isinstance(material, dict) or "id" not in material:
+            raise ValueError("materials")
+        try:
+            if float(material.get("price", 0) or 0) < 0:
+                raise ValueError
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"materials/{material.get('id')}") from e
+        known.add(str(material["id"]))
+    for section in PRICED_SECTIONS:
+        for item in config.get(section, []):
+            try:
+                coefs = _coefficients(item.get("materials"))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{section}/{item.get('id')}") from e
+            unknown = set(coefs) - known
+            if unknown:
+                raise ValueError(f"{section}/{item.get('id')}: {', '.join(sorted(unknown))}")
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable
+
+_sources: dict[str, Callable[[], dict[str, Any]]] = {}
+_lock = threading.Lock()
+_previous: tracemalloc.Snapshot | None = None
+_previous_at = 0.0
+
+# Allocation sites inside these files are bookkeeping of the profiler itself.
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def register_source(name: str, source: Callable[[], dict[str, Any]]) -> None:
+    _sources[name] = source
+
+
+def start(frames: int = 5) -> None:
+    global _previous, _previous_at
+    # Tracing costs CPU and memory on every allocation, so it stays off until someone asks for it.
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    with _lock:
+        _previous, _previous_at = None, 0.0
+
+
+def stop() -> None:
+    global _previous, _previous_at
+    tracemalloc.stop()
+    with _lock:
+        _previous, _previous_at = None, 0.0
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _cache_sizes() -> dict[str, int]:
+    from bot import deeplink, materials, pricing, quotes, tracing
+
+    return {
+        "price_books": len(pricing._books),
+        "material_books": len(materials._books),
+        "id_indexes": len(deeplink._indexes),
+        "quotes": len(quotes._quotes),
+        "trace_buffer": len(tracing._recent),
+    }
+
+
+def _site(stat: tracemalloc.Statistic | tracemalloc.StatisticDiff) -> str:
+    frame = stat.traceback[0]
+    filename = frame.filename
+    # site-packages/aiogram/... reads as aiogram/..., which keeps the admin message short.
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f"{filename}:{frame.lineno}"
+
+
+def _allocations(limit: int) -> dict[str, Any]:
+    global _previous, _previous_at
+    snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+    now = time.monotonic()
+    traced, peak = tracemalloc.get_traced_memory()
+    top = [
+        {"site": _site(stat), "size": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+    growth: list[dict[str, Any]] = []
+    with _lock:
+        previous, previous_at = _previous, _previous_at
+        _previous, _previous_at = snapshot, now
+    if previous is not None:
+        diff = [d for d in snapshot.compare_to(previous, "lineno") if d.size_diff > 0]
+        growth = [
+            {"site": _site(d), "size_diff": d.size_diff, "count_diff": d.count_diff, "size": d.size}
+            for d in diff[:limit]
+        ]
+    return {
+        "traced_bytes": traced,
+        "peak_bytes": peak,
+        "top": top,
+        "growth": growth,
+        "growth_window": round(now - previous_at, 1) if previous is not None else None,
+    }
+
+
+async def report(limit: int = 10) -> dict[str, Any]:
+    result: dict[str, Any] = {
+        "rss_bytes": _rss_bytes(),
+        "gc_counts": list(gc.get_count()),
+        "caches": _cache_sizes(),
+    }
+    for name, source in _sources.items():
+        result[name] = source()
+    # A snapshot of a large heap takes hundreds of milliseconds, which would stall every chat on the event loop.
+    result["tracemalloc"] = await asyncio.to_thread(_allocations, limit) if tracemalloc.is_tracing() else None
+    return result
+
+
+def _mb(value: float) -> str:
+    return f"{value / 1024 / 1024:.1f} МБ"
+
+
+def format_report(data: dict[str, Any]) -> str:
+    lines = [f"RSS: {_mb(data['rss_bytes'])}", f"GC: {data['gc_counts']}"]
+    fsm = data.get("fsm")
+    if fsm:
+        lines.append(f"FSM: сессий {fsm['sessions']}, ≈{_mb(fsm['bytes'])}")
+    lines.append("Кэши: " + ", ".join(f"{k} {v}" for k, v in data["caches"].items()))
+    trace = data.get("tracemalloc")
+    if trace is None:
+        lines.append("")
+        lines.append("tracemalloc выключен (/mem on)")
+        return "\n".join(lines)
+    lines.append("")
+    lines.append(f"tracemalloc: сейчас {_mb(trace['traced_bytes'])}, пик {_mb(trace['peak_bytes'])}")
+    lines.append("Крупнейшие места выделения:")
+    lines.extend(f"• {x['site']}: {x['size'] / 1024:.0f} КБ ({x['count']})" for x in trace["top"])
+    if trace["growth_window"] is not None:
+        lines.append("")
+        lines.append(f"Рост за {trace['growth_window']:.0f} с:")
+        lines.extend(f"• {x['site']}: +{x['size_diff'] / 1024:.0f} КБ (+{x['count_diff']})" for x in trace["growth"])
+        if not trace["growth"]:
+            lines.append("нет")
+    return "\n".join(lines)
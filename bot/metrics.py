@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import Callable, Iterable
+
+Sample = tuple[str, dict[str, str], float]
+
+_counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+_gauges: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+_collectors: list[Callable[[], Iterable[Sample]]] = []
+
+
+def inc(name: str, value: float = 1.0, **labels: str) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    _collectors.append(collector)
+
+
+def snapshot() -> list[Sample]:
+    samples: list[Sample] = []
+    for (name, labels), value in list(_counters.items()) + list(_gauges.items()):
+        samples.append((name, dict(labels), value))
+    for collector in _collectors:
+        samples.extend(collector())
+    return samples
+
+
+def render() -> str:
+    lines: list[str] = []
+    for name, labels, value in sorted(snapshot(), key=lambda x: (x[0], sorted(x[1].items()))):
+        if labels:
+            label_str = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+            lines.append(f"{name}{{{label_str}}} {value:g}")
+        else:
+            lines.append(f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
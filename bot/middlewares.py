@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Chat, TelegramObject, User
+
+from bot import metrics
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens: float, stamp: float) -> None:
+        self.tokens = tokens
+        self.stamp = stamp
+
+    def take(self, now: float, rate: float, burst: float) -> bool:
+        self.tokens = min(burst, self.tokens + (now - self.stamp) * rate)
+        self.stamp = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        *,
+        user_rate: float = 3.0,
+        user_burst: float = 6.0,
+        chat_rate: float = 5.0,
+        chat_burst: float = 10.0,
+        debounce: float = 0.7,
+        sweep_every: int = 10_000,
+    ) -> None:
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.debounce = debounce
+        self.sweep_every = sweep_every
+        self._users: dict[int, TokenBucket] = {}
+        self._chats: dict[int, TokenBucket] = {}
+        self._last_callback: dict[int, tuple[str, float]] = {}
+        self._calls = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        chat: Chat | None = data.get("event_chat")
+        now = time.monotonic()
+
+        self._calls += 1
+        if self._calls % self.sweep_every == 0:
+            self._sweep(now)
+
+        if isinstance(event, CallbackQuery) and user is not None:
+            last = self._last_callback.get(user.id)
+            self._last_callback[user.id] = (event.data or "", now)
+            if last is not None and last[0] == (event.data or "") and now - last[1] < self.debounce:
+                metrics.inc("throttle_debounced_total")
+                await event.answer()
+                return None
+
+        scope = None
+        if user is not None and not self._take(self._users, user.id, now, self.user_rate, self.user_burst):
+            scope = "user"
+        elif chat is not None and not self._take(self._chats, chat.id, now, self.chat_rate, self.chat_burst):
+            scope = "chat"
+
+        if scope is not None:
+            metrics.inc("throttle_dropped_total", scope=scope)
+            if isinstance(event, CallbackQuery):
+                await event.answer("Слишком часто, подождите секунду")
+            return None
+
+        metrics.inc("throttle_passed_total")
+        return await handler(event, data)
+
+    @staticmethod
+    def _take(buckets: dict[int, TokenBucket], key: int, now: float, rate: float, burst: float) -> bool:
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = TokenBucket(burst - 1.0, now)
+            return True
+        return bucket.take(now, rate, burst)
+
+    def _sweep(self, now: float) -> None:
+        # Buckets that have refilled completely carry no state and can be dropped.
+        for buckets, rate, burst in (
+            (self._users, self.user_rate, self.user_burst),
+            (self._chats, self.chat_rate, self.chat_burst),
+        ):
+            for key in [k for k, b in buckets.items() if b.tokens + (now - b.stamp) * rate >= burst]:
+                del buckets[key]
+        for key in [k for k, (_, ts) in self._last_callback.items() if now - ts >= self.debounce]:
+            del self._last_callback[key]
+
+    def collect_metrics(self) -> Iterator[metrics.Sample]:
+        # Read at scrape time; sweeps only run every sweep_every calls.
+        yield "throttle_tracked_keys", {}, float(len(self._users) + len(self._chats))
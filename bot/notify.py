@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import json
+import logging
+import time
+from typing import Any, Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from bot import metrics, tenants
+from bot.broadcast import BLOCKED, SENT, RateLimitedSender
+from bot.calc import SECTION_ORDER, build_line_items, estimate_totals, split_selection
+from bot.db import (
+    fetch_subscribed_estimates,
+    get_versioned_config,
+    has_unfinished_notify_job,
+    open_notify_job,
+    save_notify_job,
+    unsubscribe_chats,
+    update_notified_totals,
+)
+from bot.pricing import PriceBook, price_book
+from bot.settings import Settings
+from bot.utils import rub
+
+logger = logging.getLogger(__name__)
+
+# Keyed by tenant name: each tenant runs at most one job at a time.
+_tasks: dict[str, asyncio.Task] = {}
+_rerun: set[str] = set()
+
+
+def recompute(config: dict[str, Any], book: PriceBook, area: float, items_json: str) -> float | None:
+    picks, extras = split_selection(json.loads(items_json))
+    if not all(picks):
+        return None
+    line_items = build_line_items(config, area, picks, extras, book)
+    # A picked item that was disabled since would silently shrink the total; such estimates are skipped.
+    if sum(1 for it in line_items if it.section != "extras") != len(SECTION_ORDER):
+        return None
+    total, _ = estimate_totals(line_items, area)
+    return total
+
+
+def notify_text(area: float, old: float, new: float) -> str:
+    return (
+        f"Цены обновились: ваша смета на {int(area)} м² теперь {rub(new)} (было {rub(old)}).\n"
+        "Пересчитать: /start"
+    )
+
+
+async def run_price_notify_job(
+    bot: Bot,
+    db_path: str,
+    *,
+    threshold: float,
+    days: int,
+    rate: float,
+    admins: Iterable[int] = (),
+    page_size: int = 500,
+) -> tuple[int, int, int]:
+    version, config = await get_versioned_config(db_path)
+    job_id, _, cursor, sent, blocked, failed = await open_notify_job(db_path, version)
+    book = price_book(version, config)
+    since = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    sender = RateLimitedSender(bot, global_rate=rate)
+    started = time.monotonic()
+
+    while True:
+        rows = await fetch_subscribed_estimates(db_path, after_id=cursor, since=since, limit=page_size)
+        if not rows:
+            break
+        updates: list[tuple[float, int]] = []
+        targets: list[tuple[int, str]] = []
+        for estimate_id, chat_id, area, old_total, items_json in rows:
+            new_total = recompute(config, book, float(area), items_json)
+            if new_total is None or not old_total:
+                continue
+            if abs(new_total - old_total) / old_total < threshold:
+                continue
+            updates.append((new_total, int(estimate_id)))
+            targets.append((int(chat_id), notify_text(float(area), float(old_total), new_total)))
+
+        results = await asyncio.gather(*(sender.send(chat_id, text) for chat_id, text in targets))
+        blocked_chats = [chat_id for (chat_id, _), res in zip(targets, results) if res == BLOCKED]
+        sent += sum(1 for res in results if res == SENT)
+        blocked += len(blocked_chats)
+        failed += sum(1 for res in results if res not in {SENT, BLOCKED})
+
+        # Notified totals are stored even for failed sends so the next price change is compared to current
+        # prices; the estimate's own total keeps matching its line items.
+        if updates:
+            await update_notified_totals(db_path, updates)
+        if blocked_chats:
+            await unsubscribe_chats(db_path, blocked_chats)
+        cursor = int(rows[-1][0])
+        await save_notify_job(db_path, job_id, cursor=cursor, sent=sent, blocked=blocked, failed=failed)
+
+    await save_notify_job(db_path, job_id, cursor=cursor, sent=sent, blocked=blocked, failed=failed, done=True)
+    elapsed = time.monotonic() - started
+    per_second = sender.sent / elapsed if elapsed > 0 else 0.0
+    if sender.sent:
+        metrics.set_gauge("price_notify_sends_per_second", per_second)
+    logger.info(
+        "Price notify job %s done: sent=%s blocked=%s failed=%s rate=%.1f/s",
+        job_id, sent, blocked, failed, per_second,
+    )
+    report = (
+        f"Рассылка об изменении цен завершена.\n"
+        f"Отправлено: {sent}, заблокировали бота: {blocked}, ошибок: {failed}\n"
+        f"Скорость: {per_second:.1f} сообщ./с"
+    )
+    for admin_id in admins:
+        try:
+            await bot.send_message(admin_id, report)
+        except TelegramAPIError as e:
+            logger.warning("Price notify report to %s failed: %s", admin_id, e)
+    return sent, blocked, failed
+
+
+async def _run_until_settled(bot: Bot, settings: Settings) -> None:
+    name = tenants.current_name()
+    while True:
+        _rerun.discard(name)
+        try:
+            await run_price_notify_job(
+                bot,
+                settings.db_path,
+                threshold=settings.price_notify_threshold,
+                days=settings.price_notify_days,
+                rate=settings.broadcast_rate,
+                admins=tenants.current().admin_ids,
+            )
+        except Exception:
+            logger.exception("Price notify job failed")
+            return
+        if name not in _rerun:
+            return
+
+
+def schedule_price_notify(bot: Bot, settings: Settings) -> bool:
+    # A single job runs at a time; changes made while it runs trigger one more pass with the newest prices.
+    if settings.price_notify_threshold <= 0:
+        return False
+    name = tenants.current_name()
+    task = _tasks.get(name)
+    if task is not None and not task.done():
+        _rerun.add(name)
+        return True
+    _tasks[name] = asyncio.create_task(_run_until_settled(bot, settings))
+    return True
+
+
+async def resume_price_notify(bot: Bot, settings: Settings) -> None:
+    if await has_unfinished_notify_job(settings.db_path):
+        logger.info("Resuming unfinished price notify job")
+        schedule_price_notify(bot, settings)
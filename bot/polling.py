@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Update
+
+from bot.db import inbox_commit, inbox_load
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: Update) -> int:
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        message = getattr(event, "message", None)
+        chat = getattr(message, "chat", None)
+    if chat is not None:
+        return int(chat.id)
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return int(user.id)
+    return 0
+
+
+class Poller:
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        *,
+        db_path: str,
+        limit: int = 100,
+        timeout: int = 25,
+        concurrency: int = 32,
+        max_pending: int = 1000,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.bot = bot
+        self.dp = dp
+        self.db_path = db_path
+        self.limit = limit
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._sem = asyncio.Semaphore(concurrency)
+        self._tails: dict[int, asyncio.Task] = {}
+        self._pending = 0
+        self._drained = asyncio.Event()
+        self._done: list[int] = []
+        self._offset: int | None = None
+
+    async def run(self) -> None:
+        await self.bot.delete_webhook(drop_pending_updates=False)
+        self._offset, pending = await inbox_load(self.db_path)
+        if pending:
+            logger.info("Resuming %d unprocessed updates", len(pending))
+        for _, payload in pending:
+            self._dispatch(Update.model_validate_json(payload, context={"bot": self.bot}))
+
+        flusher = asyncio.create_task(self._flush_loop())
+        try:
+            await self._fetch_loop()
+        finally:
+            flusher.cancel()
+            await self.drain()
+
+    async def drain(self) -> None:
+        tasks = list(self._tails.values())
+        if tasks:
+            await asyncio.wait(tasks)
+        await self._flush()
+
+    async def _fetch_loop(self) -> None:
+        allowed = self.dp.resolve_used_update_types()
+        delay = 1.0
+        while True:
+            while self._pending >= self.max_pending:
+                self._drained.clear()
+                await self._drained.wait()
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self._offset,
+                    limit=self.limit,
+                    timeout=self.timeout,
+                    allowed_updates=allowed,
+                    request_timeout=self.timeout + 10,
+                )
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except Exception as e:
+                logger.error("Failed to fetch updates - %s: %s", type(e).__name__, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            if not updates:
+                delay = 1.0
+                continue
+
+            # Updates must be on disk before the next getUpdates call confirms them on the server.
+            # Finished ids ride along in the same transaction, so the flush loop is only a fallback.
+            offset = updates[-1].update_id + 1
+            done, self._done = self._done, []
+            try:
+                await inbox_commit(
+                    self.db_path,
+                    received=[(u.update_id, u.model_dump_json(exclude_none=True)) for u in updates],
+                    done=done,
+                    offset=offset,
+                )
+            except Exception as e:
+                # Nothing was confirmed: the same batch is fetched again with the old offset.
+                self._done = done + self._done
+                logger.error("Failed to store fetched updates - %s: %s", type(e).__name__, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            delay = 1.0
+            self._offset = offset
+            for update in updates:
+                self._dispatch(update)
+
+    def _dispatch(self, update: Update) -> None:
+        key = chat_key(update)
+        task = asyncio.create_task(self._process(update, self._tails.get(key)))
+        self._tails[key] = task
+        self._pending += 1
+
+        def _release(t: asyncio.Task) -> None:
+            if self._tails.get(key) is t:
+                del self._tails[key]
+            self._pending -= 1
+            if self._pending < self.max_pending:
+                self._drained.set()
+
+        task.add_done_callback(_release)
+
+    async def _process(self, update: Update, prev: asyncio.Task | None) -> None:
+        if prev is not None:
+            await asyncio.wait([prev])
+        async with self._sem:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                pass  # already logged with its traceback by logs.UpdateLogMiddleware
+        self._done.append(update.update_id)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Failed to flush processed updates")
+
+    async def _flush(self) -> None:
+        if not self._done:
+            return
+        done, self._done = self._done, []
+        try:
+            await inbox_commit(self.db_path, received=[], done=done, offset=None)
+        except Exception:
+            # Kept for the next flush; dropping them would replay finished updates after a restart.
+            self._done = done + self._done
+            raise
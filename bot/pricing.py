@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import Any, Hashable
+
+from bot.tenants import cache_key
+
+PRICED_SECTIONS: tuple[str, ...] = ("foundation", "walls", "floors", "roof", "extras")
+
+# (breakpoints, prices, base price): area >= breakpoints[i] costs prices[i], below the first one the base price.
+Table = tuple[list[float], list[float], float]
+
+_CACHE_SIZE = 64
+
+
+def parse_tiers(text: str) -> list[dict[str, float]]:
+    text = text.strip()
+    if text in {"", "-"}:
+        return []
+    tiers: list[dict[str, float]] = []
+    for chunk in text.split(","):
+        bound, sep, price = chunk.partition(":")
+        if not sep:
+            raise ValueError(chunk)
+        tiers.append({"from": float(bound.strip()), "price": float(price.strip())})
+    return normalize_tiers(tiers)
+
+
+def normalize_tiers(raw: Any) -> list[dict[str, float]]:
+    if raw is None:
+        return []
+    if not isinstance(raw, list):
+        raise ValueError("tiers must be a list")
+    tiers: dict[float, float] = {}
+    for tier in raw:
+        bound = float(tier["from"])
+        price = float(tier["price"])
+        if bound < 0 or price < 0:
+            raise ValueError("negative tier")
+        tiers[bound] = price
+    return [{"from": b, "price": tiers[b]} for b in sorted(tiers)]
+
+
+def format_tiers(tiers: list[dict[str, Any]]) -> str:
+    if not tiers:
+        return "нет"
+    return ", ".join(f"от {float(t['from']):g} м² — {float(t['price']):g}" for t in tiers)
+
+
+def compile_table(item: dict[str, Any]) -> Table:
+    base = float(item.get("price", 0) or 0)
+    try:
+        tiers = normalize_tiers(item.get("tiers"))
+    except (KeyError, TypeError, ValueError):
+        tiers = []
+    return [t["from"] for t in tiers], [t["price"] for t in tiers], base
+
+
+class PriceBook:
+    def __init__(self, config: dict[str, Any]) -> None:
+        self._tables: dict[tuple[str, str], Table] = {}
+        for section in PRICED_SECTIONS:
+            for item in config.get(section, []):
+                self._tables[(section, str(item.get("id")))] = compile_table(item)
+
+    def table(self, section: str, item_id: str) -> Table | None:
+        return self._tables.get((section, item_id))
+
+    def price(self, section: str, item_id: str, area: float) -> float:
+        table = self._tables.get((section, item_id))
+        if table is None:
+            return 0.0
+        bounds, prices, base = table
+        if not bounds:
+            return base
+        idx = bisect_right(bounds, area) - 1
+        return prices[idx] if idx >= 0 else base
+
+
+_books: dict[Hashable, PriceBook] = {}
+
+
+def price_book(version: Hashable, config: dict[str, Any]) -> PriceBook:
+    key = cache_key(version)
+    book = _books.get(key)
+    if book is None:
+        book = PriceBook(config)
+        if len(_books) >= _CACHE_SIZE:
+            del _books[next(iter(_books))]
+        _books[key] = book
+    return book
+
+
+def check_config_tiers(config: dict[str, Any]) -> None:
+    for section in PRICED_SECTIONS:
+        for item in config.get(section, []):
+            try:
+                normalize_tiers(item.get("tiers"))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"{section}/{item.get('id')}") from e
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import heapq
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator, NamedTuple
+
+from bot import metrics
+from bot.calc import SECTION_ORDER, roof_area
+from bot.pricing import price_book
+from bot.tenants import cache_key
+
+_CACHE_SIZE = 512
+
+
+class Option(NamedTuple):
+    cost: float
+    item_id: str
+    title: str
+
+
+class Build(NamedTuple):
+    label: str
+    total: float
+    options: tuple[Option, ...]
+
+
+def section_options(config: dict[str, Any], version: Hashable, area: float) -> list[list[Option]]:
+    # Tiers make the price order depend on the area, so the arrays are sorted per quoted area.
+    book = price_book(version, config)
+    roof_coef = float(config.get("roof_coef", 1.0))
+    sections: list[list[Option]] = []
+    for section in SECTION_ORDER:
+        eff_area = roof_area(area, roof_coef) if section == "roof" else area
+        options: list[Option] = []
+        for it in config.get(section, []):
+            if not it.get("enabled", True):
+                continue
+            item_id = str(it.get("id"))
+            cost = eff_area * book.price(section, item_id, area)
+            options.append(Option(cost, item_id, str(it.get("title", item_id))))
+        options.sort()
+        sections.append(options)
+    return sections
+
+
+def cheapest_builds(sections: list[list[Option]]) -> Iterator[tuple[float, tuple[int, ...]]]:
+    # Best-first walk over index vectors: each successor bumps one section to its next dearer option.
+    if not sections or not all(sections):
+        return
+    start = (0,) * len(sections)
+    heap = [(sum(s[0].cost for s in sections), start)]
+    seen = {start}
+    while heap:
+        total, idx = heapq.heappop(heap)
+        yield total, idx
+        for pos, options in enumerate(sections):
+            if idx[pos] + 1 >= len(options):
+                continue
+            nxt = idx[:pos] + (idx[pos] + 1,) + idx[pos + 1:]
+            if nxt in seen:
+                continue
+            seen.add(nxt)
+            heapq.heappush(heap, (total - options[idx[pos]].cost + options[idx[pos] + 1].cost, nxt))
+
+
+def _build(label: str, sections: list[list[Option]], idx: tuple[int, ...]) -> Build:
+    options = tuple(s[i] for s, i in zip(sections, idx))
+    return Build(label, sum(o.cost for o in options), options)
+
+
+def compute_quotes(config: dict[str, Any], version: Hashable, area: float, *, alternatives: int = 2) -> list[Build]:
+    sections = section_options(config, version, area)
+    if not sections or not all(sections):
+        return []
+    builds: list[Build] = []
+    for n, (_, idx) in enumerate(cheapest_builds(sections)):
+        if n > alternatives:
+            break
+        builds.append(_build("Эконом" if n == 0 else f"Эконом, вариант {n + 1}", sections, idx))
+    for label, idx in (
+        ("Оптимальный", tuple(len(s) // 2 for s in sections)),
+        ("Премиум", tuple(len(s) - 1 for s in sections)),
+    ):
+        build = _build(label, sections, idx)
+        if all(build.options != b.options for b in builds):
+            builds.append(build)
+    return builds
+
+
+_quotes: OrderedDict[tuple[tuple[str, Hashable], int], list[Build]] = OrderedDict()
+
+
+def quotes(config: dict[str, Any], version: Hashable, area: float) -> list[Build]:
+    key = (cache_key(version), int(round(area)))
+    cached = _quotes.get(key)
+    if cached is not None:
+        _quotes.move_to_end(key)
+        metrics.inc("quote_cache_total", result="hit")
+        return cached
+    metrics.inc("quote_cache_total", result="miss")
+    builds = compute_quotes(config, version, float(key[1]))
+    _quotes[key] = builds
+    if len(_quotes) > _CACHE_SIZE:
+        _quotes.popitem(last=False)
+    return builds
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from typing import Any, BinaryIO
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+_ID_OWNERS = {"from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat"}
+_NAME_FIELDS = {"first_name", "last_name", "username", "title"}
+_DROP_FIELDS = {"contact", "location", "venue", "phone_number", "email", "entities", "caption_entities"}
+# Short enough for an area, too short for a phone number typed as digits.
+_SAFE_TEXT = re.compile(r"^[\d\s.,]{1,7}$")
+_COMMAND = re.compile(r"^(/\w+(?:@\w+)?)(?:\s+(.*))?$", re.DOTALL)
+# Callback data carrying a signed share token; the prefix is kept, the token is not.
+_TOKEN_PREFIXES = ("xlsx:",)
+
+
+def _mask_text(value: str) -> str:
+    if _SAFE_TEXT.match(value):
+        return value
+    command = _COMMAND.match(value)
+    if command is not None:
+        # The command is kept for replays; its argument (e.g. a /start token) may identify the user.
+        arg = command.group(2)
+        return f"{command.group(1)} <arg:{len(arg)}>" if arg else command.group(1)
+    return f"<text:{len(value)}>"
+
+
+def _mask_data(value: str) -> str:
+    for prefix in _TOKEN_PREFIXES:
+        if value.startswith(prefix):
+            return f"{prefix}<token:{len(value) - len(prefix)}>"
+    return value
+
+
+class UpdateRecorder:
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_bytes: int = 50 * 1024 * 1024,
+        keep: int = 5,
+        flush_every: int = 100,
+        queue_size: int = 10_000,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.flush_every = flush_every
+        self.queue_size = queue_size
+        # Per-process key: ids stay consistent inside a recording but cannot be reversed.
+        self._salt = secrets.token_bytes(16)
+        self._raw: BinaryIO | None = None
+        self._gz: gzip.GzipFile | None = None
+        self._pending = 0
+        # Anonymizing, compression, flushes and rotation run on this thread, never on the event loop.
+        self._queue: queue.SimpleQueue[tuple[float, dict[str, Any]] | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="update-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, update: dict[str, Any]) -> None:
+        # The webhook handler does not modify the parsed body, so the dict can be handed over as is.
+        if self._queue.qsize() >= self.queue_size:
+            metrics.inc("recorder_dropped_total")
+            return
+        self._queue.put((time.time(), update))
+
+    def close(self) -> None:
+        # Blocks until the queued updates are written; call it from a worker thread.
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not None:
+            ts, update = item
+            try:
+                self._write(json.dumps({"ts": ts, "update": self._anonymize(update)}, ensure_ascii=False))
+            except Exception:
+                logger.exception("Failed to record update")
+        self._close_file()
+
+    def _write(self, line: str) -> None:
+        gz = self._open()
+        gz.write(line.encode("utf-8") + b"\n")
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            gz.flush()
+            self._pending = 0
+            if self._raw is not None and self._raw.tell() >= self.max_bytes:
+                self._rotate()
+
+    def _close_file(self) -> None:
+        if self._gz is not None:
+            self._gz.close()
+        if self._raw is not None:
+            self._raw.close()
+        self._gz = None
+        self._raw = None
+
+    def _open(self) -> gzip.GzipFile:
+        if self._gz is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._raw = open(self.path, "ab")
+            self._gz = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        return self._gz
+
+    def _rotate(self) -> None:
+        self._close_file()
+        for i in range(self.keep - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _hash_id(self, value: int) -> int:
+        digest = hmac.new(self._salt, str(value).encode(), hashlib.sha256).digest()
+        hashed = int.from_bytes(digest[:6], "big")
+        return -hashed if value < 0 else hashed
+
+    def _anonymize(self, obj: Any, owner: str = "") -> Any:
+        if isinstance(obj, list):
+            return [self._anonymize(x, owner) for x in obj]
+        if not isinstance(obj, dict):
+            return obj
+        out: dict[str, Any] = {}
+        for key, value in obj.items():
+            if key in _DROP_FIELDS:
+                continue
+            if key == "id" and owner in _ID_OWNERS and isinstance(value, int):
+                out[key] = self._hash_id(value)
+            elif key in {"chat_id", "user_id"} and isinstance(value, int):
+                out[key] = self._hash_id(value)
+            elif key in _NAME_FIELDS and owner in _ID_OWNERS:
+                out[key] = "anon"
+            elif key in {"text", "caption"} and isinstance(value, str):
+                out[key] = _mask_text(value)
+            elif key == "query" and isinstance(value, str):
+                # Inline queries are free text with no command form; only a bare area survives.
+                out[key] = value if _SAFE_TEXT.match(value) else f"<text:{len(value)}>"
+            elif key in {"data", "callback_data"} and isinstance(value, str):
+                out[key] = _mask_data(value)
+            elif key == "url" and isinstance(value, str):
+                # Share buttons on the bot's own messages carry the same token in a t.me link.
+                out[key] = f"<url:{len(value)}>"
+            else:
+                out[key] = self._anonymize(value, key)
+        return out
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import sys
+from typing import Any, NamedTuple
+
+from bot.calc import SECTION_ORDER
+
+NO_PICKS: tuple[str, ...] = ("",) * len(SECTION_ORDER)
+
+
+class Session(NamedTuple):
+    # Stored as-is in FSM data: a flat tuple of interned ids instead of per-item dicts.
+    version: int
+    area: float
+    picks: tuple[str, ...] = NO_PICKS
+    extras: tuple[str, ...] = ()
+
+
+def intern_id(item_id: str) -> str:
+    return sys.intern(str(item_id))
+
+
+def load_session(data: dict[str, Any]) -> Session | None:
+    raw = data.get("s")
+    if raw is None:
+        return None
+    if isinstance(raw, Session):
+        return raw
+    # JSON-backed storages hand the tuple back as nested lists.
+    version, area, picks, extras = raw
+    return Session(
+        int(version),
+        float(area),
+        tuple(intern_id(x) for x in picks),
+        tuple(intern_id(x) for x in extras),
+    )
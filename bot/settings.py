@@ -8,10 +8,66 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
-    bot_token: str
+    # Optional when TENANTS_FILE lists the bots; load_tenants checks that one of the two is set.
+    bot_token: str = ""
     admin_ids: str = ""
     db_path: str = "bot.db"
 
+    transport: str = "webhook"
+    polling_limit: int = 100
+    polling_timeout: int = 25
+    polling_concurrency: int = 32
+
+    throttle_user_rate: float = 3.0
+    throttle_user_burst: float = 6.0
+    throttle_chat_rate: float = 5.0
+    throttle_chat_burst: float = 10.0
+    throttle_debounce: float = 0.7
+
+    fsm_session_ttl: float = 86400.0
+    fsm_max_bytes: int = 64 * 1024 * 1024
+
+    record_updates_path: str = ""
+    record_max_bytes: int = 50 * 1024 * 1024
+    record_keep: int = 5
+
+    trace_sample_rate: float = 0.1
+
+    log_level: str = "INFO"
+    log_sample_rate: float = 0.1
+    log_queue_size: int = 10_000
+
+    lead_digest_interval: float = 300.0
+
+    price_notify_threshold: float = 0.0
+    price_notify_days: int = 30
+    broadcast_rate: float = 25.0
+
+    share_secret: str = ""
+
+    tenants_file: str = ""
+    tenant_max_inflight: int = 64
+
+    admit_cheap_concurrency: int = 64
+    admit_cheap_queue: int = 256
+    admit_text_concurrency: int = 32
+    admit_text_queue: int = 128
+    admit_document_concurrency: int = 4
+    admit_document_queue: int = 16
+    admit_admin_concurrency: int = 2
+    admit_admin_queue: int = 8
+    admit_max_wait: float = 5.0
+
+    debug_token: str = ""
+
+    api_tokens: str = ""
+    api_batch_max: int = 100
+    api_cache_size: int = 4096
+    api_version_ttl: float = 1.0
+
+    def api_token_set(self) -> FrozenSet[str]:
+        return frozenset(x.strip() for x in self.api_tokens.split(",") if x.strip())
+
     def admin_id_set(self) -> FrozenSet[int]:
         raw = [x.strip() for x in self.admin_ids.split(",") if x.strip()]
         ids: set[int] = set()
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot.metrics import Sample
+from bot.tracing import traced
+from bot.utils import approx_size
+
+# Rough cost of the StorageKey, the record object and the OrderedDict slot.
+_RECORD_OVERHEAD = 400
+
+
+class _Record:
+    __slots__ = ("state", "data", "size", "touched")
+
+    def __init__(self, touched: float) -> None:
+        self.state: str | None = None
+        self.data: dict[str, Any] = {}
+        self.size = _RECORD_OVERHEAD
+        self.touched = touched
+
+
+class BoundedMemoryStorage(BaseStorage):
+    def __init__(self, *, ttl: float = 86400.0, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Ordered by last access, so the head is both the LRU entry and the oldest idle one.
+        self._records: OrderedDict[StorageKey, _Record] = OrderedDict()
+        self.total_bytes = 0
+        self.evicted = {"ttl": 0, "size": 0}
+
+    async def close(self) -> None:
+        self._records.clear()
+        self.total_bytes = 0
+
+    @traced("fsm.set_state")
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        record = self._touch(key, create=value is not None)
+        if record is None:
+            return
+        record.state = value
+        self._store(key, record)
+
+    @traced("fsm.get_state")
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = self._touch(key)
+        return record.state if record is not None else None
+
+    @traced("fsm.set_data")
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        record = self._touch(key, create=bool(data))
+        if record is None:
+            return
+        record.data = data.copy()
+        self._store(key, record)
+
+    @traced("fsm.get_data")
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = self._touch(key)
+        return record.data.copy() if record is not None else {}
+
+    def stats(self) -> tuple[int, int]:
+        return len(self._records), self.total_bytes
+
+    def collect_metrics(self) -> Iterable[Sample]:
+        self._expire(time.monotonic())
+        yield "fsm_sessions", {}, float(len(self._records))
+        yield "fsm_bytes", {}, float(self.total_bytes)
+        for reason, count in self.evicted.items():
+            yield "fsm_evicted_total", {"reason": reason}, float(count)
+
+    def _touch(self, key: StorageKey, *, create: bool = False) -> _Record | None:
+        now = time.monotonic()
+        self._expire(now)
+        record = self._records.get(key)
+        if record is None:
+            if not create:
+                return None
+            record = _Record(now)
+            self._records[key] = record
+            self.total_bytes += record.size
+            return record
+        record.touched = now
+        self._records.move_to_end(key)
+        return record
+
+    def _store(self, key: StorageKey, record: _Record) -> None:
+        if record.state is None and not record.data:
+            self._drop(key)
+            return
+        size = _RECORD_OVERHEAD + approx_size(record.data) + (len(record.state) if record.state else 0)
+        self.total_bytes += size - record.size
+        record.size = size
+        while self.total_bytes > self.max_bytes and len(self._records) > 1:
+            self._drop(next(iter(self._records)))
+            self.evicted["size"] += 1
+
+    def _expire(self, now: float) -> None:
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if now - record.touched < self.ttl:
+                return
+            self._drop(key)
+            self.evicted["ttl"] += 1
+
+    def _drop(self, key: StorageKey) -> None:
+        record = self._records.pop(key, None)
+        if record is not None:
+            self.total_bytes -= record.size
+
+
+class TenantStorage(BaseStorage):
+    # Routes by bot id so every tenant gets its own TTL/size budget and one tenant cannot evict another's sessions.
+    def __init__(self, storages: dict[int, tuple[str, BoundedMemoryStorage]]) -> None:
+        self._storages = storages
+
+    def _for(self, key: StorageKey) -> BoundedMemoryStorage:
+        return self._storages[key.bot_id][1]
+
+    async def close(self) -> None:
+        for _, storage in self._storages.values():
+            await storage.close()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._for(key).set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self._for(key).get_state(key)
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        await self._for(key).set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return await self._for(key).get_data(key)
+
+    def collect_metrics(self) -> Iterable[Sample]:
+        for label, storage in self._storages.values():
+            for name, labels, value in storage.collect_metrics():
+                yield name, {**labels, "tenant": label}, value
+
+    def stats(self) -> tuple[int, int]:
+        sessions = size = 0
+        for _, storage in self._storages.values():
+            count, total = storage.stats()
+            sessions += count
+            size += total
+        return sessions, size
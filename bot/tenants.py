@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Iterator, NamedTuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot import metrics
+from bot.settings import Settings
+
+DEFAULT = ""
+_NAME = re.compile(r"^[a-z0-9_-]{1,32}$")
+
+
+class Tenant(NamedTuple):
+    name: str
+    bot_token: str
+    admin_ids: frozenset[int]
+    share_secret: str = ""
+    api_tokens: frozenset[str] = frozenset()
+
+    @property
+    def bot_id(self) -> int:
+        return int(self.bot_token.split(":", 1)[0])
+
+    @property
+    def label(self) -> str:
+        return self.name or "default"
+
+
+_current: ContextVar[Tenant | None] = ContextVar("tenant", default=None)
+
+
+def default_tenant(settings: Settings) -> Tenant:
+    return Tenant(DEFAULT, settings.bot_token, settings.admin_id_set(), settings.share_secret, settings.api_token_set())
+
+
+def current() -> Tenant:
+    tenant = _current.get()
+    return tenant if tenant is not None else default_tenant(Settings())
+
+
+def current_name() -> str:
+    tenant = _current.get()
+    return tenant.name if tenant is not None else DEFAULT
+
+
+def config_key(name: str | None = None) -> str:
+    name = current_name() if name is None else name
+    return f"app_config:{name}" if name else "app_config"
+
+
+def cache_key(version: Hashable) -> tuple[str, Hashable]:
+    # Versions are per-namespace counters, so caches must not share entries across tenants.
+    return current_name(), version
+
+
+@contextmanager
+def use_tenant(tenant: Tenant) -> Iterator[None]:
+    token = _current.set(tenant)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def load_tenants(settings: Settings) -> list[Tenant]:
+    if not settings.tenants_file:
+        if not settings.bot_token:
+            raise ValueError("set BOT_TOKEN, or TENANTS_FILE for several bots")
+        return [default_tenant(settings)]
+    with open(settings.tenants_file, encoding="utf-8") as f:
+        raw = json.load(f)
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("tenants file must be a non-empty JSON list")
+    tenants: list[Tenant] = []
+    for entry in raw:
+        name = str(entry.get("name", ""))
+        if not _NAME.match(name):
+            raise ValueError(f"bad tenant name: {name!r}")
+        admins = entry.get("admin_ids", [])
+        if isinstance(admins, str):
+            admins = [x for x in admins.split(",") if x.strip()]
+        api_tokens = entry.get("api_tokens", [])
+        if isinstance(api_tokens, str):
+            api_tokens = api_tokens.split(",")
+        tenants.append(
+            Tenant(
+                name=name,
+                bot_token=str(entry["bot_token"]),
+                admin_ids=frozenset(int(x) for x in admins),
+                share_secret=str(entry.get("share_secret", "")),
+                api_tokens=frozenset(str(x).strip() for x in api_tokens if str(x).strip()),
+            )
+        )
+    if len({t.name for t in tenants}) != len(tenants) or len({t.bot_id for t in tenants}) != len(tenants):
+        raise ValueError("tenant names and bot tokens must be unique")
+    api_tokens = [token for t in tenants for token in t.api_tokens]
+    if len(set(api_tokens)) != len(api_tokens):
+        # The token alone picks the tenant's catalog, so it cannot be shared.
+        raise ValueError("api tokens must be unique across tenants")
+    return tenants
+
+
+class TenantMiddleware(BaseMiddleware):
+    def __init__(self, tenants: Iterable[Tenant], *, max_inflight: int = 64) -> None:
+        self._tenants = {t.bot_id: t for t in tenants}
+        # Per-tenant slots keep one busy brand from taking every worker from the others.
+        self._slots = {bot_id: asyncio.Semaphore(max_inflight) for bot_id in self._tenants}
+        self._inflight = {t.label: 0 for t in self._tenants.values()}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        bot = data.get("bot")
+        tenant = self._tenants.get(getattr(bot, "id", 0))
+        if tenant is None:
+            return await handler(event, data)
+        label = tenant.label
+        started = time.perf_counter()
+        async with self._slots[tenant.bot_id]:
+            self._inflight[label] += 1
+            try:
+                with use_tenant(tenant):
+                    return await handler(event, data)
+            finally:
+                self._inflight[label] -= 1
+                metrics.inc("tenant_updates_total", tenant=label)
+                metrics.inc("tenant_update_seconds_total", time.perf_counter() - started, tenant=label)
+
+    def collect_metrics(self) -> Iterator[metrics.Sample]:
+        for label, count in self._inflight.items():
+            yield "tenant_inflight", {"tenant": label}, float(count)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+BUCKET_SECONDS = 60
+BUCKETS_KEPT = 60
+
+
+class Trace:
+    __slots__ = ("update_id", "handler", "started", "duration", "stages")
+
+    def __init__(self, update_id: int) -> None:
+        self.update_id = update_id
+        self.handler = "unhandled"
+        self.started = time.time()
+        self.duration = 0.0
+        self.stages: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class _HandlerStats:
+    __slots__ = ("count", "total", "max", "stages")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.stages: dict[str, float] = {}
+
+    def add(self, trace: Trace) -> None:
+        self.count += 1
+        self.total += trace.duration
+        self.max = max(self.max, trace.duration)
+        for stage, seconds in trace.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def merge(self, other: _HandlerStats) -> None:
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for stage, seconds in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+_current: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_sample_rate = 0.1
+_recent: deque[Trace] = deque(maxlen=500)
+_buckets: deque[tuple[int, dict[str, _HandlerStats]]] = deque(maxlen=BUCKETS_KEPT)
+
+
+def configure(*, sample_rate: float, keep: int = 500) -> None:
+    global _sample_rate, _recent
+    _sample_rate = sample_rate
+    _recent = deque(_recent, maxlen=keep)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - started)
+
+
+def traced(stage: str) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if _current.get() is None:
+                    return await func(*args, **kwargs)
+                with span(stage):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def _finish(trace: Trace) -> None:
+    _recent.append(trace)
+    bucket_id = int(trace.started // BUCKET_SECONDS)
+    if not _buckets or _buckets[-1][0] != bucket_id:
+        _buckets.append((bucket_id, {}))
+    stats = _buckets[-1][1].get(trace.handler)
+    if stats is None:
+        stats = _buckets[-1][1][trace.handler] = _HandlerStats()
+    stats.add(trace)
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update) or random.random() >= _sample_rate:
+            return await handler(event, data)
+        trace = Trace(event.update_id)
+        token = _current.set(trace)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            trace.duration = time.perf_counter() - started
+            _current.reset(token)
+            _finish(trace)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        trace = _current.get()
+        if trace is not None:
+            callback = getattr(data.get("handler"), "callback", None)
+            trace.handler = getattr(callback, "__name__", "unknown")
+        return await handler(event, data)
+
+
+class TelegramSpanMiddleware(BaseRequestMiddleware):
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Any,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if _current.get() is None:
+            return await make_request(bot, method)
+        with span(f"tg.{method.__api_method__}"):
+            return await make_request(bot, method)
+
+
+def install(dp: Any) -> None:
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    naming = HandlerNameMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in {"update", "error"}:
+            observer.middleware(naming)
+
+
+def window_stats(seconds: int) -> dict[str, _HandlerStats]:
+    since = int(time.time() // BUCKET_SECONDS) - max(1, seconds // BUCKET_SECONDS) + 1
+    merged: dict[str, _HandlerStats] = {}
+    for bucket_id, handlers in list(_buckets):
+        if bucket_id < since:
+            continue
+        for name, stats in handlers.items():
+            merged.setdefault(name, _HandlerStats()).merge(stats)
+    return merged
+
+
+def slowest(limit: int = 5) -> list[Trace]:
+    return sorted(_recent, key=lambda t: t.duration, reverse=True)[:limit]
+
+
+def _fmt_stages(stages: dict[str, float], count: int = 1, limit: int = 4) -> str:
+    top = sorted(stages.items(), key=lambda x: -x[1])[:limit]
+    return ", ".join(f"{name} {seconds / count * 1000:.1f}" for name, seconds in top)
+
+
+def report() -> str:
+    lines = [f"Трассировка: выборка {_sample_rate:.0%}, в буфере {len(_recent)}"]
+    for title, seconds in (("5 мин", 300), ("60 мин", 3600)):
+        stats = window_stats(seconds)
+        lines.append("")
+        lines.append(f"За {title} (среднее / макс, мс):")
+        if not stats:
+            lines.append("нет данных")
+        for name, st in sorted(stats.items(), key=lambda x: -x[1].total / x[1].count)[:8]:
+            lines.append(f"• {name}: {st.count} шт, {st.total / st.count * 1000:.1f} / {st.max * 1000:.1f}")
+            if st.stages:
+                lines.append(f"   {_fmt_stages(st.stages, st.count)}")
+    traces = slowest()
+    if traces:
+        lines.append("")
+        lines.append("Самые медленные обновления (мс):")
+        for trace in traces:
+            lines.append(f"• #{trace.update_id} {trace.handler}: {trace.duration * 1000:.1f}")
+            if trace.stages:
+                lines.append(f"   {_fmt_stages(trace.stages)}")
+    return "\n".join(lines)
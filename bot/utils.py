@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import math
+import sys
 from typing import Iterable
 
 
@@ -8,12 +10,30 @@ def rub(amount: float | int) -> str:
     return f"{value:,}".replace(",", " ") + " ₽"
 
 
+def fmt_qty(amount: float) -> str:
+    text = f"{float(amount):,.2f}".rstrip("0").rstrip(".")
+    return text.replace(",", " ").replace(".", ",")
+
+
 def safe_float(text: str) -> float | None:
     try:
-        return float(text.replace(" ", "").replace(",", "."))
+        value = float(text.replace(" ", "").replace(",", "."))
     except ValueError:
         return None
+    # "nan" and "inf" parse as floats but pass no range check meaningfully.
+    return value if math.isfinite(value) else None
 
 
 def fmt_lines(lines: Iterable[str]) -> str:
     return "\n".join([x for x in lines if x])
+
+
+def approx_size(obj: object) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_size(k) + approx_size(v)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for x in obj:
+            size += approx_size(x)
+    return size
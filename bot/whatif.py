@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+from array import array
+from bisect import bisect_right
+from typing import Any, NamedTuple
+
+from bot.calc import SECTION_ORDER, find_item, split_selection
+from bot.db import fetch_estimate_selections
+from bot.pricing import PriceBook, Table
+from bot.tenants import current_name
+from bot.utils import rub
+
+Selection = tuple[tuple[str, ...], tuple[str, ...]]
+# Price of one selection as a function of area: area * (fixed + sum(coef * tier price at area)).
+Rate = tuple[float, tuple[tuple[float, Table], ...]]
+
+
+class History:
+    # Stored estimates collapsed into distinct (selection, area) groups with counts, kept as columns
+    # sorted by selection: groups of selection s are rows starts[s]..starts[s + 1] of areas/counts.
+    def __init__(self) -> None:
+        self.last_id = 0
+        self.rows = 0
+        self.selections: list[Selection] = []
+        self._selection_ids: dict[Selection, int] = {}
+        self._groups: dict[tuple[int, float], int] = {}
+        self.starts = array("i", [0])
+        self.areas = array("d")
+        self.counts = array("i")
+
+    def add(self, rows: list[tuple[Any, ...]]) -> None:
+        for est_id, area, items_json in rows:
+            self.last_id = max(self.last_id, int(est_id))
+            try:
+                selection = split_selection(json.loads(items_json))
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                continue
+            if not all(selection[0]):
+                continue
+            sid = self._selection_ids.get(selection)
+            if sid is None:
+                sid = self._selection_ids[selection] = len(self.selections)
+                self.selections.append(selection)
+            key = (sid, round(float(area), 2))
+            self._groups[key] = self._groups.get(key, 0) + 1
+            self.rows += 1
+
+    def freeze(self) -> None:
+        starts = array("i", [0] * (len(self.selections) + 1))
+        areas = array("d")
+        counts = array("i")
+        for (sid, area), count in sorted(self._groups.items()):
+            starts[sid + 1] += 1
+            areas.append(area)
+            counts.append(count)
+        for sid in range(len(self.selections)):
+            starts[sid + 1] += starts[sid]
+        self.starts, self.areas, self.counts = starts, areas, counts
+
+
+_histories: dict[str, History] = {}
+_locks: dict[str, asyncio.Lock] = {}
+
+
+async def load_history(db_path: str, *, page_size: int = 5000) -> History:
+    # Parsed once per process, then only estimates saved since the last preview are read.
+    name = current_name()
+    lock = _locks.setdefault(name, asyncio.Lock())
+    async with lock:
+        history = _histories.setdefault(name, History())
+        added = False
+        while True:
+            rows = await fetch_estimate_selections(db_path, after_id=history.last_id, limit=page_size)
+            if not rows:
+                break
+            history.add(rows)
+            added = True
+        if added:
+            history.freeze()
+        return history
+
+
+def _rate(selection: Selection, config: dict[str, Any], book: PriceBook) -> Rate | None:
+    picks, extras = selection
+    roof_coef = float(config.get("roof_coef", 1.0))
+    terms: list[tuple[float, str, str]] = []
+    for section, item_id in zip(SECTION_ORDER, picks):
+        # Same rule as the price notifications: a disabled pick makes the estimate incomparable.
+        if find_item(config.get(section, []), item_id) is None:
+            return None
+        terms.append((roof_coef if section == "roof" else 1.0, section, item_id))
+    for extra_id in extras:
+        if find_item(config.get("extras", []), extra_id) is not None:
+            terms.append((1.0, "extras", extra_id))
+    fixed = 0.0
+    tiered: list[tuple[float, Table]] = []
+    for coef, section, item_id in terms:
+        table = book.table(section, item_id)
+        if table is None:
+            continue
+        if table[0]:
+            tiered.append((coef, table))
+        else:
+            fixed += coef * table[2]
+    return fixed, tuple(tiered)
+
+
+def _per_m2(rate: Rate, area: float) -> float:
+    fixed, tiered = rate
+    for coef, (bounds, prices, base) in tiered:
+        idx = bisect_right(bounds, area) - 1
+        fixed += coef * (prices[idx] if idx >= 0 else base)
+    return fixed
+
+
+class Preview(NamedTuple):
+    estimates: int
+    comparable: int
+    changed: int
+    unavailable: int
+    # (percentile, delta in rubles) for the changed estimates
+    quantiles: tuple[tuple[int, float], ...]
+    buckets: tuple[tuple[str, int], ...]
+    avg_before: float
+    avg_after: float
+
+
+_BUCKETS = (
+    (-math.inf, -10.0, "ниже −10%"),
+    (-10.0, -1.0, "−10…−1%"),
+    (-1.0, 1.0, "±1%"),
+    (1.0, 10.0, "+1…+10%"),
+    (10.0, math.inf, "выше +10%"),
+)
+_QUANTILES = (0, 10, 50, 90, 100)
+
+
+def preview(
+    history: History,
+    old_config: dict[str, Any],
+    old_book: PriceBook,
+    new_config: dict[str, Any],
+    new_book: PriceBook,
+) -> Preview:
+    starts, areas, counts = history.starts, history.areas, history.counts
+    comparable = unavailable = 0
+    sum_before = sum_after = 0.0
+    deltas: list[tuple[float, float, int]] = []  # (delta, delta %, count)
+    for sid, selection in enumerate(history.selections):
+        lo, hi = starts[sid], starts[sid + 1]
+        before = _rate(selection, old_config, old_book)
+        if before is None:
+            continue
+        after = _rate(selection, new_config, new_book)
+        if after is None:
+            unavailable += sum(counts[lo:hi])
+            continue
+        if before == after and not before[1]:
+            # Most edits leave most selections alone: an untiered, unchanged rate needs no per-row work.
+            n = sum(counts[lo:hi])
+            comparable += n
+            sum_before += before[0] * n
+            sum_after += before[0] * n
+            continue
+        for i in range(lo, hi):
+            area, n = areas[i], counts[i]
+            rate_before = _per_m2(before, area)
+            rate_after = _per_m2(after, area)
+            comparable += n
+            sum_before += rate_before * n
+            sum_after += rate_after * n
+            delta = area * (rate_after - rate_before)
+            if abs(delta) >= 0.5:
+                deltas.append((delta, 100.0 * (rate_after / rate_before - 1) if rate_before else 0.0, n))
+
+    changed = sum(n for _, _, n in deltas)
+    deltas.sort()
+    quantiles: list[tuple[int, float]] = []
+    if changed:
+        seen = 0
+        targets = iter(_QUANTILES)
+        target = next(targets)
+        for delta, _, n in deltas:
+            seen += n
+            while target is not None and seen >= max(1, math.ceil(changed * target / 100)):
+                quantiles.append((target, delta))
+                target = next(targets, None)
+    buckets = tuple((label, sum(n for _, pct, n in deltas if lo <= pct < hi)) for lo, hi, label in _BUCKETS)
+    return Preview(
+        estimates=history.rows,
+        comparable=comparable,
+        changed=changed,
+        unavailable=unavailable,
+        quantiles=tuple(quantiles),
+        buckets=tuple(b for b in buckets if b[1]),
+        avg_before=sum_before / comparable if comparable else 0.0,
+        avg_after=sum_after / comparable if comparable else 0.0,
+    )
+
+
+def _signed_rub(value: float) -> str:
+    return ("+" if value > 0 else "−" if value < 0 else "") + rub(abs(value))
+
+
+def format_preview(p: Preview) -> str:
+    if p.estimates == 0:
+        return "Сохранённых смет пока нет, сравнивать не с чем"
+    share = 100.0 * p.changed / p.comparable if p.comparable else 0.0
+    lines = [
+        f"Сохранённых смет: {p.estimates}",
+        f"Изменится итог у {p.changed} ({share:.1f}%)",
+    ]
+    if p.unavailable:
+        lines.append(f"Станут недоступны (выключены выбранные пункты): {p.unavailable}")
+    if p.quantiles:
+        names = {0: "мин", 10: "p10", 50: "медиана", 90: "p90", 100: "макс"}
+        lines.append("Изменение итога: " + ", ".join(f"{names[q]} {_signed_rub(d)}" for q, d in p.quantiles))
+        lines.append("По доле: " + ", ".join(f"{label}: {n}" for label, n in p.buckets))
+    if p.comparable:
+        change = 100.0 * (p.avg_after / p.avg_before - 1) if p.avg_before else 0.0
+        lines.append(f"Средняя цена за м²: {rub(p.avg_before)} → {rub(p.avg_after)} ({change:+.1f}%)")
+    return "\n".join(lines)
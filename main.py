@@ -1,65 +1,282 @@
 import asyncio
+import hmac
 import logging
 import os
 from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.types import Update
-from aiogram.fsm.storage.memory import MemoryStorage
+from pydantic import ValidationError
 
+from bot import logs, memdebug, metrics, tracing
+from bot.admission import ADMIN, CHEAP, DOCUMENT, TEXT, AdmissionControl, busy_response, classify
+from bot.api import EstimateApi
 from bot.settings import Settings
 from bot.db import init_db
+from bot.leads import LeadQueue, digest_loop
+from bot.notify import resume_price_notify
 from bot.handlers.client import router as client_router
 from bot.handlers.admin import router as admin_router
+from bot.handlers.inline import router as inline_router
+from bot.middlewares import ThrottlingMiddleware
+from bot.polling import Poller
+from bot.recorder import UpdateRecorder
+from bot.storage import BoundedMemoryStorage, TenantStorage
+from bot.tenants import Tenant, TenantMiddleware, load_tenants, use_tenant
 
+logger = logging.getLogger(__name__)
 
-async def main() -> None:
-    logging.basicConfig(level=logging.INFO)
-    settings = Settings()
 
-    await init_db(settings.db_path)
+def build_dispatcher(settings: Settings, tenants: list[Tenant] | None = None) -> Dispatcher:
+    tenants = tenants or load_tenants(settings)
+
+    def make_storage() -> BoundedMemoryStorage:
+        return BoundedMemoryStorage(ttl=settings.fsm_session_ttl, max_bytes=settings.fsm_max_bytes)
+
+    storage: BoundedMemoryStorage | TenantStorage
+    if len(tenants) == 1:
+        storage = make_storage()
+    else:
+        storage = TenantStorage({t.bot_id: (t.label, make_storage()) for t in tenants})
+    metrics.register_collector(storage.collect_metrics)
+    memdebug.register_source("fsm", lambda: dict(zip(("sessions", "bytes"), storage.stats())))
+    dp = Dispatcher(storage=storage)
+    tracing.configure(sample_rate=settings.trace_sample_rate)
+    tracing.install(dp)
+
+    tenant_middleware = TenantMiddleware(tenants, max_inflight=settings.tenant_max_inflight)
+    metrics.register_collector(tenant_middleware.collect_metrics)
+    dp.update.outer_middleware(tenant_middleware)
+    # Inside the tenant middleware, so update log records carry the tenant name.
+    logs.install(dp)
+
+    throttling = ThrottlingMiddleware(
+        user_rate=settings.throttle_user_rate,
+        user_burst=settings.throttle_user_burst,
+        chat_rate=settings.throttle_chat_rate,
+        chat_burst=settings.throttle_chat_burst,
+        debounce=settings.throttle_debounce,
+    )
+    metrics.register_collector(throttling.collect_metrics)
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
 
-    bot = Bot(token=settings.bot_token)
-    dp = Dispatcher(storage=MemoryStorage())
+    dp["lead_queue"] = LeadQueue(settings.db_path)
 
     dp.include_router(client_router)
     dp.include_router(admin_router)
+    dp.include_router(inline_router)
+    return dp
 
-    # Webhook setup
-    railway_url = os.getenv('RAILWAY_STATIC_URL')  # e.g., your-app.railway.app
-    if not railway_url:
-        logging.error("RAILWAY_STATIC_URL not set")
-        return
-    
-    webhook_url = f"https://{railway_url}/webhook"
-    await bot.set_webhook(url=webhook_url, drop_pending_updates=True)
 
-    async def handle_webhook(request):
+def start_background(bots: dict[Tenant, Bot], dp: Dispatcher, settings: Settings) -> list[asyncio.Task]:
+    tasks = [asyncio.create_task(dp["lead_queue"].run())]
+    for tenant, bot in bots.items():
+        # Tasks copy the current context, so each loop keeps working in its tenant's namespace.
+        with use_tenant(tenant):
+            tasks.append(
+                asyncio.create_task(
+                    digest_loop(bot, settings.db_path, tenant.admin_ids, interval=settings.lead_digest_interval)
+                )
+            )
+            tasks.append(asyncio.create_task(resume_price_notify(bot, settings)))
+    return tasks
+
+
+async def stop_background(dp: Dispatcher, tasks: list[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await dp["lead_queue"].flush()
+
+
+def build_admission(settings: Settings) -> AdmissionControl:
+    return AdmissionControl(
+        {
+            CHEAP: (settings.admit_cheap_concurrency, settings.admit_cheap_queue),
+            TEXT: (settings.admit_text_concurrency, settings.admit_text_queue),
+            DOCUMENT: (settings.admit_document_concurrency, settings.admit_document_queue),
+            ADMIN: (settings.admit_admin_concurrency, settings.admit_admin_queue),
+        },
+        max_wait=settings.admit_max_wait,
+    )
+
+
+def make_debug_memory(token: str):
+    async def debug_memory(request: web.Request) -> web.Response:
+        # Header only: a token in the query string ends up in proxy and access logs.
+        scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+        given = given.strip()
+        if scheme != "Bearer" or not given or not hmac.compare_digest(given.encode(), token.encode()):
+            return web.Response(status=403, text="Forbidden")
+        trace = request.query.get("trace")
+        if trace == "on":
+            memdebug.start()
+        elif trace == "off":
+            memdebug.stop()
         try:
-            data = await request.json()
-            update = Update(**data)
-            await dp.feed_update(bot, update)
-        except Exception as e:
-            logging.error(f"Webhook error: {e}")
-        return web.Response(text="OK")
+            limit = max(1, min(int(request.query.get("limit", 10)), 100))
+        except ValueError:
+            limit = 10
+        return web.json_response(await memdebug.report(limit))
 
-    app = web.Application()
-    app.router.add_post('/webhook', handle_webhook)
+    return debug_memory
+
+
+async def start_server(app: web.Application, settings: Settings, tenants: list[Tenant]) -> web.AppRunner:
     app.router.add_get('/health', lambda r: web.Response(text="OK"))
+    app.router.add_get('/metrics', lambda r: web.Response(text=metrics.render()))
+    if settings.debug_token:
+        # Not registered at all without a token, so the route cannot be probed on a default deploy.
+        app.router.add_get('/debug/memory', make_debug_memory(settings.debug_token))
+    api = EstimateApi(
+        tenants,
+        db_path=settings.db_path,
+        batch_max=settings.api_batch_max,
+        cache_size=settings.api_cache_size,
+        version_ttl=settings.api_version_ttl,
+    )
+    if api.enabled:
+        api.routes(app)
+        metrics.register_collector(api.collect_metrics)
 
-    # Start server
     runner = web.AppRunner(app)
     await runner.setup()
     port = int(os.getenv('PORT', 8080))
     site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
-    logging.info(f"Webhook server started on port {port}, URL: {webhook_url}")
+    logger.info("HTTP server started on port %d", port)
+    return runner
+
+
+async def run_webhook(bots: dict[Tenant, Bot], dp: Dispatcher, settings: Settings) -> None:
+    railway_url = os.getenv('RAILWAY_STATIC_URL')  # e.g., your-app.railway.app
+    if not railway_url:
+        logger.error("RAILWAY_STATIC_URL not set (use TRANSPORT=polling to run without a public URL)")
+        return
+
+    recorder = None
+    if settings.record_updates_path:
+        recorder = UpdateRecorder(
+            settings.record_updates_path,
+            max_bytes=settings.record_max_bytes,
+            keep=settings.record_keep,
+        )
+
+    admission = build_admission(settings)
+    metrics.register_collector(admission.collect_metrics)
+
+    def make_handler(bot: Bot):
+        async def handle_webhook(request):
+            try:
+                data = await request.json()
+            except ValueError as e:
+                logger.warning("Webhook body is not JSON: %s", e)
+                return web.Response(text="OK")
+            if recorder is not None:
+                recorder.record(data)
+
+            update_class = classify(data)
+            if not await admission.acquire(update_class):
+                busy = busy_response(data)
+                return web.json_response(busy) if busy is not None else web.Response(text="OK")
+            try:
+                update = Update.model_validate(data, context={"bot": bot})
+            except ValidationError:
+                logger.exception("Webhook update %s is not a valid Update", data.get("update_id"))
+                admission.release(update_class)
+                return web.Response(text="OK")
+            try:
+                await dp.feed_update(bot, update)
+            except Exception:
+                pass  # already logged with its traceback by logs.UpdateLogMiddleware
+            finally:
+                admission.release(update_class)
+            return web.Response(text="OK")
+
+        return handle_webhook
+
+    app = web.Application()
+    for tenant, bot in bots.items():
+        path = f"/webhook/{tenant.name}" if tenant.name else "/webhook"
+        webhook_url = f"https://{railway_url}{path}"
+        await bot.set_webhook(
+            url=webhook_url,
+            drop_pending_updates=True,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        app.router.add_post(path, make_handler(bot))
+        logger.info("Webhook URL for %s: %s", tenant.label, webhook_url)
+    runner = await start_server(app, settings, list(bots))
 
     # Keep alive
     try:
         await asyncio.Event().wait()
-    except KeyboardInterrupt:
+    finally:
+        await runner.cleanup()
+        for bot in bots.values():
+            await bot.delete_webhook()
+        if recorder is not None:
+            await asyncio.to_thread(recorder.close)
+
+
+async def run_polling(bot: Bot, dp: Dispatcher, settings: Settings) -> None:
+    poller = Poller(
+        bot,
+        dp,
+        db_path=settings.db_path,
+        limit=settings.polling_limit,
+        timeout=settings.polling_timeout,
+        concurrency=settings.polling_concurrency,
+    )
+    runner = await start_server(web.Application(), settings, load_tenants(settings))
+    logger.info("Long polling started")
+    try:
+        await poller.run()
+    finally:
         await runner.cleanup()
-        await bot.delete_webhook()
+        await bot.session.close()
+
+
+async def main() -> None:
+    settings = Settings()
+    # Records are queued by the caller and encoded and written by a listener thread, off the event loop.
+    listener = logs.setup(
+        level=settings.log_level,
+        sample_rate=settings.log_sample_rate,
+        queue_size=settings.log_queue_size,
+    )
+    metrics.register_collector(logs.collect_metrics)
+    try:
+        await run(settings)
+    finally:
+        listener.stop()
+
+
+async def run(settings: Settings) -> None:
+    tenants = load_tenants(settings)
+    if settings.transport == "polling" and len(tenants) > 1:
+        # The polling inbox and offset are single-bot; several tokens need webhooks.
+        logger.error("Polling supports a single tenant, use TRANSPORT=webhook with TENANTS_FILE")
+        return
+
+    await init_db(settings.db_path, [t.name for t in tenants])
+
+    # One Bot per token; they share the event loop, dispatcher, database and worker threads.
+    bots: dict[Tenant, Bot] = {}
+    for tenant in tenants:
+        bot = Bot(token=tenant.bot_token)
+        bot.session.middleware(tracing.TelegramSpanMiddleware())
+        bots[tenant] = bot
+    dp = build_dispatcher(settings, tenants)
+
+    tasks = start_background(bots, dp, settings)
+    try:
+        if settings.transport == "polling":
+            await run_polling(bots[tenants[0]], dp, settings)
+        else:
+            await run_webhook(bots, dp, settings)
+    finally:
+        await stop_background(dp, tasks)
 
 
 if __name__ == "__main__":